@@ -0,0 +1,145 @@
+"""add content_hash to time_sets
+
+Revision ID: 0b6f93d4e1a8
+Revises: 5c8d41e2a7b3
+Create Date: 2026-10-16 13:21:44.860193
+
+"""
+
+import hashlib
+from itertools import groupby
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0b6f93d4e1a8"
+down_revision = "5c8d41e2a7b3"
+branch_labels = None
+depends_on = None
+
+
+def timeset_content_hash(
+    calendar,
+    start_date,
+    end_date,
+    multi_year_mean,
+    time_resolution,
+    num_times,
+    timesteps,
+    climatology_bounds,
+):
+    """Return the content hash of a time set. Must be computed identically to
+    ``mm_cataloguer.index_netcdf.timeset_content_hash``.
+    """
+    lines = [
+        calendar,
+        start_date.isoformat(),
+        end_date.isoformat(),
+        str(bool(multi_year_mean)),
+        time_resolution,
+        str(int(num_times)),
+    ]
+    lines += ["t {}".format(timestep.isoformat()) for timestep in timesteps]
+    lines += [
+        "c {} {}".format(time_start.isoformat(), time_end.isoformat())
+        for time_start, time_end in climatology_bounds
+    ]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def backfill_time_set_content_hashes():
+    """
+    Set the content hash of each existing time set.
+
+    Time sets with identical contents would violate the unique index. Only
+    the first of them (lowest id) is given a content hash; the others are left
+    NULL, and are no longer found by the indexer.
+    """
+    connection = op.get_bind()
+    time_sets = sa.Table("time_sets", sa.MetaData(), autoload_with=connection)
+    times = sa.Table("times", sa.MetaData(), autoload_with=connection)
+    climatological_times = sa.Table(
+        "climatological_times", sa.MetaData(), autoload_with=connection
+    )
+
+    attributes = {
+        row[0]: tuple(row[1:])
+        for row in connection.execute(
+            sa.select(
+                time_sets.c.time_set_id,
+                time_sets.c.calendar,
+                time_sets.c.start_date,
+                time_sets.c.end_date,
+                time_sets.c.multi_year_mean,
+                time_sets.c.time_resolution,
+                time_sets.c.num_times,
+            )
+        )
+    }
+    climatology_bounds = {
+        time_set_id: [(row[1], row[2]) for row in group]
+        for time_set_id, group in groupby(
+            connection.execute(
+                sa.select(
+                    climatological_times.c.time_set_id,
+                    climatological_times.c.time_start,
+                    climatological_times.c.time_end,
+                ).order_by(
+                    climatological_times.c.time_set_id, climatological_times.c.time_idx
+                )
+            ),
+            key=lambda row: row[0],
+        )
+    }
+
+    def hash_time_set(time_set_id, timesteps):
+        return timeset_content_hash(
+            *attributes[time_set_id],
+            timesteps,
+            climatology_bounds.get(time_set_id, []),
+        )
+
+    # Table times can be very large, so its rows are streamed, and each time
+    # set is hashed as its timesteps are read.
+    content_hashes = {
+        time_set_id: hash_time_set(time_set_id, []) for time_set_id in attributes
+    }
+    rows = connection.execution_options(stream_results=True).execute(
+        sa.select(times.c.time_set_id, times.c.timestep).order_by(
+            times.c.time_set_id, times.c.time_idx
+        )
+    )
+    for time_set_id, group in groupby(rows, key=lambda row: row[0]):
+        content_hashes[time_set_id] = hash_time_set(
+            time_set_id, (row[1] for row in group)
+        )
+
+    assigned = set()
+    for time_set_id in sorted(content_hashes):
+        content_hash = content_hashes[time_set_id]
+        if content_hash in assigned:
+            continue
+        assigned.add(content_hash)
+        connection.execute(
+            time_sets.update()
+            .where(time_sets.c.time_set_id == time_set_id)
+            .values(content_hash=content_hash)
+        )
+
+
+def upgrade():
+    op.add_column(
+        "time_sets", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    backfill_time_set_content_hashes()
+    op.create_index(
+        "time_sets_content_hash_key", "time_sets", ["content_hash"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index("time_sets_content_hash_key", table_name="time_sets")
+    with op.batch_alter_table("time_sets") as batch_op:
+        batch_op.drop_column("content_hash")
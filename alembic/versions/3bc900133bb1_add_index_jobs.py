@@ -0,0 +1,61 @@
+"""add index_jobs
+
+Revision ID: 3bc900133bb1
+Revises: b7e1c5a93d20
+Create Date: 2026-10-16 16:20:31.804215
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3bc900133bb1"
+down_revision = "b7e1c5a93d20"
+branch_labels = None
+depends_on = None
+
+
+index_job_status = sa.Enum(
+    "pending", "claimed", "done", "failed", name="index_job_status"
+)
+
+
+def upgrade():
+    # Queue of files to index, shared by indexers on several nodes; see
+    # mm_cataloguer.work_queue.
+    op.create_table(
+        "index_jobs",
+        sa.Column("index_job_id", sa.Integer(), nullable=False),
+        sa.Column("filename", sa.String(length=2048), nullable=False),
+        sa.Column("status", index_job_status, nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("enqueued_at", sa.DateTime(), nullable=False),
+        sa.Column("available_at", sa.DateTime(), nullable=False),
+        sa.Column("claimed_by", sa.String(length=255), nullable=True),
+        sa.Column("claimed_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("error", sa.String(length=2048), nullable=True),
+        sa.Column("data_file_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["data_file_id"],
+            ["data_files.data_file_id"],
+            name="index_jobs_data_file_id_fkey",
+            ondelete="SET NULL",
+        ),
+        sa.PrimaryKeyConstraint("index_job_id"),
+        sa.UniqueConstraint("filename", name="index_jobs_filename_key"),
+    )
+    op.create_index(
+        "index_jobs_status_available_at_key",
+        "index_jobs",
+        ["status", "available_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("index_jobs_status_available_at_key", table_name="index_jobs")
+    op.drop_table("index_jobs")
+    index_job_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,31 @@
+"""add range_source to data_file_variables
+
+Revision ID: 3d7bc55e9f75
+Revises: f50bc7751a32
+Create Date: 2026-10-16 11:02:17.380415
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3d7bc55e9f75"
+down_revision = "f50bc7751a32"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Where the indexer found range_min and range_max. Unknown (NULL) for
+    # existing rows.
+    op.add_column(
+        "data_file_variables",
+        sa.Column("range_source", sa.String(length=32), nullable=True),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("data_file_variables") as batch_op:
+        batch_op.drop_column("range_source")
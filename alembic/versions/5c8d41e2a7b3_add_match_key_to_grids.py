@@ -0,0 +1,89 @@
+"""add match_key to grids
+
+Revision ID: 5c8d41e2a7b3
+Revises: 7a3e2c1f9b04
+Create Date: 2026-10-16 12:48:09.517342
+
+"""
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5c8d41e2a7b3"
+down_revision = "7a3e2c1f9b04"
+branch_labels = None
+depends_on = None
+
+
+# Must equal ``mm_cataloguer.index_netcdf.grid_key_digits``.
+grid_key_digits = 5
+
+
+def grid_match_key(
+    srid,
+    xc_count,
+    yc_count,
+    xc_origin,
+    yc_origin,
+    xc_grid_step,
+    yc_grid_step,
+    evenly_spaced_y,
+):
+    """Return the match key of a grid. Must be computed identically to
+    ``mm_cataloguer.index_netcdf.grid_match_key``.
+    """
+
+    def quantize(value):
+        return "{:.{}e}".format(float(str(value)) + 0.0, grid_key_digits - 1)
+
+    return hashlib.sha256(
+        "/".join(
+            [str(srid), str(int(xc_count)), str(int(yc_count))]
+            + [
+                quantize(value)
+                for value in (xc_origin, yc_origin, xc_grid_step, yc_grid_step)
+            ]
+            + [str(bool(evenly_spaced_y))]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def backfill_grid_match_keys():
+    """Set the match key of each existing grid."""
+    connection = op.get_bind()
+    grids = sa.Table("grids", sa.MetaData(), autoload_with=connection)
+    rows = connection.execute(
+        sa.select(
+            grids.c.grid_id,
+            grids.c.srid,
+            grids.c.xc_count,
+            grids.c.yc_count,
+            grids.c.xc_origin,
+            grids.c.yc_origin,
+            grids.c.xc_grid_step,
+            grids.c.yc_grid_step,
+            grids.c.evenly_spaced_y,
+        )
+    ).fetchall()
+    for grid_id, *attributes in rows:
+        connection.execute(
+            grids.update()
+            .where(grids.c.grid_id == grid_id)
+            .values(match_key=grid_match_key(*attributes))
+        )
+
+
+def upgrade():
+    op.add_column("grids", sa.Column("match_key", sa.String(length=64), nullable=True))
+    backfill_grid_match_keys()
+    op.create_index("grids_match_key_key", "grids", ["match_key"], unique=False)
+
+
+def downgrade():
+    op.drop_index("grids_match_key_key", table_name="grids")
+    with op.batch_alter_table("grids") as batch_op:
+        batch_op.drop_column("match_key")
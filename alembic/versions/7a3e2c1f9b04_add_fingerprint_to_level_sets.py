@@ -0,0 +1,89 @@
+"""add fingerprint to level_sets
+
+Revision ID: 7a3e2c1f9b04
+Revises: d9f9e5079071
+Create Date: 2026-10-16 12:05:31.204617
+
+"""
+
+import hashlib
+from itertools import groupby
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7a3e2c1f9b04"
+down_revision = "d9f9e5079071"
+branch_labels = None
+depends_on = None
+
+
+def level_set_fingerprint(level_units, vertical_levels):
+    """Return the fingerprint of a level set. Must be computed identically to
+    ``mm_cataloguer.index_netcdf.level_set_fingerprint``.
+    """
+    return hashlib.sha256(
+        "\n".join(
+            [level_units] + [repr(float(str(level))) for level in vertical_levels]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def backfill_level_set_fingerprints():
+    """
+    Set the fingerprint of each existing level set.
+
+    Level sets with identical levels (which the indexer could previously
+    create) would violate the unique index. Only the first of them (lowest id)
+    is given a fingerprint; the others are left NULL, and are no longer found
+    by the indexer.
+    """
+    connection = op.get_bind()
+    level_sets = sa.Table("level_sets", sa.MetaData(), autoload_with=connection)
+    levels = sa.Table("levels", sa.MetaData(), autoload_with=connection)
+
+    level_units = dict(
+        connection.execute(
+            sa.select(level_sets.c.level_set_id, level_sets.c.level_units)
+        ).fetchall()
+    )
+    vertical_levels = {level_set_id: [] for level_set_id in level_units}
+    rows = connection.execute(
+        sa.select(levels.c.level_set_id, levels.c.vertical_level).order_by(
+            levels.c.level_set_id, levels.c.level_idx
+        )
+    )
+    for level_set_id, group in groupby(rows, key=lambda row: row[0]):
+        vertical_levels[level_set_id] = [row[1] for row in group]
+
+    fingerprints = set()
+    for level_set_id in sorted(level_units):
+        fingerprint = level_set_fingerprint(
+            level_units[level_set_id], vertical_levels[level_set_id]
+        )
+        if fingerprint in fingerprints:
+            continue
+        fingerprints.add(fingerprint)
+        connection.execute(
+            level_sets.update()
+            .where(level_sets.c.level_set_id == level_set_id)
+            .values(fingerprint=fingerprint)
+        )
+
+
+def upgrade():
+    op.add_column(
+        "level_sets", sa.Column("fingerprint", sa.String(length=64), nullable=True)
+    )
+    backfill_level_set_fingerprints()
+    op.create_index(
+        "level_sets_fingerprint_key", "level_sets", ["fingerprint"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index("level_sets_fingerprint_key", table_name="level_sets")
+    with op.batch_alter_table("level_sets") as batch_op:
+        batch_op.drop_column("fingerprint")
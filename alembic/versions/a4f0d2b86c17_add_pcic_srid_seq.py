@@ -0,0 +1,51 @@
+"""add pcic_srid_seq
+
+Revision ID: a4f0d2b86c17
+Revises: e25a7c9d3f61
+Create Date: 2026-10-16 14:30:05.472981
+
+"""
+
+from warnings import warn
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a4f0d2b86c17"
+down_revision = "e25a7c9d3f61"
+branch_labels = None
+depends_on = None
+
+
+def get_dialect():
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    return dialect
+
+
+# The indexer allocates srids for CRSs it adds to spatial_ref_sys (990000 and
+# up) from this sequence. It starts after any such srids already allocated.
+# Other databases (i.e., SQLite test databases) have no sequences; for them
+# the indexer allocates srids as before.
+
+
+def upgrade():
+    dialect = get_dialect()
+    if dialect != "postgresql":
+        warn("Sequence pcic_srid_seq not created for {}".format(dialect))
+        return
+    max_srid = (
+        op.get_bind()
+        .execute(sa.text("SELECT max(srid) FROM spatial_ref_sys WHERE srid >= 990000"))
+        .scalar()
+    )
+    start = 990000 if max_srid is None else max_srid + 1
+    op.execute(sa.schema.CreateSequence(sa.Sequence("pcic_srid_seq", start=start)))
+
+
+def downgrade():
+    if get_dialect() != "postgresql":
+        return
+    op.execute(sa.schema.DropSequence(sa.Sequence("pcic_srid_seq")))
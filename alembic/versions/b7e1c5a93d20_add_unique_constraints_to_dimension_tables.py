@@ -0,0 +1,77 @@
+"""add unique constraints to dimension tables
+
+Revision ID: b7e1c5a93d20
+Revises: a4f0d2b86c17
+Create Date: 2026-10-16 15:12:47.309825
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e1c5a93d20"
+down_revision = "a4f0d2b86c17"
+branch_labels = None
+depends_on = None
+
+
+# The indexer inserts models, emissions and variable aliases with
+# INSERT ... ON CONFLICT DO NOTHING, which requires a unique constraint on the
+# columns that identify them. (runs and stations already have one.) The
+# indexer does not create QC flags, which are maintained by hand and referred
+# to by name; their constraint only keeps a name from denoting two flags.
+constraints = [
+    ("models", "unique_model_short_name_constraint", ["model_short_name"]),
+    ("emissions", "unique_emission_short_name_constraint", ["emission_short_name"]),
+    (
+        "variable_aliases",
+        "unique_variable_alias_constraint",
+        ["variable_long_name", "variable_standard_name", "variable_units"],
+    ),
+    ("qc_flags", "unique_qc_flag_name_constraint", ["qc_flag_name"]),
+]
+
+
+def check_no_duplicates(table_name, columns):
+    """
+    Raise an error if a table has rows with the same values of the given
+    columns.
+
+    Such duplicates are referred to by other records (e.g., runs refer to
+    models), so there is no safe way to merge them automatically. They must be
+    merged by hand before this migration is run.
+    """
+    table = sa.Table(table_name, sa.MetaData(), autoload_with=op.get_bind())
+    key = [table.c[column] for column in columns]
+    duplicates = (
+        op.get_bind()
+        .execute(
+            sa.select(*key, sa.func.count()).group_by(*key).having(sa.func.count() > 1)
+        )
+        .fetchall()
+    )
+    if duplicates:
+        raise ValueError(
+            "Table {} has duplicate values of ({}), which must be merged "
+            "before this migration: {}".format(
+                table_name,
+                ", ".join(columns),
+                "; ".join(repr(tuple(row[:-1])) for row in duplicates),
+            )
+        )
+
+
+def upgrade():
+    for table_name, _, columns in constraints:
+        check_no_duplicates(table_name, columns)
+    for table_name, name, columns in constraints:
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.create_unique_constraint(name, columns)
+
+
+def downgrade():
+    for table_name, name, _ in constraints:
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_constraint(name, type_="unique")
@@ -0,0 +1,52 @@
+"""index spatial_ref_sys srtext hash
+
+Revision ID: d9f9e5079071
+Revises: 3d7bc55e9f75
+Create Date: 2026-10-16 11:40:52.911736
+
+"""
+
+from warnings import warn
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d9f9e5079071"
+down_revision = "3d7bc55e9f75"
+branch_labels = None
+depends_on = None
+
+
+def get_dialect():
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    return dialect
+
+
+# The indexer finds SpatialRefSys records by srtext, a WKT string of a few kB.
+# An index on md5(srtext) makes that a point query.
+#
+# Table spatial_ref_sys belongs to PostGIS, so rather than adding a hash
+# column to it, we index an expression. Only PostgreSQL supports this; other
+# databases (i.e., SQLite test databases) are left as they are.
+
+
+def upgrade():
+    dialect = get_dialect()
+    if dialect != "postgresql":
+        warn("Index on spatial_ref_sys.srtext not created for {}".format(dialect))
+        return
+    op.create_index(
+        "spatial_ref_sys_srtext_md5_key",
+        "spatial_ref_sys",
+        [sa.text("md5(srtext)")],
+        unique=False,
+    )
+
+
+def downgrade():
+    if get_dialect() != "postgresql":
+        return
+    op.drop_index("spatial_ref_sys_srtext_md5_key", table_name="spatial_ref_sys")
@@ -0,0 +1,88 @@
+"""add unique index on stations
+
+Revision ID: e25a7c9d3f61
+Revises: 0b6f93d4e1a8
+Create Date: 2026-10-16 13:58:26.113508
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e25a7c9d3f61"
+down_revision = "0b6f93d4e1a8"
+branch_labels = None
+depends_on = None
+
+
+def merge_duplicate_stations():
+    """
+    Merge stations with the same name, coordinates and units into the first
+    of them (lowest id), which the unique index requires.
+
+    Associations of a duplicate station to data file variables are moved to
+    the station it is merged into, unless that station is already associated
+    to the same data file variable.
+    """
+    connection = op.get_bind()
+    stations = sa.Table("stations", sa.MetaData(), autoload_with=connection)
+    x_stations = sa.Table(
+        "data_file_variables_dsg_time_series_x_stations",
+        sa.MetaData(),
+        autoload_with=connection,
+    )
+
+    first_ids = {}
+    duplicates = []
+    for station_id, *key in connection.execute(
+        sa.select(
+            stations.c.station_id,
+            stations.c.name,
+            stations.c.x,
+            stations.c.x_units,
+            stations.c.y,
+            stations.c.y_units,
+        ).order_by(stations.c.station_id)
+    ):
+        key = tuple(key)
+        if key in first_ids:
+            duplicates.append((station_id, first_ids[key]))
+        else:
+            first_ids[key] = station_id
+
+    dfv_id = x_stations.c.data_file_variable_dsg_ts_id
+    for duplicate_id, station_id in duplicates:
+        connection.execute(
+            x_stations.delete()
+            .where(x_stations.c.station_id == duplicate_id)
+            .where(
+                dfv_id.in_(
+                    sa.select(dfv_id).where(x_stations.c.station_id == station_id)
+                )
+            )
+        )
+        connection.execute(
+            x_stations.update()
+            .where(x_stations.c.station_id == duplicate_id)
+            .values(station_id=station_id)
+        )
+        connection.execute(
+            stations.delete().where(stations.c.station_id == duplicate_id)
+        )
+
+
+def upgrade():
+    merge_duplicate_stations()
+    op.create_index(
+        "stations_name_x_y_key",
+        "stations",
+        ["name", "x", "x_units", "y", "y_units"],
+        unique=True,
+    )
+
+
+def downgrade():
+    # Merged duplicate stations are not restored.
+    op.drop_index("stations_name_x_y_key", table_name="stations")
@@ -0,0 +1,36 @@
+"""add file status to data_files
+
+Revision ID: f50bc7751a32
+Revises: 12f290b63791
+Create Date: 2026-10-16 10:12:44.518203
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f50bc7751a32"
+down_revision = "12f290b63791"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # File status when indexed, for the indexer's fast skip of unchanged files.
+    # Existing rows are filled in as their files are next indexed.
+    op.add_column("data_files", sa.Column("file_size", sa.BigInteger(), nullable=True))
+    op.add_column(
+        "data_files", sa.Column("file_mtime_ns", sa.BigInteger(), nullable=True)
+    )
+    op.add_column("data_files", sa.Column("file_inode", sa.BigInteger(), nullable=True))
+    op.create_index("data_files_filename_key", "data_files", ["filename"], unique=False)
+
+
+def downgrade():
+    op.drop_index("data_files_filename_key", table_name="data_files")
+    with op.batch_alter_table("data_files") as batch_op:
+        batch_op.drop_column("file_inode")
+        batch_op.drop_column("file_mtime_ns")
+        batch_op.drop_column("file_size")
@@ -5,6 +5,11 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from modelmeta import DataFile, DataFileVariable, Ensemble, EnsembleDataFileVariables
+from mm_cataloguer.statements import (
+    install as install_statement_counter,
+    session_info_key as statements_info_key,
+    statement_scope,
+)
 
 
 formatter = logging.Formatter(
@@ -163,14 +168,15 @@ def associate_ensemble_to_filepaths(
     for filepath in filepaths:
         session = Session()
         try:
-            associated_items = associate_ensemble_to_filepath(
-                session,
-                ensemble_name,
-                ensemble_ver,
-                regex_filepaths,
-                filepath,
-                var_names,
-            )
+            with statement_scope(session, filepath, logger):
+                associated_items = associate_ensemble_to_filepath(
+                    session,
+                    ensemble_name,
+                    ensemble_ver,
+                    regex_filepaths,
+                    filepath,
+                    var_names,
+                )
             associated_ids.extend(
                 [
                     (data_file.id, [dfv.id for dfv in data_file_variables])
@@ -187,7 +193,15 @@ def associate_ensemble_to_filepaths(
     return associated_ids
 
 
-def main(dsn, ensemble_name, ensemble_ver, regex_filepaths, filepaths, var_names):
+def main(
+    dsn,
+    ensemble_name,
+    ensemble_ver,
+    regex_filepaths,
+    filepaths,
+    var_names,
+    statements=None,
+):
     """Associate a list of NetCDF files in modelmeta database to a specified
     ensemble.
 
@@ -197,12 +211,18 @@ def main(dsn, ensemble_name, ensemble_ver, regex_filepaths, filepaths, var_names
     :param regex_filepaths: (bool) if True, interpret filepaths as regexes
     :param filepaths: list of files to index
     :param var_names: list of names of variables to associate
+    :param statements: (``mm_cataloguer.statements.StatementCounter``)
+        counter to record the statements executed in, for each file and in
+        all; None for none
     :return: list of list of ids of ``DataFileVariable``s associated;
         one sublist for each file processed
     """
-    engine = create_engine(dsn)
-    Session = sessionmaker(bind=engine)
+    engine = install_statement_counter(create_engine(dsn), statements)
+    Session = sessionmaker(bind=engine, info={statements_info_key: statements})
 
-    return associate_ensemble_to_filepaths(
+    associated_ids = associate_ensemble_to_filepaths(
         Session, ensemble_name, ensemble_ver, regex_filepaths, filepaths, var_names
     )
+    if statements is not None:
+        statements.log_summary(logger)
+    return associated_ids
@@ -0,0 +1,83 @@
+"""Bulk insertion of child records.
+
+Some of the records that represent a NetCDF file are numerous: a long daily
+time series has tens of thousands of ``Time`` records. Creating an ORM object
+for each of them leaves indexing such a file dominated by the overhead of the
+ORM unit of work. Instead, these records are inserted directly into their
+tables from rows of column values.
+
+Values are passed to the database unconverted, so that NumPy values are
+stored exactly as they are when inserted through the ORM.
+"""
+
+import csv
+import io
+import time
+
+from mm_cataloguer.statements import record_statement
+
+
+# Minimum number of rows for which PostgreSQL ``COPY`` is used in preference
+# to a multi-row ``INSERT``.
+copy_threshold = 1000
+
+
+def bulk_insert(sesh, table, rows):
+    """Insert rows into a table without creating ORM objects for them.
+
+    On PostgreSQL, large sets of rows are loaded with ``COPY ... FROM STDIN``;
+    otherwise they are inserted with a single ``executemany``. Rows are
+    inserted in the session's current transaction, but the session does not
+    know about them: relationships that include them must be expired by the
+    caller.
+
+    :param sesh: database session
+    :param table: (``sqlalchemy.Table``) table to insert rows into
+    :param rows: list of dicts mapping column name to value; all rows must have
+        the same keys
+    :return: number of rows inserted
+    """
+    if not rows:
+        return 0
+    if sesh.get_bind().dialect.name == "postgresql" and len(rows) >= copy_threshold:
+        copy_rows(sesh, table, rows)
+    else:
+        sesh.execute(table.insert(), rows)
+    return len(rows)
+
+
+def copy_rows(sesh, table, rows):
+    """Load rows into a PostgreSQL table with ``COPY ... FROM STDIN``.
+
+    The ``COPY`` is executed on the DBAPI cursor, where SQLAlchemy's events do
+    not see it, so it is recorded in the connection's statement counters
+    explicitly.
+
+    :param sesh: database session bound to a PostgreSQL database
+    :param table: (``sqlalchemy.Table``) table to load rows into
+    :param rows: list of dicts mapping column name to value; all rows must have
+        the same keys
+    """
+    columns = list(rows[0].keys())
+    # In CSV format, an unquoted empty value is NULL, which is how the csv
+    # module writes None.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+
+    preparer = sesh.get_bind().dialect.identifier_preparer
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        preparer.format_table(table),
+        ", ".join(preparer.quote(column) for column in columns),
+    )
+    conn = sesh.connection()
+    cursor = conn.connection.cursor()
+    try:
+        start = time.perf_counter()
+        cursor.copy_expert(statement, buffer)
+        seconds = time.perf_counter() - start
+    finally:
+        cursor.close()
+    record_statement(conn, statement, seconds, len(rows))
@@ -0,0 +1,118 @@
+"""Discovery of files to index.
+
+Rather than requiring every file to be named on the command line, the indexer
+can be given directories, which are searched recursively for files whose
+names match include patterns and do not match exclude patterns.
+
+Paths are generated lazily, so indexing starts as soon as the first file is
+found and no complete list of files is ever built. Files in a directory are
+generated together, in inode order, before any subdirectory is searched;
+on our file systems this reads files in roughly the order they are laid out
+on disk. Each file is generated only once, however many paths lead to it.
+"""
+
+from fnmatch import fnmatch
+import logging
+import os
+
+from mm_cataloguer.index_netcdf import handler
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(handler)
+logger.setLevel(logging.DEBUG)
+
+
+# Default patterns for files to include in a search.
+default_include = ("*.nc",)
+
+
+def matches(path, patterns):
+    """Return True iff the name or the whole of a path matches any of a list
+    of glob patterns."""
+    name = os.path.basename(path)
+    return any(fnmatch(name, pattern) or fnmatch(path, pattern) for pattern in patterns)
+
+
+def crawl(paths, include=default_include, exclude=(), follow_symlinks=False):
+    """Generate the paths of files to index.
+
+    Each path that names a directory is searched recursively. Other paths are
+    generated as given, whether or not they match ``include`` (and whether or
+    not they exist; the indexer reports missing files).
+
+    :param paths: iterable of paths of files and directories
+    :param include: (iterable of str) glob patterns; a file found in a
+        directory is included only if its name or path matches one of them
+    :param exclude: (iterable of str) glob patterns; files and directories
+        whose name or path matches one of them are not included or searched
+    :param follow_symlinks: (bool) follow symbolic links found in directories;
+        if False, they are ignored. Directories named in ``paths`` are always
+        searched.
+    :return: generator of file paths
+    """
+    include, exclude = tuple(include), tuple(exclude)
+    # (device, inode) of files generated and directories searched
+    seen = set()
+
+    def is_new(identity):
+        if identity in seen:
+            return False
+        seen.add(identity)
+        return True
+
+    def search(directory):
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            try:
+                stat = os.stat(directory)
+                if not is_new((stat.st_dev, stat.st_ino)):
+                    # Already searched, by another path or a symlink loop
+                    continue
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError as e:
+                logger.warning("Cannot search directory {}: {}".format(directory, e))
+                continue
+
+            files, subdirectories = [], []
+            for entry in entries:
+                try:
+                    if matches(entry.path, exclude):
+                        continue
+                    if entry.is_symlink():
+                        if not follow_symlinks:
+                            continue
+                        target = entry.stat()
+                        identity = target.st_dev, target.st_ino
+                    else:
+                        # Files and directories (but not mount points, which
+                        # are checked when they are searched) are on the same
+                        # device as the directory containing them.
+                        identity = stat.st_dev, entry.inode()
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+                    elif entry.is_file() and matches(entry.path, include):
+                        files.append((identity, entry.path))
+                except OSError as e:
+                    logger.warning("Cannot examine {}: {}".format(entry.path, e))
+
+            for identity, path in sorted(files):
+                if is_new(identity):
+                    yield path
+            # Search subdirectories in name order.
+            for path in sorted(subdirectories, reverse=True):
+                stack.append(path)
+
+    for path in paths:
+        if os.path.isdir(path):
+            yield from search(path)
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            yield path
+            continue
+        if is_new((stat.st_dev, stat.st_ino)):
+            yield path
@@ -0,0 +1,48 @@
+"""Memoization of values derived from an open NetCDF dataset.
+
+Several values derived from a NetCDF file (e.g., its grid and level set
+information, which require reading coordinate variables) are needed more than
+once while the file is indexed. Functions of a dataset decorated with
+``memoize_per_dataset`` compute each such value once per dataset, and keep it
+only while the dataset is open.
+
+Memos are held in a weak dictionary keyed by dataset, so they never outlive
+their datasets. A dataset cannot hold a memo itself because setting an
+attribute on a ``netCDF4.Dataset`` writes a NetCDF attribute.
+"""
+
+import functools
+import weakref
+
+
+_memos = weakref.WeakKeyDictionary()
+
+
+def dataset_memo(dataset):
+    """Return the memo (a dict) for an open dataset. Memos for datasets that
+    have been closed are discarded.
+
+    :param dataset: (``netCDF4.Dataset``) open dataset
+    :return: dict
+    """
+    for closed in [d for d in _memos.keys() if not d.isopen()]:
+        del _memos[closed]
+    return _memos.setdefault(dataset, {})
+
+
+def memoize_per_dataset(function):
+    """Decorator memoizing a function whose first argument is a dataset, for
+    as long as the dataset is open. Its other arguments must be hashable.
+    """
+
+    @functools.wraps(function)
+    def memoized(dataset, *args):
+        memo = dataset_memo(dataset)
+        key = (function, args)
+        try:
+            return memo[key]
+        except KeyError:
+            value = memo[key] = function(dataset, *args)
+            return value
+
+    return memoized
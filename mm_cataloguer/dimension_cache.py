@@ -0,0 +1,163 @@
+"""In-process cache of modelmeta dimension records.
+
+A batch of files to be indexed typically shares a small number of distinct
+dimension records (``Model``, ``Emission``, ``Run``, ``VariableAlias``,
+``SpatialRefSys``, ``Grid``, ``LevelSet``, ``TimeSet``), but without a cache
+every file pays the full set of queries needed to find them again.
+
+A ``DimensionCache`` maps a key that identifies a dimension record (the values
+the record is found by) to that record. It is shared by the sessions created
+by one session factory during an indexing run, and is reached from a session
+through ``session.info``. Records are cached as snapshots of their column
+values, and are merged into the session that asks for them without emitting
+any SQL.
+
+Records found or inserted during a transaction are cached only when the
+transaction commits. If it (or a savepoint within it) rolls back, the records
+cached in that transaction are discarded, since they may no longer exist.
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+
+session_info_key = "dimension_cache"
+
+
+class DimensionCache:
+    def __init__(self):
+        # Snapshots of committed records: key -> (class, column values)
+        self.records = {}
+        # Records found or inserted in the current transaction: key -> instance
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def install(self, Session):
+        """Make this cache available to all sessions created by a session
+        factory, and keep it consistent with their transactions.
+
+        :param Session: session factory (``sessionmaker``)
+        """
+        info = dict(Session.kw.get("info") or {})
+        info[session_info_key] = self
+        Session.configure(info=info)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        event.listen(Session, "after_transaction_end", self._after_transaction_end)
+
+    def get(self, sesh, key):
+        """Return the record cached under ``key``, as a persistent instance in
+        session ``sesh``, or None if there is none.
+
+        :param sesh: modelmeta database session
+        :param key: (tuple) key identifying the record
+        """
+        instance = self.pending.get(key)
+        if instance is not None:
+            return instance
+        record = self.records.get(key)
+        if record is None:
+            return None
+        cls, values = record
+        instance = cls(**values)
+        make_transient_to_detached(instance)
+        return sesh.merge(instance, load=False)
+
+    def add(self, key, instance):
+        """Cache a record found or inserted in the current transaction.
+        It is available to other transactions only once this one commits.
+
+        :param key: (tuple) key identifying the record
+        :param instance: the record
+        """
+        self.pending[key] = instance
+
+    def preload(self, key, instance):
+        """Cache a record known to be committed, e.g., one just loaded from
+        the database in a fresh transaction. An existing entry is not replaced.
+
+        :param key: (tuple) key identifying the record
+        :param instance: the record
+        """
+        if key not in self.records:
+            self._snapshot(key, instance)
+
+    def clear(self):
+        self.records.clear()
+        self.pending.clear()
+
+    def _snapshot(self, key, instance):
+        state = inspect(instance)
+        if state.key is None:
+            # Not persistent; nothing reliable to cache.
+            return
+        values = {
+            attr.key: state.dict[attr.key]
+            for attr in state.mapper.column_attrs
+            if attr.key in state.dict
+        }
+        self.records[key] = (state.class_, values)
+
+    def _after_commit(self, session):
+        # This event is also dispatched when a savepoint is released; the
+        # enclosing transaction can still roll back.
+        if session.in_nested_transaction():
+            return
+        # Instances are not yet expired at this point, so their column values
+        # can be read without emitting SQL.
+        for key, instance in self.pending.items():
+            self._snapshot(key, instance)
+        self.pending.clear()
+
+    def _after_rollback(self, session):
+        # Dispatched for savepoint rollbacks as well. Discarding records
+        # cached by earlier, successful savepoints costs only a query later.
+        self.pending.clear()
+
+    def _after_transaction_end(self, session, transaction):
+        # Covers sessions closed without commit or rollback.
+        if transaction.parent is None:
+            self.pending.clear()
+
+
+def get_dimension_cache(sesh):
+    """Return the dimension cache for a session, or None if it has none."""
+    return sesh.info.get(session_info_key)
+
+
+def find_cached(sesh, key, find):
+    """Find a dimension record, using the session's dimension cache if it
+    has one.
+
+    :param sesh: modelmeta database session
+    :param key: (tuple) key identifying the record
+    :param find: function of no arguments that finds the record in the
+        database and returns it or None
+    :return: record found or None
+    """
+    cache = get_dimension_cache(sesh)
+    if cache is None:
+        return find()
+    record = cache.get(sesh, key)
+    if record is None:
+        record = find()
+        if record is not None:
+            cache.add(key, record)
+    return record
+
+
+def cache_inserted(sesh, key, record):
+    """Add a newly inserted dimension record to the session's dimension cache,
+    if it has one.
+
+    :param sesh: modelmeta database session
+    :param key: (tuple) key identifying the record
+    :param record: record inserted
+    :return: ``record``
+    """
+    cache = get_dimension_cache(sesh)
+    if cache is not None:
+        cache.add(key, record)
+    return record
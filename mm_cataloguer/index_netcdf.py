@@ -66,15 +66,22 @@ all our NetCDF files are fully self-describing.
 """
 
 import os
+import sys
+import time
 import traceback
 import logging
 import datetime
 import functools
+import hashlib
+import itertools
+import multiprocessing
 
 from netCDF4 import num2date, chartostring
 import numpy as np
-from sqlalchemy import create_engine, func, select, case
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import BigInteger, cast, create_engine, func, select, or_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, lazyload, load_only
 
 import pycrs
 
@@ -101,8 +108,30 @@ from modelmeta import (
     Station,
     DataFileVariableDSGTimeSeriesXStation,
     SpatialRefSys,
+    pcic_srid_seq,
 )
 from mm_cataloguer import psycopg2_adapters
+from mm_cataloguer.bulk_insert import bulk_insert
+from mm_cataloguer.upsert import insert_or_find, insert_ignoring_conflicts
+from mm_cataloguer.dataset_memo import memoize_per_dataset
+from mm_cataloguer import var_range
+from mm_cataloguer.statements import (
+    StatementCounter,
+    install as install_statement_counter,
+    session_info_key as statements_info_key,
+    statement_scope,
+)
+from mm_cataloguer.timings import (
+    StageTimings,
+    session_info_key as timings_info_key,
+    session_timings,
+    timed,
+)
+from mm_cataloguer.dimension_cache import (
+    DimensionCache,
+    find_cached,
+    cache_inserted,
+)
 
 
 # Set up logging
@@ -124,9 +153,41 @@ psycopg2_adapters.register()
 
 filepath_converter = "realpath"
 
+# Indexing options. They apply to all sessions created by a session factory
+# (see ``indexing_session_factory``), and are read from ``session.info``, so
+# that they need not be passed through every function.
+#
+#   fast_skip: skip, without opening it, a file whose status (size,
+#       modification time, inode) is unchanged since it was indexed
+#   touch_skipped: update the index time of a file that is skipped because
+#       it is already indexed and unchanged; if False, skipping a file writes
+#       nothing to the database
+#   range_memory_budget: memory, in bytes, for values read at any one time
+#       when computing the range of a variable
+#   range_threads: number of threads used to compute the range of a variable
+#   range_from_valid_range: take the range of a variable without an
+#       ``actual_range`` attribute from its valid range attributes
+#   range_sidecar_suffix: suffix added to a data file name to form the name of
+#       its sidecar statistics file; None to ignore sidecar files
+
+default_indexing_options = {
+    "fast_skip": False,
+    "touch_skipped": True,
+    "range_memory_budget": var_range.default_memory_budget,
+    "range_threads": 1,
+    "range_from_valid_range": False,
+    "range_sidecar_suffix": var_range.default_sidecar_suffix,
+}
+
 # Helper functions
 
 
+def indexing_option(sesh, name):
+    """Return the value of an indexing option for a session."""
+    options = sesh.info.get("indexing_options", {})
+    return options.get(name, default_indexing_options[name])
+
+
 def is_regular_series(values, relative_tolerance=1e-6):
     """Return True iff the given series of values is regular, i.e., has equal
     steps between values, within a relative tolerance."""
@@ -139,6 +200,17 @@ def mean_step_size(values):
     return np.mean(np.diff(values))
 
 
+def file_status(filepath):
+    """Return the status of a file, as values for the corresponding
+    ``DataFile`` columns."""
+    status = os.stat(filepath)
+    return {
+        "file_size": status.st_size,
+        "file_mtime_ns": status.st_mtime_ns,
+        "file_inode": status.st_ino,
+    }
+
+
 def seconds_since_epoch(t):
     """Convert a datetime to the number of seconds since the Unix epoch."""
     # add a timezone, if one is missing
@@ -151,6 +223,145 @@ def seconds_since_epoch(t):
     ).total_seconds()
 
 
+def stored_float(value):
+    """Return the float that the database stores for a numeric value.
+
+    Our psycopg2 adapters pass numpy values to the database as their string
+    representation, so, e.g., ``np.float32(0.1)`` is stored as 0.1, not as
+    0.10000000149... This function lets keys computed from file contents
+    equal keys computed from the corresponding database records.
+    """
+    return float(str(value))
+
+
+def advisory_lock_key(*key):
+    """Return a 64-bit signed integer derived from the given key parts, suitable
+    for use as a Postgres advisory lock key."""
+    digest = hashlib.blake2b(
+        "\x1f".join(str(part) for part in key).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, byteorder="big", signed=True)
+
+
+def lock_for_insert(sesh, *key):
+    """Serialize insertion of the record identified by ``key`` against other
+    sessions (e.g., other indexing processes) that are inserting the same
+    record.
+
+    The lock is a Postgres transaction-scoped advisory lock, so it is released
+    when the current transaction commits or rolls back. Other database dialects
+    do not support concurrent writers in a way that needs this, so for them
+    this is a no-op.
+
+    Callers must search again for the record after taking the lock, since
+    another session may have inserted (and committed) it while we waited.
+
+    :param sesh: modelmeta database session
+    :param key: parts of a key that identify the record to be inserted; the
+        first part is conventionally the table name
+    :return: (bool) True if a lock was taken
+    """
+    if sesh.get_bind().dialect.name != "postgresql":
+        return False
+    sesh.execute(select(func.pg_advisory_xact_lock(advisory_lock_key(*key))))
+    return True
+
+
+def lock_all_for_insert(sesh, keys):
+    """Serialize insertion of a record that may be identified by any of
+    several keys against other sessions inserting a record identified by any
+    of the same keys. One lock (see ``lock_for_insert``) is taken per key, in
+    order of their lock keys, so sessions locking overlapping sets of keys
+    cannot deadlock each other.
+
+    :param sesh: modelmeta database session
+    :param keys: iterable of tuples of key parts (see ``lock_for_insert``)
+    :return: (bool) True if locks were taken
+    """
+    return lock_data_files(sesh, {advisory_lock_key(*key) for key in keys})
+
+
+def data_file_lock_keys(unique_id, realpath):
+    """Return the keys of the advisory locks that serialize indexing of a
+    file with the given unique id and real path (see ``lock_data_file``)."""
+    return {
+        advisory_lock_key("data_files", "unique_id", unique_id),
+        advisory_lock_key("data_files", "filename", realpath),
+    }
+
+
+def lock_data_files(sesh, keys):
+    """Take Postgres transaction-scoped advisory locks on a set of keys (see
+    ``data_file_lock_keys``), in order of their keys and with one statement.
+    For other database dialects this is a no-op.
+
+    :param sesh: modelmeta database session
+    :param keys: (iterable of int) advisory lock keys
+    :return: (bool) True if locks were taken
+    """
+    if sesh.get_bind().dialect.name != "postgresql":
+        return False
+    keys = sorted(keys)
+    if keys:
+        # A volatile function in the select list is evaluated after the rows
+        # are sorted, so the locks are taken in order of their keys.
+        key = func.unnest(cast(keys, ARRAY(BigInteger))).table_valued("key")
+        sesh.execute(
+            select(func.pg_advisory_xact_lock(key.c.key)).order_by(key.c.key)
+        ).all()
+    return True
+
+
+def lock_data_file(sesh, cf):
+    """Serialize indexing of a NetCDF file against other sessions indexing the
+    same file, whether under the same path or another (e.g., a file and the
+    path it was moved from), before the file is classified.
+
+    Two Postgres transaction-scoped advisory locks are taken, one keyed on the
+    file's unique id and one on its real path. They are taken in order of
+    their keys, so that sessions locking files with overlapping identities
+    cannot deadlock each other. For other database dialects this is a no-op.
+
+    The locks are held until the transaction ends. A transaction that indexes
+    several files (see ``index_netcdf_files_in_batches``) holds the locks of
+    each file it has indexed while it locks the next, so two such
+    transactions indexing overlapping files in different orders can deadlock.
+    Postgres then aborts one of them; see ``index_netcdf_files_in_batches``
+    for how the batch recovers.
+
+    :param sesh: modelmeta database session
+    :param cf: CFDatafile object representing NetCDF file
+    :return: (bool) True if locks were taken
+    """
+    return lock_data_files(sesh, data_file_lock_keys(cf.unique_id, cf_realpath(cf)))
+
+
+def describe_exception(exception):
+    """Return a one-line description of an exception, e.g., to record why a
+    file could not be indexed."""
+    return "".join(traceback.format_exception_only(type(exception), exception)).strip()
+
+
+def is_transient_db_error(exception):
+    """Return True iff ``exception`` is a database error that may not recur
+    if the transaction is retried (deadlock, serialization failure)."""
+    return isinstance(exception, OperationalError) and getattr(
+        exception.orig, "pgcode", None
+    ) in ("40P01", "40001")
+
+
+@memoize_per_dataset
+def cf_realpath(cf):
+    """Return the normalized (real) file path of a NetCDF file, as recorded in
+    ``DataFile.filename``.
+
+    :param cf: CFDatafile object representing NetCDF file
+    :return: (str)
+    """
+    return cf.filepath(converter=filepath_converter)
+
+
+@memoize_per_dataset
 def get_level_set_info(cf, var_name):
     """Return a dict containing information characterizing the level set
     (Z axis values) associated with a specified dependent variable, or
@@ -180,6 +391,7 @@ def get_level_set_info(cf, var_name):
     }
 
 
+@memoize_per_dataset
 def get_grid_info(cf, var_name):
     """Get information defining the Grid record corresponding to the spatial
     dimensions of a variable in a NetCDF file.
@@ -218,6 +430,12 @@ def get_grid_info(cf, var_name):
 # Model
 
 
+def model_key(short_name):
+    """Return the key that identifies a ``Model`` record in the dimension
+    cache."""
+    return ("models", short_name)
+
+
 def find_model(sesh, cf):
     """Find existing ``Model`` record corresponding to a NetCDF file.
 
@@ -225,24 +443,33 @@ def find_model(sesh, cf):
     :param cf: CFDatafile object representing NetCDF file
     :return: existing ``Model`` record or None
     """
-    query = sesh.query(Model).filter(Model.short_name == cf.metadata.model)
-    return query.first()
+
+    def find():
+        query = sesh.query(Model).filter(Model.short_name == cf.metadata.model)
+        return query.first()
+
+    return find_cached(sesh, model_key(cf.metadata.model), find)
 
 
 def insert_model(sesh, cf):
-    """Insert new ``Model`` record corresponding to a NetCDF file.
+    """Insert new ``Model`` record corresponding to a NetCDF file, or find
+    the one inserted concurrently by another session.
 
     :param sesh: modelmeta database session
     :param cf: CFDatafile object representing NetCDF file
     :return: new ``Model`` record
     """
-    model = Model(
-        short_name=cf.metadata.model,
-        type=cf.model_type,
-        organization=cf.metadata.institution,
+    model = insert_or_find(
+        sesh,
+        Model,
+        {
+            "short_name": cf.metadata.model,
+            "type": cf.model_type,
+            "organization": cf.metadata.institution,
+        },
+        ["short_name"],
     )
-    sesh.add(model)
-    return model
+    return cache_inserted(sesh, model_key(cf.metadata.model), model)
 
 
 def find_or_insert_model(sesh, cf):
@@ -262,6 +489,12 @@ def find_or_insert_model(sesh, cf):
 # Emission
 
 
+def emission_key(short_name):
+    """Return the key that identifies an ``Emission`` record in the dimension
+    cache."""
+    return ("emissions", short_name)
+
+
 def find_emission(sesh, cf):
     """Find existing ``Emission`` record corresponding to a NetCDF file.
 
@@ -269,20 +502,26 @@ def find_emission(sesh, cf):
     :param cf: CFDatafile object representing NetCDF file
     :return: existing ``Emission`` record or None
     """
-    q = sesh.query(Emission).filter(Emission.short_name == cf.metadata.emissions)
-    return q.first()
+
+    def find():
+        q = sesh.query(Emission).filter(Emission.short_name == cf.metadata.emissions)
+        return q.first()
+
+    return find_cached(sesh, emission_key(cf.metadata.emissions), find)
 
 
 def insert_emission(sesh, cf):
-    """Insert new ``Emission`` record corresponding to a NetCDF file.
+    """Insert new ``Emission`` record corresponding to a NetCDF file, or find
+    the one inserted concurrently by another session.
 
     :param sesh: modelmeta database session
     :param cf: CFDatafile object representing NetCDF file
     :return: new ``Emission`` record
     """
-    emission = Emission(short_name=cf.metadata.emissions)
-    sesh.add(emission)
-    return emission
+    emission = insert_or_find(
+        sesh, Emission, {"short_name": cf.metadata.emissions}, ["short_name"]
+    )
+    return cache_inserted(sesh, emission_key(cf.metadata.emissions), emission)
 
 
 def find_or_insert_emission(sesh, cf):
@@ -302,6 +541,12 @@ def find_or_insert_emission(sesh, cf):
 # Run
 
 
+def run_key(model_short_name, emission_short_name, run_name):
+    """Return the key that identifies a ``Run`` record in the dimension
+    cache."""
+    return ("runs", model_short_name, emission_short_name, run_name)
+
+
 def find_run(sesh, cf):
     """Find existing ``Run`` record corresponding to a NetCDF file.
 
@@ -309,19 +554,25 @@ def find_run(sesh, cf):
     :param cf: CFDatafile object representing NetCDF file
     :return: existing ``Run`` record or None
     """
-    q = (
-        sesh.query(Run)
-        .join(Model)
-        .join(Emission)
-        .filter(Model.short_name == cf.metadata.model)
-        .filter(Emission.short_name == cf.metadata.emissions)
-        .filter(Run.name == cf.metadata.run)
-    )
-    return q.first()
+
+    def find():
+        q = (
+            sesh.query(Run)
+            .join(Model)
+            .join(Emission)
+            .filter(Model.short_name == cf.metadata.model)
+            .filter(Emission.short_name == cf.metadata.emissions)
+            .filter(Run.name == cf.metadata.run)
+        )
+        return q.first()
+
+    key = run_key(cf.metadata.model, cf.metadata.emissions, cf.metadata.run)
+    return find_cached(sesh, key, find)
 
 
 def insert_run(sesh, cf, model, emission):
-    """Insert new ``Run`` record corresponding to a NetCDF file.
+    """Insert new ``Run`` record corresponding to a NetCDF file, or find the
+    one inserted concurrently by another session.
 
     :param sesh: modelmeta database session
     :param cf: CFDatafile object representing NetCDF file
@@ -329,14 +580,19 @@ def insert_run(sesh, cf, model, emission):
     :param emission: (Emission) Emission record corresponding to NetCDF file
     :return: new ``Run`` record
     """
-    run = Run(
-        name=cf.metadata.run,
-        project=cf.metadata.project,
-        model=model,
-        emission=emission,
+    run = insert_or_find(
+        sesh,
+        Run,
+        {
+            "name": cf.metadata.run,
+            "project": cf.metadata.project,
+            "model_id": model.id,
+            "emission_id": emission.id,
+        },
+        ["name", "model_id", "emission_id"],
     )
-    sesh.add(run)
-    return run
+    key = run_key(cf.metadata.model, cf.metadata.emissions, cf.metadata.run)
+    return cache_inserted(sesh, key, run)
 
 
 def find_or_insert_run(sesh, cf):
@@ -373,6 +629,12 @@ def usable_name(variable):
         return variable.name
 
 
+def variable_alias_key(long_name, standard_name, units):
+    """Return the key that identifies a ``VariableAlias`` record in the
+    dimension cache."""
+    return ("variable_aliases", long_name, standard_name, units)
+
+
 def find_variable_alias(sesh, cf, var_name):
     """Find a VariableAlias for the named NetCDF variable.
     If none exists, return None.
@@ -383,17 +645,23 @@ def find_variable_alias(sesh, cf, var_name):
     :return found VariableAlias object or None
     """
     variable = cf.variables[var_name]
-    q = (
-        sesh.query(VariableAlias)
-        .filter(VariableAlias.long_name == variable.long_name)
-        .filter(VariableAlias.standard_name == usable_name(variable))
-        .filter(VariableAlias.units == variable.units)
-    )
-    return q.first()
+
+    def find():
+        q = (
+            sesh.query(VariableAlias)
+            .filter(VariableAlias.long_name == variable.long_name)
+            .filter(VariableAlias.standard_name == usable_name(variable))
+            .filter(VariableAlias.units == variable.units)
+        )
+        return q.first()
+
+    key = variable_alias_key(variable.long_name, usable_name(variable), variable.units)
+    return find_cached(sesh, key, find)
 
 
 def insert_variable_alias(sesh, cf, var_name):
-    """Insert a VariableAlias for the named NetCDF variable.
+    """Insert a VariableAlias for the named NetCDF variable, or find the one
+    inserted concurrently by another session.
 
     :param sesh: modelmeta database session
     :param cf: CFDatafile object representing NetCDF file
@@ -401,13 +669,18 @@ def insert_variable_alias(sesh, cf, var_name):
     :return inserted VariableAlias object
     """
     variable = cf.variables[var_name]
-    variable_alias = VariableAlias(
-        long_name=variable.long_name,
-        standard_name=usable_name(variable),
-        units=variable.units,
+    variable_alias = insert_or_find(
+        sesh,
+        VariableAlias,
+        {
+            "long_name": variable.long_name,
+            "standard_name": usable_name(variable),
+            "units": variable.units,
+        },
+        ["long_name", "standard_name", "units"],
     )
-    sesh.add(variable_alias)
-    return variable_alias
+    key = variable_alias_key(variable.long_name, usable_name(variable), variable.units)
+    return cache_inserted(sesh, key, variable_alias)
 
 
 def find_or_insert_variable_alias(sesh, cf, var_name):
@@ -427,6 +700,31 @@ def find_or_insert_variable_alias(sesh, cf, var_name):
 # LevelSet, Level
 
 
+def level_set_fingerprint(level_units, vertical_levels):
+    """Return the fingerprint of a level set: a hash of its units and its
+    levels, in order, as they are stored in the database.
+
+    ``LevelSet.fingerprint`` is unique, so a level set is found by a single
+    indexed lookup on its fingerprint. Migration 7a3e2c1f9b04, which
+    backfills fingerprints, must compute them identically.
+
+    :param level_units: (str) units of levels
+    :param vertical_levels: (iterable) levels, in order
+    :return: (str) hex digest
+    """
+    return hashlib.sha256(
+        "\n".join(
+            [level_units] + [repr(stored_float(level)) for level in vertical_levels]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def level_set_key(level_units, vertical_levels):
+    """Return the key that identifies a ``LevelSet`` record in the dimension
+    cache and in insert locks."""
+    return "level_sets", level_set_fingerprint(level_units, vertical_levels)
+
+
 def find_level_set(sesh, cf, var_name):
     """Find a LevelSet for a named NetCDF variable.
     If the variable has no Z (level) axis, return None.
@@ -440,17 +738,13 @@ def find_level_set(sesh, cf, var_name):
     info = get_level_set_info(cf, var_name)
     if not info:
         return None
-    units = info["level_axis_var"].units
-    vertical_levels = info["vertical_levels"]
-    q = (
-        sesh.query(LevelSet)
-        .join(Level)
-        .filter(LevelSet.level_units == units)
-        .filter(Level.vertical_level.in_(vertical_levels))
-        .group_by(LevelSet.id)
-        .having(func.count(Level.vertical_level) == len(vertical_levels))
-    )
-    return q.first()
+    key = level_set_key(info["level_axis_var"].units, info["vertical_levels"])
+
+    def find():
+        _, fingerprint = key
+        return sesh.query(LevelSet).filter(LevelSet.fingerprint == fingerprint).first()
+
+    return find_cached(sesh, key, find)
 
 
 def insert_level_set(sesh, cf, var_name):
@@ -466,25 +760,33 @@ def insert_level_set(sesh, cf, var_name):
     info = get_level_set_info(cf, var_name)
     if not info:
         return None
-    level_set = LevelSet(level_units=info["level_axis_var"].units)
+    key = level_set_key(info["level_axis_var"].units, info["vertical_levels"])
+    _, fingerprint = key
+    level_set = LevelSet(
+        level_units=info["level_axis_var"].units, fingerprint=fingerprint
+    )
     sesh.add(level_set)
+    sesh.flush()
 
-    sesh.add_all(
+    bulk_insert(
+        sesh,
+        Level.__table__,
         [
-            Level(
-                level_set=level_set,
-                level_idx=level_idx,
-                vertical_level=vertical_level,
-                level_start=level_start,
-                level_end=level_end,
-            )
+            {
+                "level_set_id": level_set.id,
+                "level_idx": level_idx,
+                "vertical_level": vertical_level,
+                "level_start": level_start,
+                "level_end": level_end,
+            }
             for level_idx, (level_start, vertical_level, level_end) in enumerate(
                 cf.var_bounds_and_values(info["level_axis_var"].name)
             )
-        ]
+        ],
     )
+    sesh.expire(level_set, ["levels"])
 
-    return level_set
+    return cache_inserted(sesh, key, level_set)
 
 
 def find_or_insert_level_set(sesh, cf, var_name):  # get.level.set.id
@@ -500,6 +802,15 @@ def find_or_insert_level_set(sesh, cf, var_name):  # get.level.set.id
     level_set = find_level_set(sesh, cf, var_name)
     if level_set:
         return level_set
+    info = get_level_set_info(cf, var_name)
+    if not info:
+        return None
+    if lock_for_insert(
+        sesh, *level_set_key(info["level_axis_var"].units, info["vertical_levels"])
+    ):
+        level_set = find_level_set(sesh, cf, var_name)
+        if level_set:
+            return level_set
     return insert_level_set(sesh, cf, var_name)
 
 
@@ -508,11 +819,33 @@ def find_or_insert_level_set(sesh, cf, var_name):  # get.level.set.id
 default_proj4 = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
 
 
+@functools.lru_cache(maxsize=256)
 def wkt(proj4):
-    """Return a WKT representation of a CRS defined in PROJ.4 syntax."""
+    """Return a WKT representation of a CRS defined in PROJ.4 syntax.
+
+    Parsing is slow, and a set of files typically uses very few CRSs, so
+    results are cached.
+    """
     return pycrs.parse.from_proj4(proj4).to_ogc_wkt()
 
 
+@memoize_per_dataset
+def cf_srtext(cf, var_name):
+    """Return the WKT representation of the CRS of a variable in a NetCDF file.
+
+    :param cf: CFDatafile object representing NetCDF file
+    :param var_name: (str) name of variable
+    :return: (str)
+    """
+    return wkt(cf.proj4_string(var_name, default=default_proj4))
+
+
+def spatial_ref_sys_key(srtext):
+    """Return the key that identifies a ``SpatialRefSys`` record in the
+    dimension cache."""
+    return ("spatial_ref_sys", srtext)
+
+
 def find_spatial_ref_sys(sesh, cf, var_name):
     """Find existing ``SpatialRefSys`` record corresponding to the CRS defined
     in the the NetCDF file for the specified variable.
@@ -525,10 +858,36 @@ def find_spatial_ref_sys(sesh, cf, var_name):
     :param var_name: (str) name of variable for which to find spatial ref sys
     :return: existing ``SpatialRefSys`` record or None
     """
-    q = sesh.query(SpatialRefSys).filter(
-        SpatialRefSys.srtext == wkt(cf.proj4_string(var_name, default=default_proj4))
-    )
-    return q.one_or_none()
+    srtext = cf_srtext(cf, var_name)
+
+    def find():
+        q = sesh.query(SpatialRefSys).filter(SpatialRefSys.srtext == srtext)
+        if sesh.get_bind().dialect.name == "postgresql":
+            # Allow use of the index on md5(srtext)
+            srtext_md5 = hashlib.md5(srtext.encode("utf-8")).hexdigest()
+            q = q.filter(func.md5(SpatialRefSys.srtext) == srtext_md5)
+        return q.one_or_none()
+
+    return find_cached(sesh, spatial_ref_sys_key(srtext), find)
+
+
+def next_pcic_srid(sesh):
+    """Return the srid for a new ``SpatialRefSys`` record added by PCIC.
+
+    In PostgreSQL, srids are allocated from sequence ``pcic_srid_seq``, so
+    that concurrent indexers adding different CRSs neither conflict nor scan
+    ``spatial_ref_sys``. Elsewhere, the next srid is the larger of (the largest
+    current srid + 1, 990000).
+
+    :param sesh: modelmeta database session
+    :return: (int) srid
+    """
+    if sesh.get_bind().dialect.name == "postgresql":
+        return sesh.execute(pcic_srid_seq.next_value()).scalar()
+    max_srid = sesh.query(func.max(SpatialRefSys.id)).scalar()
+    if max_srid is None or max_srid < 990000:
+        return 990000
+    return max_srid + 1
 
 
 def insert_spatial_ref_sys(sesh, cf, var_name):
@@ -541,60 +900,20 @@ def insert_spatial_ref_sys(sesh, cf, var_name):
     :return: (SpatialRefSys) inserted record
     """
 
-    # Use a common table expression (CTE, a.k.a. WITH statement) to compute,
-    # atomically, the next SpatialRefSys id to use for the insert. That id is
-    # defined to be the larger of (the largest current id + 1, 990000).
-    #
-    # The CTE is a simpler way to package up the queries needed into a
-    # transaction that either succeeds or is rolled back as a unit.
-    # Also, we've used a CASE statement to avoid having to add special
-    # SQLAlchemy expression compilation code to define the Postgres function
-    # "GREATER", which if present would be more elegant.
-    #
-    # To use the new id value, we have to have a way of using it in an insert
-    # statement, which fortunately SQLAlchemy makes relatively easy.
-    #
-    # Useful reference info:
-    # CTE: http://docs.sqlalchemy.org/en/latest/core/selectable.html#sqlalchemy.sql.expression.CompoundSelect.cte
-    # CTE: http://docs.sqlalchemy.org/en/latest/orm/query.html#sqlalchemy.orm.query.Query.cte
-    # Embedding SQL Insert/Update Expressions into a Flush: http://docs.sqlalchemy.org/en/latest/orm/persistence_techniques.html#embedding-sql-insert-update-expressions-into-a-flush
-    max_srid = sesh.query(func.max(SpatialRefSys.id).label("max_srid")).cte(
-        name="max_srid"
-    )
-    next_srid = select(
-        case(
-            (max_srid.c.max_srid >= 990000, max_srid.c.max_srid + 1), else_=990000
-        ).label("next_srid")
-    ).cte(name="next_srid")
-    id = select(next_srid.c.next_srid).scalar_subquery()  # Used in two places
-
-    proj4_string = cf.proj4_string(var_name, default=default_proj4)
-
+    srid = next_pcic_srid(sesh)
     spatial_ref_sys = SpatialRefSys(
-        id=id,
+        id=srid,
         auth_name="PCIC",
-        auth_srid=id,
-        proj4text=proj4_string,
-        srtext=wkt(proj4_string),
+        auth_srid=srid,
+        proj4text=cf.proj4_string(var_name, default=default_proj4),
+        srtext=cf_srtext(cf, var_name),
     )
-
     sesh.add(spatial_ref_sys)
 
-    # At this point, ``spatial_ref_sys.id`` is still in the form of a SELECT
-    # statement, which causes an error if it is attempted to be used in the
-    # Python code. So instead we flush  the session to the database(not commit!
-    # the current transaction can still be rolled back), then query to get the
-    # SRS back with all values (i.e., ``id`` and ``auth_id``) fully defined.
-    # Documentation seems to indicate that ``Session.refresh()`` should do this
-    # for us (and more elegantly), but experimentation shows it doesn't.
-    sesh.flush()
-    # The newly inserted SRS is by definition the one with the highest id.
-    spatial_ref_sys = (
-        sesh.query(SpatialRefSys).order_by(SpatialRefSys.id.desc()).first()
+    return cache_inserted(
+        sesh, spatial_ref_sys_key(spatial_ref_sys.srtext), spatial_ref_sys
     )
 
-    return spatial_ref_sys
-
 
 def find_or_insert_spatial_ref_sys(sesh, cf, var_name):
     """Find existing or insert new ``SpatialRefSys`` record corresponding
@@ -609,12 +928,158 @@ def find_or_insert_spatial_ref_sys(sesh, cf, var_name):
     spatial_ref_sys = find_spatial_ref_sys(sesh, cf, var_name)
     if spatial_ref_sys:
         return spatial_ref_sys
+    if lock_for_insert(sesh, *spatial_ref_sys_key(cf_srtext(cf, var_name))):
+        spatial_ref_sys = find_spatial_ref_sys(sesh, cf, var_name)
+        if spatial_ref_sys:
+            return spatial_ref_sys
     return insert_spatial_ref_sys(sesh, cf, var_name)
 
 
 # Grid, YCellBound
 
 
+def grid_key(
+    srid,
+    xc_count,
+    yc_count,
+    xc_origin,
+    yc_origin,
+    xc_grid_step,
+    yc_grid_step,
+    evenly_spaced_y,
+):
+    """Return the key that identifies a ``Grid`` record in the dimension
+    cache."""
+    return (
+        "grids",
+        srid,
+        int(xc_count),
+        int(yc_count),
+        stored_float(xc_origin),
+        stored_float(yc_origin),
+        stored_float(xc_grid_step),
+        stored_float(yc_grid_step),
+        bool(evenly_spaced_y),
+    )
+
+
+# Grids match if their origins and steps are equal within this relative
+# tolerance.
+grid_relative_tolerance = 1e-6
+
+# Origins and steps are quantized to this many significant digits to form a
+# grid's match key. Buckets must be much wider than the tolerance, so that
+# values equal within it fall in the same or adjacent buckets. Changing this
+# invalidates the match keys of existing grids, which are stored (and
+# backfilled by migration 5c8d41e2a7b3) with it; indexers using different
+# values would miss each other's grids. So it is fixed rather than an option.
+grid_key_digits = 5
+
+
+def quantize(value):
+    """Return a float value rounded to ``grid_key_digits`` significant digits,
+    as a string."""
+    # Adding 0.0 turns -0.0 into 0.0.
+    return "{:.{}e}".format(stored_float(value) + 0.0, grid_key_digits - 1)
+
+
+def quantize_within_tolerance(value, relative_tolerance=grid_relative_tolerance):
+    """Return the quantized values (see ``quantize``) of all values that are
+    equal to ``value`` within ``relative_tolerance``: one value, or two where
+    ``value`` is close to a bucket boundary."""
+    value = stored_float(value)
+    return sorted(
+        {
+            quantize(value / (1 + relative_tolerance)),
+            quantize(value),
+            quantize(value / (1 - relative_tolerance)),
+        }
+    )
+
+
+def grid_match_key(
+    srid,
+    xc_count,
+    yc_count,
+    xc_origin,
+    yc_origin,
+    xc_grid_step,
+    yc_grid_step,
+    evenly_spaced_y,
+    quantized=quantize,
+):
+    """Return the match key of a grid: a hash of its integer attributes and
+    its quantized origins and steps. ``Grid.match_key`` is indexed, so grids
+    are found by lookup on their match keys, and only grids with the same key
+    are compared within tolerance.
+
+    Migration 5c8d41e2a7b3, which backfills match keys, must compute them
+    identically.
+
+    :param quantized: function quantizing origins and steps; by default
+        ``quantize``
+    :return: (str) hex digest
+    """
+    return hashlib.sha256(
+        "/".join(
+            [str(srid), str(int(xc_count)), str(int(yc_count))]
+            + [
+                quantized(value)
+                for value in (xc_origin, yc_origin, xc_grid_step, yc_grid_step)
+            ]
+            + [str(bool(evenly_spaced_y))]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def grid_info_match_keys(info, srid):
+    """Return the match keys (see ``grid_match_key``) of all grids that match
+    the grid described by ``info`` (see ``get_grid_info``) within tolerance.
+    The first is the match key of that grid itself."""
+    values = (
+        info["xc_values"][0],
+        info["yc_values"][0],
+        info["xc_grid_step"],
+        info["yc_grid_step"],
+    )
+    own_key = grid_match_key(
+        srid,
+        len(info["xc_values"]),
+        len(info["yc_values"]),
+        *values,
+        info["evenly_spaced_y"],
+    )
+    keys = {
+        grid_match_key(
+            srid,
+            len(info["xc_values"]),
+            len(info["yc_values"]),
+            *quantized_values,
+            info["evenly_spaced_y"],
+            quantized=str,
+        )
+        for quantized_values in itertools.product(
+            *(quantize_within_tolerance(value) for value in values)
+        )
+    }
+    return [own_key] + sorted(keys - {own_key})
+
+
+def grid_info_key(info, srid):
+    """Return the key that identifies the ``Grid`` record described by
+    ``info`` (see ``get_grid_info``) in the dimension cache."""
+    return grid_key(
+        srid,
+        len(info["xc_values"]),
+        len(info["yc_values"]),
+        info["xc_values"][0],
+        info["yc_values"][0],
+        info["xc_grid_step"],
+        info["yc_grid_step"],
+        info["evenly_spaced_y"],
+    )
+
+
 def find_grid(sesh, cf, var_name):
     """Find existing ``Grid`` record corresponding to spatial dimensions of a
     variable in a NetCDF file.
@@ -628,7 +1093,7 @@ def find_grid(sesh, cf, var_name):
             finding/inserting ``Grid`` record
     """
 
-    def approx_equal(attribute, value, relative_tolerance=1e-6):
+    def approx_equal(attribute, value, relative_tolerance=grid_relative_tolerance):
         """Return a column expression specifying that ``attribute`` and
         ``value`` are equal within a specified relative tolerance.
         Treat the case when value == 0 specially: require exact equality.
@@ -641,19 +1106,24 @@ def find_grid(sesh, cf, var_name):
     info = get_grid_info(cf, var_name)
     srid = find_or_insert_spatial_ref_sys(sesh, cf, var_name).id
 
-    grid = (
-        sesh.query(Grid)
-        .filter(approx_equal(Grid.xc_origin, info["xc_values"][0]))
-        .filter(approx_equal(Grid.yc_origin, info["yc_values"][0]))
-        .filter(approx_equal(Grid.xc_grid_step, info["xc_grid_step"]))
-        .filter(approx_equal(Grid.yc_grid_step, info["yc_grid_step"]))
-        .filter(Grid.xc_count == len(info["xc_values"]))
-        .filter(Grid.yc_count == len(info["yc_values"]))
-        .filter(Grid.evenly_spaced_y == info["evenly_spaced_y"])
-        .filter(Grid.srid == srid)
-        .first()
-    )
-    return grid
+    def find():
+        # The match key index narrows the search to a few candidates, which
+        # are then compared within tolerance.
+        return (
+            sesh.query(Grid)
+            .filter(Grid.match_key.in_(grid_info_match_keys(info, srid)))
+            .filter(approx_equal(Grid.xc_origin, info["xc_values"][0]))
+            .filter(approx_equal(Grid.yc_origin, info["yc_values"][0]))
+            .filter(approx_equal(Grid.xc_grid_step, info["xc_grid_step"]))
+            .filter(approx_equal(Grid.yc_grid_step, info["yc_grid_step"]))
+            .filter(Grid.xc_count == len(info["xc_values"]))
+            .filter(Grid.yc_count == len(info["yc_values"]))
+            .filter(Grid.evenly_spaced_y == info["evenly_spaced_y"])
+            .filter(Grid.srid == srid)
+            .first()
+        )
+
+    return find_cached(sesh, grid_info_key(info, srid), find)
 
 
 def insert_grid(sesh, cf, var_name, spatial_ref_sys):
@@ -701,24 +1171,30 @@ def insert_grid(sesh, cf, var_name, spatial_ref_sys):
         xc_units=info["xc_var"].units,
         yc_units=info["yc_var"].units,
         srid=spatial_ref_sys.id,
+        match_key=grid_info_match_keys(info, spatial_ref_sys.id)[0],
     )
     sesh.add(grid)
 
     if not info["evenly_spaced_y"]:
-        y_cell_bounds = [
-            YCellBound(
-                grid=grid,
-                bottom_bnd=bottom_bnd,
-                y_center=y_center,
-                top_bnd=top_bnd,
-            )
-            for bottom_bnd, y_center, top_bnd in cf.var_bounds_and_values(
-                info["yc_var"].name
-            )
-        ]
-        sesh.add_all(y_cell_bounds)
+        sesh.flush()
+        bulk_insert(
+            sesh,
+            YCellBound.__table__,
+            [
+                {
+                    "grid_id": grid.id,
+                    "bottom_bnd": bottom_bnd,
+                    "y_center": y_center,
+                    "top_bnd": top_bnd,
+                }
+                for bottom_bnd, y_center, top_bnd in cf.var_bounds_and_values(
+                    info["yc_var"].name
+                )
+            ],
+        )
+        sesh.expire(grid, ["y_cell_bounds"])
 
-    return grid
+    return cache_inserted(sesh, grid_info_key(info, spatial_ref_sys.id), grid)
 
 
 def find_or_insert_grid(sesh, cf, var_name):
@@ -739,12 +1215,77 @@ def find_or_insert_grid(sesh, cf, var_name):
     # ``SpatialRefSys``
     spatial_ref_sys = find_or_insert_spatial_ref_sys(sesh, cf, var_name)
     assert spatial_ref_sys
+    info = get_grid_info(cf, var_name)
+    # Grids are matched within a tolerance, so grids that match each other
+    # may straddle a bucket boundary and have different match keys. Each is
+    # among the other's candidate match keys, though, so locking all of them
+    # serializes insertion of matching grids.
+    if lock_all_for_insert(
+        sesh,
+        [("grids", key) for key in grid_info_match_keys(info, spatial_ref_sys.id)],
+    ):
+        grid = find_grid(sesh, cf, var_name)
+        if grid:
+            return grid
     return insert_grid(sesh, cf, var_name, spatial_ref_sys)
 
 
 # DataFileVariable
 
 
+def get_var_range(sesh, cf, var_name):
+    """Return the range of values taken by a named NetCDF variable, and where
+    it was found.
+
+    The range is taken, in order of preference, from the variable's
+    ``actual_range`` attribute; its valid range attributes, if indexing option
+    ``range_from_valid_range`` is set; the file's sidecar statistics file; and
+    lastly its data, read in slabs within the memory budget set by indexing
+    option ``range_memory_budget``.
+
+    :param sesh: modelmeta database session
+    :param cf: CFDatafile object representing NetCDF file
+    :param var_name: (str) name of variable
+    :return: tuple (min, max, source), where source is the name of the
+        attribute(s) used, "sidecar", or "data"
+    """
+    with timed(sesh, "var_range"):
+        return _get_var_range(sesh, cf, var_name)
+
+
+def _get_var_range(sesh, cf, var_name):
+    variable = cf.variables[var_name]
+
+    range_ = var_range.attribute_range(
+        variable, use_valid_range=indexing_option(sesh, "range_from_valid_range")
+    )
+    if range_ is not None:
+        return range_
+
+    sidecar_suffix = indexing_option(sesh, "range_sidecar_suffix")
+    if sidecar_suffix is not None:
+        range_ = var_range.sidecar_range(cf.filepath(), var_name, sidecar_suffix)
+        if range_ is not None:
+            return range_ + ("sidecar",)
+
+    range_ = var_range.chunked_var_range(
+        variable,
+        memory_budget=indexing_option(sesh, "range_memory_budget"),
+        threads=indexing_option(sesh, "range_threads"),
+    )
+    if range_ is None:
+        # No valid values; leave it to nchelpers to decide what that means.
+        range_ = cf.var_range(var_name)
+    return range_ + ("data",)
+
+
+# ``DataFileVariable`` subtype for each sampling geometry.
+data_file_variable_subtypes = {
+    "gridded": DataFileVariableGridded,
+    "dsg.timeSeries": DataFileVariableDSGTimeSeries,
+}
+
+
 def find_data_file_variable(sesh, cf, var_name, data_file):
     """Find existing ``DataFileVariableGridded`` record corresponding to a named
     variable in a NetCDF file and associated to a specified ``DataFile`` record.
@@ -760,10 +1301,7 @@ def find_data_file_variable(sesh, cf, var_name, data_file):
     :param data_file: (DataFile) data file to associate this dfv to
     :return: existing ``DataFileVariableGridded`` record or None
     """
-    DataFileVariableSubtype = {
-        "gridded": DataFileVariableGridded,
-        "dsg.timeSeries": DataFileVariableDSGTimeSeries,
-    }[cf.sampling_geometry]
+    DataFileVariableSubtype = data_file_variable_subtypes[cf.sampling_geometry]
 
     q = (
         sesh.query(DataFileVariableSubtype)
@@ -791,7 +1329,7 @@ def insert_data_file_variable_gridded(
     """
     assert cf.sampling_geometry == "gridded"
     variable = cf.variables[var_name]
-    range_min, range_max = cf.var_range(var_name)
+    range_min, range_max, range_source = get_var_range(sesh, cf, var_name)
     dfv = DataFileVariableGridded(
         file=data_file,
         variable_alias=variable_alias,
@@ -799,6 +1337,7 @@ def insert_data_file_variable_gridded(
         netcdf_variable_name=var_name,
         range_min=range_min,
         range_max=range_max,
+        range_source=range_source,
         variable_cell_methods=variable.cell_methods,
         # TODO: verify no value for this and other unspecified attributes
         # derivation_method=,
@@ -826,7 +1365,7 @@ def insert_data_file_variable_dsg_time_series(
     """
     assert cf.sampling_geometry == "dsg.timeSeries"
     variable = cf.variables[var_name]
-    range_min, range_max = cf.var_range(var_name)
+    range_min, range_max, range_source = get_var_range(sesh, cf, var_name)
     dfv = DataFileVariableDSGTimeSeries(
         file=data_file,
         variable_alias=variable_alias,
@@ -834,43 +1373,75 @@ def insert_data_file_variable_dsg_time_series(
         netcdf_variable_name=var_name,
         range_min=range_min,
         range_max=range_max,
+        range_source=range_source,
         variable_cell_methods=getattr(variable, "cell_methods", None),
     )
     sesh.add(dfv)
     return dfv
 
 
-def find_station(sesh, cf, i, name, x, y):
-    return (
+def station_key(name, x, y):
+    """Return the key that identifies a ``Station`` record among stations
+    with the same coordinate units."""
+    return str(name), stored_float(x), stored_float(y)
+
+
+def find_stations(sesh, names, x_units, y_units):
+    """Find existing ``Station`` records by name and coordinate units, with a
+    single query.
+
+    :param sesh: modelmeta database session
+    :param names: (iterable of str) station names
+    :param x_units: (str) units of x coordinates
+    :param y_units: (str) units of y coordinates
+    :return: (dict) maps ``station_key`` of each station found to the station
+    """
+    stations = (
         sesh.query(Station)
-        .filter_by(
-            name=str(chartostring(name[i])),
-            x=x[i],
-            x_units=x.units,
-            y=y[i],
-            y_units=y.units,
-        )
-        .first()
+        .filter(Station.name.in_(set(names)))
+        .filter(Station.x_units == x_units)
+        .filter(Station.y_units == y_units)
+        .order_by(Station.id)
+    )
+    found = {}
+    for station in stations:
+        found.setdefault(station_key(station.name, station.x, station.y), station)
+    return found
+
+
+def find_station(sesh, cf, i, name, x, y):
+    """Find the ``Station`` record of station ``i`` of a DSG file (see
+    ``find_stations``)."""
+    station_name = str(chartostring(name[i]))
+    return find_stations(sesh, [station_name], x.units, y.units).get(
+        station_key(station_name, x[i], y[i])
     )
 
 
 def insert_station(sesh, cf, i, name, x, y):
-    station = Station(
-        name=str(chartostring(name[i])),
-        x=x[i],
-        x_units=x.units,
-        y=y[i],
-        y_units=y.units,
+    """Insert the ``Station`` record of station ``i`` of a DSG file, as
+    ``find_or_insert_stations`` does, and return it."""
+    insert_ignoring_conflicts(
+        sesh,
+        Station.__table__,
+        [
+            {
+                "name": str(chartostring(name[i])),
+                "x": x[i],
+                "x_units": x.units,
+                "y": y[i],
+                "y_units": y.units,
+            }
+        ],
+        ["name", "x", "x_units", "y", "y_units"],
     )
-    sesh.add(station)
-    return station
+    return find_station(sesh, cf, i, name, x, y)
 
 
 def find_or_insert_station(sesh, cf, i, name, x, y):
-    station = find_station(sesh, cf, i, name, x, y)
-    if station:
-        return station
-    return insert_station(sesh, cf, i, name, x, y)
+    return find_station(sesh, cf, i, name, x, y) or insert_station(
+        sesh, cf, i, name, x, y
+    )
 
 
 def find_or_insert_stations(sesh, cf, var_name):
@@ -878,19 +1449,47 @@ def find_or_insert_stations(sesh, cf, var_name):
     Find or insert all ``Station`` records for the stations at which a named
     variable is defined in a NetCDF file.
 
+    Stations are found with one query, and those not found are inserted in
+    one statement, so the number of queries does not grow with the number of
+    stations.
+
     :param sesh: modelmeta database session
     :param cf: CFDatafile object representing NetCDF file
     :param var_name: (str) name of variable
     :return: (list of Station) stations at which this variable is defined
     """
-    instance_dim = cf.instance_dim(var_name)
     name = cf.id_instance_var(var_name)
     lat = cf.spatial_instance_var(var_name, "X")
     lon = cf.spatial_instance_var(var_name, "Y")
-    return [
-        find_or_insert_station(sesh, cf, i, name, lon, lat)
-        for i in range(0, instance_dim.size)
-    ]
+    names = [str(n) for n in np.atleast_1d(chartostring(name[:]))]
+    xs, ys = lon[:], lat[:]
+    keys = [station_key(*station) for station in zip(names, xs, ys)]
+
+    stations = find_stations(sesh, names, lon.units, lat.units)
+    if any(key not in stations for key in keys):
+        rows = {}
+        for key, station_name, x, y in zip(keys, names, xs, ys):
+            if key not in stations:
+                rows.setdefault(
+                    key,
+                    {
+                        "name": station_name,
+                        "x": x,
+                        "x_units": lon.units,
+                        "y": y,
+                        "y_units": lat.units,
+                    },
+                )
+        # Stations inserted concurrently by other sessions are skipped, and
+        # found along with those inserted here.
+        insert_ignoring_conflicts(
+            sesh,
+            Station.__table__,
+            list(rows.values()),
+            ["name", "x", "x_units", "y", "y_units"],
+        )
+        stations = find_stations(sesh, names, lon.units, lat.units)
+    return [stations[key] for key in keys]
 
 
 def associate_stations_to_data_file_variable_dsg_time_series(
@@ -905,20 +1504,69 @@ def associate_stations_to_data_file_variable_dsg_time_series(
     :param var_name: (str) name of variable
     :param data_file_variable_dsg_ts: (DataFileVariableDSGTimeSeries)
         data file variable to associate
-    :return: (list of DataFileVariableDSGTimeSeriesXStation) association records
+    :return: (list of dict) column values of the association records inserted
+        into ``DataFileVariableDSGTimeSeriesXStation``
     """
     stations = find_or_insert_stations(sesh, cf, var_name)
+    sesh.flush()
     associations = [
-        DataFileVariableDSGTimeSeriesXStation(
-            data_file_variable_dsg_ts=data_file_variable_dsg_ts,
-            station=station,
-        )
+        {
+            "data_file_variable_dsg_ts_id": data_file_variable_dsg_ts.id,
+            "station_id": station.id,
+        }
         for station in stations
     ]
-    sesh.add_all(associations)
+    bulk_insert(sesh, DataFileVariableDSGTimeSeriesXStation.__table__, associations)
+    sesh.expire(data_file_variable_dsg_ts, ["stations"])
     return associations
 
 
+def reconcile_stations_of_data_file_variable_dsg_time_series(
+    sesh, cf, var_name, data_file_variable_dsg_ts
+):
+    """
+    Bring the Station records associated to the given
+    ``DataFileVariableDSGTimeSeries`` up to date with the stations defined for
+    the named variable, adding and removing only the associations that differ.
+
+    :param sesh: modelmeta database session
+    :param cf: CFDatafile object representing NetCDF file
+    :param var_name: (str) name of variable
+    :param data_file_variable_dsg_ts: (DataFileVariableDSGTimeSeries)
+        data file variable to associate
+    :return: (tuple) numbers of associations added and removed
+    """
+    stations = find_or_insert_stations(sesh, cf, var_name)
+    sesh.flush()
+    station_ids = list(dict.fromkeys(station.id for station in stations))
+    associated = {
+        station_id
+        for (station_id,) in sesh.query(
+            DataFileVariableDSGTimeSeriesXStation.station_id
+        ).filter_by(data_file_variable_dsg_ts_id=data_file_variable_dsg_ts.id)
+    }
+    removed = associated.difference(station_ids)
+    if removed:
+        sesh.query(DataFileVariableDSGTimeSeriesXStation).filter(
+            DataFileVariableDSGTimeSeriesXStation.data_file_variable_dsg_ts_id
+            == data_file_variable_dsg_ts.id
+        ).filter(DataFileVariableDSGTimeSeriesXStation.station_id.in_(removed)).delete(
+            synchronize_session=False
+        )
+    added = [
+        {
+            "data_file_variable_dsg_ts_id": data_file_variable_dsg_ts.id,
+            "station_id": station_id,
+        }
+        for station_id in station_ids
+        if station_id not in associated
+    ]
+    bulk_insert(sesh, DataFileVariableDSGTimeSeriesXStation.__table__, added)
+    if added or removed:
+        sesh.expire(data_file_variable_dsg_ts, ["stations"])
+    return len(added), len(removed)
+
+
 def insert_data_file_variable(sesh, cf, var_name, data_file):
     """Insert a ``DataFileVariable`` record corresponding to a named
     variable in a NetCDF file and associated to a specified DataFile record.
@@ -976,6 +1624,93 @@ def find_or_insert_data_file_variable(sesh, cf, var_name, data_file):
     return insert_data_file_variable(sesh, cf, var_name, data_file)
 
 
+def update_data_file_variable(sesh, cf, var_name, data_file_variable):
+    """Update an existing ``DataFileVariable`` record in place so that it
+    corresponds to a named variable in a NetCDF file. Only the columns whose
+    values differ are changed, so the record keeps its id, and with it its
+    ensemble memberships. Whether the variable is disabled is preserved.
+
+    :param sesh: modelmeta database session
+    :param cf: CFDatafile object representing NetCDF file
+    :param var_name: (str) name of variable
+    :param data_file_variable: (DataFileVariable) record to update; its
+        subtype must match the sampling geometry of ``cf``
+    :return: (list) names of the attributes changed
+    """
+    variable = cf.variables[var_name]
+    range_min, range_max, range_source = get_var_range(sesh, cf, var_name)
+    values = {
+        "variable_alias": find_or_insert_variable_alias(sesh, cf, var_name),
+        "range_min": stored_float(range_min),
+        "range_max": stored_float(range_max),
+        "range_source": range_source,
+        "variable_cell_methods": getattr(variable, "cell_methods", None),
+    }
+    assert values["variable_alias"]
+    if cf.sampling_geometry == "gridded":
+        values["level_set"] = find_or_insert_level_set(sesh, cf, var_name)
+        values["grid"] = find_or_insert_grid(sesh, cf, var_name)
+        assert values["grid"]
+    changed = update_attributes(data_file_variable, values)
+    if cf.sampling_geometry != "gridded":
+        added, removed = reconcile_stations_of_data_file_variable_dsg_time_series(
+            sesh, cf, var_name, data_file_variable
+        )
+        if added or removed:
+            changed.append("stations")
+    if changed:
+        logger.info("Updated {} of variable '{}'".format(", ".join(changed), var_name))
+    return changed
+
+
+def reconcile_data_file_variables(sesh, cf, data_file):
+    """Bring the ``DataFileVariable`` records of an existing DataFile up to
+    date with the dependent variables in a NetCDF file: update the records of
+    variables still in the file, insert records for new variables, and delete
+    (with their ensemble associations) those of variables no longer in the
+    file or whose sampling geometry has changed.
+
+    :param sesh: modelmeta database session
+    :param cf: CFDatafile object representing NetCDF file
+    :param data_file: (DataFile) existing data file for ``cf``
+    :return: list of updated or inserted DataFileVariable records
+    """
+    var_names = cf.dependent_varnames()
+    DataFileVariableSubtype = data_file_variable_subtypes[cf.sampling_geometry]
+    existing = {}
+    stale = []
+    for dfv in data_file.data_file_variables:
+        if (
+            isinstance(dfv, DataFileVariableSubtype)
+            and dfv.netcdf_variable_name in var_names
+            and dfv.netcdf_variable_name not in existing
+        ):
+            existing[dfv.netcdf_variable_name] = dfv
+        else:
+            stale.append(dfv)
+
+    if stale:
+        logger.info(
+            "Removing variables {}".format(
+                ", ".join(repr(dfv.netcdf_variable_name) for dfv in stale)
+            )
+        )
+        delete_data_file_variables(sesh, stale)
+        sesh.flush()
+        sesh.expire(data_file, ["data_file_variables"])
+
+    data_file_variables = []
+    for var_name in var_names:
+        dfv = existing.get(var_name)
+        if dfv is None:
+            logger.info("Adding variable '{}'".format(var_name))
+            dfv = insert_data_file_variable(sesh, cf, var_name, data_file)
+        else:
+            update_data_file_variable(sesh, cf, var_name, dfv)
+        data_file_variables.append(dfv)
+    return data_file_variables
+
+
 def find_or_insert_data_file_variables(sesh, cf, data_file):
     """Find or insert DataFileVariable for all dependent variables in a
     NetCDF file, associated to a specified DataFile record.
@@ -994,6 +1729,92 @@ def find_or_insert_data_file_variables(sesh, cf, data_file):
 # Timeset, Time, ClimatologicalTime
 
 
+def timeset_content_hash(
+    calendar,
+    start_date,
+    end_date,
+    multi_year_mean,
+    time_resolution,
+    num_times,
+    timesteps,
+    climatology_bounds,
+):
+    """Return the content hash of a time set: a hash of its attributes, its
+    timesteps, and its climatology bounds, in order.
+
+    ``TimeSet.content_hash`` is unique, so a time set is found by a single
+    indexed lookup on its content hash, and only time sets with identical
+    timesteps are shared. Migration 0b6f93d4e1a8, which backfills content
+    hashes, must compute them identically.
+
+    :param timesteps: (iterable) timesteps (``datetime.datetime``)
+    :param climatology_bounds: (iterable) pairs of climatology bounds
+        (``datetime.datetime``); empty if the time set is not a multi-year mean
+    :return: (str) hex digest
+    """
+    lines = [
+        calendar,
+        start_date.isoformat(),
+        end_date.isoformat(),
+        str(bool(multi_year_mean)),
+        time_resolution,
+        str(int(num_times)),
+    ]
+    lines += ["t {}".format(timestep.isoformat()) for timestep in timesteps]
+    lines += [
+        "c {} {}".format(time_start.isoformat(), time_end.isoformat())
+        for time_start, time_end in climatology_bounds
+    ]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+@memoize_per_dataset
+def get_timeset_info(cf):
+    """Return a dict containing the information defining the ``TimeSet``
+    record corresponding to a NetCDF file.
+
+    This information is expensive to compute, and is needed both to find and
+    to insert the record, so it is cached.
+
+    :param cf: CFDatafile object representing NetCDF file
+    :return (dict)
+    """
+    start_date, end_date = to_datetime(
+        num2date(cf.nominal_time_span, cf.time_var.units, cf.time_var.calendar)
+    )
+    timesteps = to_datetime(cf.time_steps["datetime"])
+    if cf.is_multi_year_mean:
+        climatology_bounds = to_datetime(
+            num2date(
+                cf.climatology_bounds_values, cf.time_var.units, cf.time_var.calendar
+            )
+        )
+    else:
+        climatology_bounds = []
+    attributes = {
+        "calendar": cf.time_var.calendar,
+        "start_date": start_date,
+        "end_date": end_date,
+        "multi_year_mean": cf.is_multi_year_mean,
+        "time_resolution": cf.time_resolution,
+        "num_times": int(cf.time_var.size),  # convert from numpy representation
+    }
+    return {
+        "attributes": attributes,
+        "timesteps": timesteps,
+        "climatology_bounds": climatology_bounds,
+        "content_hash": timeset_content_hash(
+            timesteps=timesteps, climatology_bounds=climatology_bounds, **attributes
+        ),
+    }
+
+
+def cf_timeset_key(cf):
+    """Return the key that identifies the ``TimeSet`` record corresponding to
+    a NetCDF file in the dimension cache and in insert locks."""
+    return "time_sets", get_timeset_info(cf)["content_hash"]
+
+
 def find_timeset(sesh, cf):
     """Find existing ``TimeSet`` record corresponding to a NetCDF file.
 
@@ -1001,23 +1822,13 @@ def find_timeset(sesh, cf):
     :param cf: CFDatafile object representing NetCDF file
     :return: existing ``TimeSet`` record or None
     """
-    start_date, end_date = to_datetime(
-        num2date(cf.nominal_time_span, cf.time_var.units, cf.time_var.calendar)
-    )
+    key = cf_timeset_key(cf)
 
-    # Check for existing TimeSet matching this file's set of time values
-    # TODO: Verify encoding for TimeSet.calendar the same as for
-    # cf.time_var.calendar
-    return (
-        sesh.query(TimeSet)
-        .filter(TimeSet.start_date == start_date)
-        .filter(TimeSet.end_date == end_date)
-        .filter(TimeSet.multi_year_mean == cf.is_multi_year_mean)
-        .filter(TimeSet.time_resolution == cf.time_resolution)
-        .filter(TimeSet.num_times == int(cf.time_var.size))
-        .filter(TimeSet.calendar == cf.time_var.calendar)
-        .first()  # this is where the error is.
-    )
+    def find():
+        _, content_hash = key
+        return sesh.query(TimeSet).filter(TimeSet.content_hash == content_hash).first()
+
+    return find_cached(sesh, key, find)
 
 
 def insert_timeset(sesh, cf):
@@ -1028,51 +1839,48 @@ def insert_timeset(sesh, cf):
     :param cf: CFDatafile object representing NetCDF file
     :return: new ``TimeSet`` record
     """
-    start_date, end_date = to_datetime(
-        num2date(cf.nominal_time_span, cf.time_var.units, cf.time_var.calendar)
-    )
+    info = get_timeset_info(cf)
 
-    time_set = TimeSet(
-        calendar=cf.time_var.calendar,
-        start_date=start_date,
-        end_date=end_date,
-        multi_year_mean=cf.is_multi_year_mean,
-        num_times=int(cf.time_var.size),  # convert from numpy representation
-        time_resolution=cf.time_resolution,
-    )
+    time_set = TimeSet(content_hash=info["content_hash"], **info["attributes"])
     sesh.add(time_set)
+    sesh.flush()
 
     # TODO: Factor out inserts for Time and ClimatologicalTime as separate
     # functions
 
-    times = [
-        Time(
-            timeset=time_set,
-            time_idx=time_idx,
-            timestep=timestep,
-        )
-        for time_idx, timestep in enumerate(to_datetime(cf.time_steps["datetime"]))
-    ]
-    sesh.add_all(times)
+    bulk_insert(
+        sesh,
+        Time.__table__,
+        [
+            {
+                "time_set_id": time_set.id,
+                "time_idx": time_idx,
+                "timestep": timestep,
+            }
+            for time_idx, timestep in enumerate(info["timesteps"])
+        ],
+    )
 
     if cf.is_multi_year_mean:
-        climatology_bounds = to_datetime(
-            num2date(
-                cf.climatology_bounds_values, cf.time_var.units, cf.time_var.calendar
-            )
+        bulk_insert(
+            sesh,
+            ClimatologicalTime.__table__,
+            [
+                {
+                    "time_set_id": time_set.id,
+                    "time_idx": time_idx,
+                    "time_start": time_start,
+                    "time_end": time_end,
+                }
+                for time_idx, (time_start, time_end) in enumerate(
+                    info["climatology_bounds"]
+                )
+            ],
         )
-        climatological_times = [
-            ClimatologicalTime(
-                timeset=time_set,
-                time_idx=time_idx,
-                time_start=time_start,
-                time_end=time_end,
-            )
-            for time_idx, (time_start, time_end) in enumerate(climatology_bounds)
-        ]
-        sesh.add_all(climatological_times)
 
-    return time_set
+    sesh.expire(time_set, ["times", "climatological_times"])
+
+    return cache_inserted(sesh, cf_timeset_key(cf), time_set)
 
 
 def find_or_insert_timeset(sesh, cf):
@@ -1088,15 +1896,44 @@ def find_or_insert_timeset(sesh, cf):
     if cf.is_time_invariant:
         return None
 
+    with timed(sesh, "time_conversion"):
+        get_timeset_info(cf)
     time_set = find_timeset(sesh, cf)
     if time_set:
         return time_set
+    if lock_for_insert(sesh, *cf_timeset_key(cf)):
+        time_set = find_timeset(sesh, cf)
+        if time_set:
+            return time_set
     return insert_timeset(sesh, cf)
 
 
 # DataFile
 
 
+def query_data_file_identities(sesh):
+    """Return a query for DataFile records that loads only the columns needed
+    to identify a file and decide how to index it. Other columns and related
+    records are loaded only if they are accessed.
+
+    :param sesh: modelmeta database session
+    :return: query
+    """
+    return sesh.query(DataFile).options(
+        load_only(
+            DataFile.id,
+            DataFile.unique_id,
+            DataFile.first_1mib_md5sum,
+            DataFile.filename,
+            DataFile.index_time,
+            DataFile.file_size,
+            DataFile.file_mtime_ns,
+            DataFile.file_inode,
+        ),
+        lazyload("*"),
+    )
+
+
 def find_data_file_by_id_hash_filename(sesh, cf):
     """Find and return DataFile records matching file unique id, file hash,
     and filename.
@@ -1106,15 +1943,53 @@ def find_data_file_by_id_hash_filename(sesh, cf):
     :return: tuple of DataFiles matching unique id, hash, filename
         (None in a component if no match)
     """
-    q = sesh.query(DataFile).filter(DataFile.unique_id == cf.unique_id)
-    id_match = q.first()
-    q = sesh.query(DataFile).filter(DataFile.first_1mib_md5sum == cf.first_MiB_md5sum)
-    hash_match = q.first()
-    q = sesh.query(DataFile).filter(
-        DataFile.filename == cf.filepath(converter=filepath_converter)
+    with timed(sesh, "md5"):
+        first_1mib_md5sum = cf.first_MiB_md5sum
+    (matches,) = find_data_files_by_id_hash_filename(
+        sesh, [(cf.unique_id, first_1mib_md5sum, cf_realpath(cf))]
     )
-    filename_match = q.first()
-    return id_match, hash_match, filename_match
+    return matches
+
+
+def find_data_files_by_id_hash_filename(sesh, identities):
+    """Find DataFile records matching the unique ids, file hashes, and
+    filenames of several files, with one query.
+
+    :param sesh: modelmeta database session
+    :param identities: list of tuples (unique id, first MiB MD5 sum, real
+        path) identifying files
+    :return: list of tuples of DataFiles matching unique id, hash, filename
+        (None in a component if no match), one for each file in
+        ``identities``
+    """
+    if not identities:
+        return []
+    unique_ids, first_1mib_md5sums, filenames = (set(c) for c in zip(*identities))
+    with timed(sesh, "lookup"):
+        candidates = (
+            query_data_file_identities(sesh)
+            .filter(
+                or_(
+                    DataFile.unique_id.in_(unique_ids),
+                    DataFile.first_1mib_md5sum.in_(first_1mib_md5sums),
+                    DataFile.filename.in_(filenames),
+                )
+            )
+            .order_by(DataFile.id)
+            .all()
+        )
+
+    def first_match(attribute, value):
+        return next((df for df in candidates if getattr(df, attribute) == value), None)
+
+    return [
+        (
+            first_match("unique_id", unique_id),
+            first_match("first_1mib_md5sum", first_1mib_md5sum),
+            first_match("filename", filename),
+        )
+        for unique_id, first_1mib_md5sum, filename in identities
+    ]
 
 
 def insert_data_file(sesh, cf):  # create.data.file.id
@@ -1136,7 +2011,7 @@ def insert_data_file(sesh, cf):  # create.data.file.id
     dim_names = cf.axes_dim()
 
     df = DataFile(
-        filename=cf.filepath(converter=filepath_converter),
+        filename=cf_realpath(cf),
         first_1mib_md5sum=cf.first_MiB_md5sum,
         unique_id=cf.unique_id,
         index_time=datetime.datetime.now(datetime.timezone.utc),
@@ -1146,6 +2021,7 @@ def insert_data_file(sesh, cf):  # create.data.file.id
         y_dim_name=dim_names.get("Y", None),
         z_dim_name=dim_names.get("Z", None),
         t_dim_name=dim_names.get("T", None),
+        **file_status(cf.filepath()),
     )
     sesh.add(df)
     return df
@@ -1164,25 +2040,17 @@ def delete_data_file_variable(sesh, existing_data_file_variable):
     sesh.delete(existing_data_file_variable)
 
 
-def delete_data_file(sesh, existing_data_file):
-    """Delete existing ``DataFile`` object, associated ``DataFileVariable``s,
-    and the associations of those ``DataFileVariable``s to ``Ensemble``s
-    (via object ``EnsembleDataFileVariables``).
+def delete_data_file_variables(sesh, existing_data_file_variables):
+    """Delete existing ``DataFileVariable`` objects and their associations to
+    ``Ensemble``s (via object ``EnsembleDataFileVariables``).
     Existing ``Ensemble``s are preserved.
 
     :param sesh: modelmeta database session
-    :param existing_data_file: DataFile object representing data file to be
-        deleted and re-inserted
+    :param existing_data_file_variables: list of DataFileVariable objects to
+        be deleted
     """
-    logger.info(
-        "Deleting DataFile for unique_id '{}'".format(existing_data_file.unique_id)
-    )
-    # TODO: Deleting the associated ``DataFileVariable``s and
-    # ``EnsembleDataFileVariables`` should be unnecessary because
-    # cascading deletes are declared for these relationships.
     # TODO: Also delete associations with `QCFlag`s?
     # (via `DataFileVariablesQcFlag`)
-    existing_data_file_variables = existing_data_file.data_file_variables
     existing_ensemble_data_file_variables = sesh.query(
         EnsembleDataFileVariables
     ).filter(
@@ -1194,26 +2062,118 @@ def delete_data_file(sesh, existing_data_file):
         sesh.delete(edfv)
     for dfv in existing_data_file_variables:
         delete_data_file_variable(sesh, dfv)
+
+
+def delete_data_file(sesh, existing_data_file):
+    """Delete existing ``DataFile`` object, associated ``DataFileVariable``s,
+    and the associations of those ``DataFileVariable``s to ``Ensemble``s
+    (via object ``EnsembleDataFileVariables``).
+    Existing ``Ensemble``s are preserved.
+
+    :param sesh: modelmeta database session
+    :param existing_data_file: DataFile object representing data file to be
+        deleted and re-inserted
+    """
+    logger.info(
+        "Deleting DataFile for unique_id '{}'".format(existing_data_file.unique_id)
+    )
+    # TODO: Deleting the associated ``DataFileVariable``s and
+    # ``EnsembleDataFileVariables`` should be unnecessary because
+    # cascading deletes are declared for these relationships.
+    delete_data_file_variables(sesh, existing_data_file.data_file_variables)
     sesh.delete(existing_data_file)
 
 
 # Root functions
 
 
+def update_attributes(obj, values):
+    """Set those attributes of obj that differ from the given values, leaving
+    the others untouched so that they are not written to the database.
+
+    :param obj: object to update
+    :param values: (dict) maps attribute name to value
+    :return: (list) names of the attributes changed
+    """
+    changed = [key for key, value in values.items() if getattr(obj, key) != value]
+    for key in changed:
+        setattr(obj, key, values[key])
+    return changed
+
+
+def update_data_file_status(data_file, filepath):
+    """Update the file status recorded for data_file, if it has changed."""
+    update_attributes(data_file, file_status(filepath))
+
+
 def update_data_file_index_time(sesh, data_file):
-    """Update the index time recorded for data_file"""
+    """Update the index time (and file status) recorded for data_file"""
     logger.info("Updating index time (only)")
     data_file.index_time = datetime.datetime.now(datetime.timezone.utc)
+    update_data_file_status(data_file, data_file.filename)
     return data_file
 
 
 def update_data_file_filename(sesh, data_file, cf):
-    """Update the filename recorded for data_file with the cf filename."""
+    """Update the filename (and file status) recorded for data_file with the
+    cf filename."""
     logger.info("Updating filename (only)")
-    data_file.filename = cf.filepath(converter=filepath_converter)
+    data_file.filename = cf_realpath(cf)
+    update_data_file_status(data_file, cf.filepath())
     return data_file
 
 
+def find_unchanged_data_file(sesh, filename):
+    """Find the DataFile for a file whose status (size, modification time,
+    inode) is the same as when it was indexed. This does not open the file.
+
+    :param sesh: modelmeta database session
+    :param filename: file name of NetCDF file
+    :return: DataFile for unchanged file, or None if the file is not indexed
+        or may have changed
+    """
+    status = file_status(filename)
+    return (
+        query_data_file_identities(sesh)
+        .filter(DataFile.filename == os.path.realpath(filename))
+        .filter(DataFile.file_size == status["file_size"])
+        .filter(DataFile.file_mtime_ns == status["file_mtime_ns"])
+        .filter(DataFile.file_inode == status["file_inode"])
+        .first()
+    )
+
+
+def find_unchanged_data_files(sesh, filenames):
+    """Find the DataFiles for those of several files whose status (size,
+    modification time, inode) is the same as when they were indexed, with one
+    query. This does not open the files.
+
+    :param sesh: modelmeta database session
+    :param filenames: list of file names of NetCDF files
+    :return: dict mapping file name to DataFile, for unchanged files only
+    """
+    statuses = {}
+    for filename in filenames:
+        try:
+            statuses[os.path.realpath(filename)] = filename, file_status(filename)
+        except OSError:
+            pass
+    if not statuses:
+        return {}
+    unchanged = {}
+    for data_file in (
+        query_data_file_identities(sesh)
+        .filter(DataFile.filename.in_(statuses))
+        .order_by(DataFile.id)
+    ):
+        filename, status = statuses[data_file.filename]
+        if filename not in unchanged and all(
+            getattr(data_file, key) == value for key, value in status.items()
+        ):
+            unchanged[filename] = data_file
+    return unchanged
+
+
 def index_cf_file(sesh, cf):
     """Insert records for a NetCDF known not to be in the database yet.
 
@@ -1226,63 +2186,105 @@ def index_cf_file(sesh, cf):
     return data_file
 
 
-def reindex_cf_file(sesh, existing_data_file, cf):
-    """Delete the existing modelmeta content for a data file and insert it
-    again de novo.
-    Return the new DataFile object.
+def reconcile_data_file(sesh, data_file, cf):
+    """Update an existing DataFile in place so that it represents a NetCDF
+    file: change the columns that differ, then reconcile its variables (see
+    ``reconcile_data_file_variables``).
 
     :param sesh: modelmeta database session
-    :param existing_data_file: DataFile object representing data file to be
-        deleted and re-inserted
+    :param data_file: DataFile object representing data file to be updated
     :param cf: CFDatafile object representing NetCDF file
-    :return: DataFile entry for file
+    :return: (list) names of the DataFile attributes changed
     """
-    logger.info("Reindexing file")
-    delete_data_file(sesh, existing_data_file)
-    return index_cf_file(sesh, cf)
+    timeset = find_or_insert_timeset(sesh, cf)
+    assert timeset or cf.is_time_invariant
+    run = find_or_insert_run(sesh, cf)
+    assert run
+    dim_names = cf.axes_dim()
+    changed = update_attributes(
+        data_file,
+        dict(
+            filename=cf_realpath(cf),
+            first_1mib_md5sum=cf.first_MiB_md5sum,
+            unique_id=cf.unique_id,
+            run=run,
+            timeset=timeset,
+            x_dim_name=dim_names.get("X", None),
+            y_dim_name=dim_names.get("Y", None),
+            z_dim_name=dim_names.get("Z", None),
+            t_dim_name=dim_names.get("T", None),
+            **file_status(cf.filepath()),
+        ),
+    )
+    data_file.index_time = datetime.datetime.now(datetime.timezone.utc)
+    if changed:
+        logger.info("Updated {} of DataFile".format(", ".join(changed)))
+    reconcile_data_file_variables(sesh, cf, data_file)
+    return changed
 
 
-def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
-    """Find, update, or insert a NetCDF file in the modelmeta database,
-    according to whether it is already present and up to date.
+def reindex_cf_file(sesh, existing_data_file, cf):
+    """Bring the existing modelmeta content for a data file up to date with
+    the file, in place. Unlike deleting the content and inserting it again de
+    novo, this keeps the ids of the DataFile and of the DataFileVariables of
+    variables still in the file, and their ensemble memberships.
 
     :param sesh: modelmeta database session
+    :param existing_data_file: DataFile object representing data file to be
+        updated
     :param cf: CFDatafile object representing NetCDF file
     :return: DataFile entry for file
-
-    The algorithm is a sequence of tests for conditions corresponding to what
-    relation the input NetCDF file may bear to the existing database: e.g.,
-    a new file, an already-known file, a modified file, etc. This sequence
-    deliberately avoids nesting if statements, which has proven confusing and
-    hard to maintain. The flip side of this choice is that we may not have
-    exhausted all possible cases. This situation is signalled by the final
-    statements after all the if statements.
     """
-    logger.info("Processing file: {}".format(cf.filepath(converter=filepath_converter)))
-    id_match, hash_match, filename_match = find_data_file_by_id_hash_filename(sesh, cf)
-
-    def log_data_files(log):
-        def log_data_file(label, df):
-            log("{}.id = {}".format(label, df and df.id))
-
-        log_data_file("id_match", id_match)
-        log_data_file("hash_match", hash_match)
-        log_data_file("filename_match", filename_match)
-
+    logger.info("Reindexing file")
+    reconcile_data_file(sesh, existing_data_file, cf)
+    return existing_data_file
+
+
+# Reasons for skipping files in each case (see ``classify_data_file``) in which
+# an indexed file needs no changes.
+skip_reasons = {
+    "symlink": "file is symlink to an indexed file",
+    "copy": "file is a copy of an indexed file",
+    "different_unique_id": "file already already indexed under different unique id",
+}
+
+# Cases in which an indexed file must be indexed again.
+reindex_actions = ("modified", "moved_modified")
+
+
+def classify_data_file(filepath, id_match, hash_match, filename_match):
+    """Classify a NetCDF file according to what relation it bears to the
+    existing database, i.e., to the DataFiles that match its unique id, hash,
+    and filename (see ``find_data_file_by_id_hash_filename``).
+
+    The classification is a sequence of tests for conditions corresponding to
+    what relation the input NetCDF file may bear to the existing database:
+    e.g., a new file, an already-known file, a modified file, etc. This
+    sequence deliberately avoids nesting if statements, which has proven
+    confusing and hard to maintain. The flip side of this choice is that we
+    may not have exhausted all possible cases. This situation is signalled by
+    the action "unanticipated".
+
+    :param filepath: path of NetCDF file
+    :param id_match: DataFile matching its unique id, or None
+    :param hash_match: DataFile matching its hash, or None
+    :param filename_match: DataFile matching its filename, or None
+    :return: tuple (action, data_file): the case the file falls into, which is
+        one of "new", "conflict" (the matches are not all the same DataFile),
+        "same", "moved", one of ``skip_reasons``, one of ``reindex_actions``,
+        or "unanticipated"; and the DataFile matched, or None if there is no
+        single one
+    """
     matches = tuple(df for df in (id_match, hash_match, filename_match) if df)
 
     # new file
     if len(matches) == 0:
-        return index_cf_file(sesh, cf)
+        return "new", None
 
     # multiple entries for same file: more than one match, but they are
     # not all the same
     if len(set(matches)) != 1:
-        logger.error("Multiple entries for same file, not all the same:")
-        log_data_files(logger.error)
-        raise ValueError(
-            "Multiple entries for same file, not all the same. " "See log for details."
-        )
+        return "conflict", None
 
     # At this point, we know that all matches are the same DataFile object,
     # so the following values are valid and consistent for all cases.
@@ -1292,15 +2294,11 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
     # rather than delegating it to ``cf.filepath()`` as everywhere else.
     normalized_filenames_match = os.path.realpath(
         data_file.filename
-    ) == os.path.realpath(cf.filepath())
-    cf_modification_time = os.path.getmtime(cf.filepath())
+    ) == os.path.realpath(filepath)
+    cf_modification_time = os.path.getmtime(filepath)
     data_file_index_time = seconds_since_epoch(data_file.index_time)
     index_up_to_date = data_file_index_time > cf_modification_time
 
-    def skip_file(reason):
-        logger.info("Skipping file: {}".format(reason))
-        return data_file
-
     # same file
     if (
         id_match
@@ -1309,7 +2307,7 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
         and id_match == hash_match == filename_match
         and index_up_to_date
     ):
-        return update_data_file_index_time(sesh, data_file)
+        return "same", data_file
 
     # symlinked file (modified or not)
     if (
@@ -1318,7 +2316,7 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
         and old_filename_exists
         and normalized_filenames_match
     ):
-        return skip_file("file is symlink to an indexed file")
+        return "symlink", data_file
 
     # copy of file
     if (
@@ -1328,7 +2326,7 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
         and old_filename_exists
         and not normalized_filenames_match
     ):
-        return skip_file("file is a copy of an indexed file")
+        return "copy", data_file
 
     # moved file
     if (
@@ -1338,23 +2336,23 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
         and not old_filename_exists
         and index_up_to_date
     ):
-        return update_data_file_filename(sesh, data_file, cf)
+        return "moved", data_file
 
     # indexed under different unique id
     if not id_match and hash_match and filename_match:
-        return skip_file("file already already indexed under different unique id")
+        return "different_unique_id", data_file
 
     # modified file (hash changed)
     if id_match and not hash_match and filename_match:
-        return reindex_cf_file(sesh, data_file, cf)
+        return "modified", data_file
 
     # modified file (modification time changed, but not hash?)
     if id_match and filename_match and not index_up_to_date:
-        return reindex_cf_file(sesh, data_file, cf)
+        return "modified", data_file
 
     # moved and modified file (hash changed)
     if id_match and not hash_match and not filename_match and not old_filename_exists:
-        return reindex_cf_file(sesh, data_file, cf)
+        return "moved_modified", data_file
 
     # moved and modified file (modification time changed)
     if (
@@ -1363,11 +2361,9 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
         and not old_filename_exists
         and not index_up_to_date
     ):
-        return reindex_cf_file(sesh, data_file, cf)
+        return "moved_modified", data_file
 
     # Oops, missed something. We think this won't happen, but ...
-    logger.error("Encountered an unanticipated case:")
-    log_data_files(logger.error)
     logger.error(
         "old_filename_exists = {}; "
         "normalized_filenames_match = {}; "
@@ -1375,41 +2371,619 @@ def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
             old_filename_exists, normalized_filenames_match, index_up_to_date
         )
     )
+    return "unanticipated", data_file
+
+
+def find_update_or_insert_cf_file(sesh, cf):  # get.data.file.id
+    """Find, update, or insert a NetCDF file in the modelmeta database,
+    according to whether it is already present and up to date (see
+    ``classify_data_file``). The file is locked (see ``lock_data_file``)
+    until the end of the transaction.
+
+    :param sesh: modelmeta database session
+    :param cf: CFDatafile object representing NetCDF file
+    :return: DataFile entry for file
+    """
+    logger.info("Processing file: {}".format(cf_realpath(cf)))
+    # Another indexer may be indexing this file, under this path or another;
+    # classify it only once that indexer has committed.
+    with timed(sesh, "lock"):
+        lock_data_file(sesh, cf)
+    id_match, hash_match, filename_match = find_data_file_by_id_hash_filename(sesh, cf)
+
+    def log_data_files(log):
+        def log_data_file(label, df):
+            log("{}.id = {}".format(label, df and df.id))
+
+        log_data_file("id_match", id_match)
+        log_data_file("hash_match", hash_match)
+        log_data_file("filename_match", filename_match)
+
+    action, data_file = classify_data_file(
+        cf.filepath(), id_match, hash_match, filename_match
+    )
+
+    if action == "new":
+        return index_cf_file(sesh, cf)
+
+    if action == "conflict":
+        logger.error("Multiple entries for same file, not all the same:")
+        log_data_files(logger.error)
+        raise ValueError(
+            "Multiple entries for same file, not all the same. " "See log for details."
+        )
+
+    def skip_file(reason):
+        logger.info("Skipping file: {}".format(reason))
+        return data_file
+
+    if action == "same":
+        if not indexing_option(sesh, "touch_skipped"):
+            return skip_file("file is already indexed")
+        return update_data_file_index_time(sesh, data_file)
+
+    if action in skip_reasons:
+        return skip_file(skip_reasons[action])
+
+    if action == "moved":
+        return update_data_file_filename(sesh, data_file, cf)
+
+    if action in reindex_actions:
+        return reindex_cf_file(sesh, data_file, cf)
+
+    logger.error("Encountered an unanticipated case:")
+    log_data_files(logger.error)
     raise ValueError("Unanticipated case. See log for details.")
 
 
-def index_netcdf_file(filename, Session):
+def find_update_or_insert_netcdf_file(sesh, filename):
+    """Find, update, or insert a NetCDF file in the modelmeta database,
+    according to whether it is already present and up to date.
+
+    With indexing option ``fast_skip``, a file that is unchanged since it was
+    indexed is recognized from its file status, and is not opened.
+
+    :param sesh: modelmeta database session
+    :param filename: file name of NetCDF file
+    :return: DataFile entry for file
+    """
+    if indexing_option(sesh, "fast_skip"):
+        data_file = find_unchanged_data_file(sesh, filename)
+        if data_file:
+            logger.info("Skipping unchanged file: {}".format(filename))
+            if indexing_option(sesh, "touch_skipped"):
+                update_data_file_index_time(sesh, data_file)
+            return data_file
+    with timed(sesh, "open"):
+        cf = CFDataset(filename)
+    with cf:
+        return find_update_or_insert_cf_file(sesh, cf)
+
+
+def record_file(sesh, filename):
+    """Count a file indexed in the timings of a session, if it has any."""
+    timings = session_timings(sesh)
+    if timings is not None:
+        timings.add_file(filename)
+
+
+def index_netcdf_file(filename, Session, attempts=2, errors=None):
     """Index a NetCDF file: insert or update records in the modelmeta database
     that identify it.
 
+    When several indexers run concurrently, a file's transaction can be
+    aborted by a deadlock with another indexer. Such failures are transient,
+    and the file is retried up to ``attempts`` times in all.
+
     :param filename: file name of NetCDF file
     :param Session: database session factory for access to modelmeta database
+    :param attempts: (int) maximum number of times to try indexing the file
+    :param errors: (dict) if the file cannot be indexed, a description of the
+        exception raised is recorded here under its absolute file name; None
+        for none
     :return: database id (``DataFile.id``) for file indexed
     """
-    session = Session()
-    data_file_id = None
     filename = os.path.abspath(filename)
+    for attempt in range(1, attempts + 1):
+        session = Session()
+        data_file_id = None
+        try:
+            with statement_scope(session, filename, logger), timed(session, "file"):
+                data_file_id = find_update_or_insert_netcdf_file(session, filename).id
+                with timed(session, "flush"):
+                    session.flush()
+                with timed(session, "commit"):
+                    session.commit()
+            record_file(session, filename)
+            return data_file_id
+        except:
+            session.rollback()
+            if attempt < attempts and is_transient_db_error(sys.exc_info()[1]):
+                logger.warning(
+                    "Transient database error; retrying file: {}".format(filename)
+                )
+                continue
+            logger.error(traceback.format_exc())
+            if errors is not None:
+                errors[filename] = describe_exception(sys.exc_info()[1])
+            return None
+        finally:
+            session.close()
+
+
+def index_netcdf_file_in_savepoint(
+    filename, session, attempts=2, errors=None, defer_transient=False
+):
+    """Index a NetCDF file within a savepoint in an ongoing transaction. If
+    indexing fails, only the changes made for this file are rolled back.
+
+    :param filename: file name of NetCDF file
+    :param session: database session, with a transaction in progress
+    :param attempts: (int) maximum number of times to try indexing the file
+    :param errors: (dict) see ``index_netcdf_file``
+    :param defer_transient: (bool) on a transient database error (see
+        ``is_transient_db_error``), roll back the savepoint and raise the
+        error, rather than retry the file in this transaction
+    :return: database id (``DataFile.id``) for file indexed; None if the file
+        could not be indexed
+    """
+    filename = os.path.abspath(filename)
+    for attempt in range(1, attempts + 1):
+        savepoint = session.begin_nested()
+        try:
+            with statement_scope(session, filename, logger), timed(session, "file"):
+                data_file_id = find_update_or_insert_netcdf_file(session, filename).id
+                with timed(session, "flush"):
+                    session.flush()
+            savepoint.commit()
+            record_file(session, filename)
+            return data_file_id
+        except:
+            savepoint.rollback()
+            if is_transient_db_error(sys.exc_info()[1]):
+                if defer_transient:
+                    raise
+                if attempt < attempts:
+                    logger.warning(
+                        "Transient database error; retrying file: {}".format(filename)
+                    )
+                    continue
+            logger.error(traceback.format_exc())
+            if errors is not None:
+                errors[filename] = describe_exception(sys.exc_info()[1])
+            return None
+
+
+def index_netcdf_files_in_batches(
+    filenames, Session, batch_size, batch_seconds=None, on_commit=None, errors=None
+):
+    """Index a list of NetCDF files, several files per transaction.
+
+    Files are added to a batch, each in its own savepoint, until the batch
+    holds ``batch_size`` files or has been open for ``batch_seconds``; the
+    batch is then committed. A file that fails to index is rolled back alone.
+    If a batch fails to commit, its files are indexed again one per
+    transaction.
+
+    A batch holds the locks of the files it has indexed (see
+    ``lock_data_file``) until it commits, so batches in concurrent workers
+    that index overlapping files in different orders can deadlock. Postgres
+    detects this and aborts the statement of one of the batches. Retrying
+    that file within its batch would only deadlock again, because the batch
+    still holds the locks that the other batch is waiting for. Instead, the
+    file's savepoint is rolled back (releasing only its own locks), so that
+    the other batch can go on, and the file is deferred: it is indexed in a
+    transaction of its own once its batch has committed. Likewise for
+    serialization failures.
+
+    The size and commit latency of each batch are logged.
+
+    :param filenames: iterable of files to index
+    :param Session: database session factory for access to modelmeta database
+    :param batch_size: (int) maximum number of files per transaction
+    :param batch_seconds: (float) maximum time a batch is open before it is
+        committed; None for no limit
+    :param on_commit: function called with the list of DataFile ids of each
+        batch (None for each file that could not be indexed) once the batch
+        is committed; None for no function
+    :param errors: (dict) see ``index_netcdf_file``
+    :return: list of DataFile ids, one for each file indexed, in the same order
+        as ``filenames``; None for each file that could not be indexed
+    """
+    data_file_ids = []
+    batch_sizes = []
+    commit_latencies = []
+    session = Session()
+
+    def commit_batch(batch, batch_ids):
+        batch_ids = try_commit_batch(batch, batch_ids)
+        if on_commit is not None:
+            on_commit(batch_ids)
+        return batch_ids
+
+    def try_commit_batch(batch, batch_ids):
+        commit_start = time.monotonic()
+        try:
+            with timed(session, "commit"):
+                session.commit()
+        except:
+            session.rollback()
+            logger.error(traceback.format_exc())
+            logger.warning(
+                "Failed to commit batch of {} files; indexing them "
+                "individually".format(len(batch))
+            )
+            deferred.clear()
+            return [
+                index_netcdf_file(filename, Session, errors=errors)
+                for filename in batch
+            ]
+        latency = time.monotonic() - commit_start
+        batch_sizes.append(len(batch))
+        commit_latencies.append(latency)
+        logger.info(
+            "Committed batch of {} files in {:.3f} s".format(len(batch), latency)
+        )
+        # The batch no longer holds any locks, so deferred files can be
+        # indexed now.
+        for position in deferred:
+            batch_ids[position] = index_netcdf_file(
+                batch[position], Session, errors=errors
+            )
+        deferred.clear()
+        return batch_ids
+
     try:
-        with CFDataset(filename) as cf:
-            data_file = find_update_or_insert_cf_file(session, cf)
-            data_file_id = data_file.id
-        session.commit()
-    except:
-        logger.error(traceback.format_exc())
-        session.rollback()
+        batch, batch_ids = [], []
+        # Positions in the batch of files deferred after a transient error
+        deferred = []
+        batch_start = time.monotonic()
+        for filename in filenames:
+            batch.append(filename)
+            try:
+                data_file_id = index_netcdf_file_in_savepoint(
+                    filename, session, errors=errors, defer_transient=True
+                )
+            except OperationalError as e:
+                logger.warning(
+                    "Transient database error ({}); deferring file until its "
+                    "batch is committed: {}".format(str(e.orig).strip(), filename)
+                )
+                deferred.append(len(batch_ids))
+                data_file_id = None
+            batch_ids.append(data_file_id)
+            if len(batch) >= batch_size or (
+                batch_seconds is not None
+                and time.monotonic() - batch_start >= batch_seconds
+            ):
+                data_file_ids.extend(commit_batch(batch, batch_ids))
+                batch, batch_ids = [], []
+                batch_start = time.monotonic()
+        if batch:
+            data_file_ids.extend(commit_batch(batch, batch_ids))
     finally:
         session.close()
-    return data_file_id
 
+    if batch_sizes:
+        logger.info(
+            "Committed {} batches; mean batch size {:.1f} files; "
+            "commit latency mean {:.3f} s, max {:.3f} s".format(
+                len(batch_sizes),
+                sum(batch_sizes) / len(batch_sizes),
+                sum(commit_latencies) / len(commit_latencies),
+                max(commit_latencies),
+            )
+        )
+    return data_file_ids
+
+
+def prewarm_dimension_cache(sesh, cache):
+    """Load all dimension records in the database into a dimension cache,
+    with one query per table.
+
+    :param sesh: modelmeta database session, in a fresh transaction
+    :param cache: ``DimensionCache`` to load
+    """
+    for model in sesh.query(Model):
+        cache.preload(model_key(model.short_name), model)
+    for emission in sesh.query(Emission):
+        cache.preload(emission_key(emission.short_name), emission)
+    for run, model_short_name, emission_short_name in (
+        sesh.query(Run, Model.short_name, Emission.short_name)
+        .join(Run.model)
+        .join(Run.emission)
+    ):
+        cache.preload(run_key(model_short_name, emission_short_name, run.name), run)
+    for variable_alias in sesh.query(VariableAlias):
+        cache.preload(
+            variable_alias_key(
+                variable_alias.long_name,
+                variable_alias.standard_name,
+                variable_alias.units,
+            ),
+            variable_alias,
+        )
+    for spatial_ref_sys in sesh.query(SpatialRefSys).filter(
+        SpatialRefSys.auth_name == "PCIC"
+    ):
+        cache.preload(spatial_ref_sys_key(spatial_ref_sys.srtext), spatial_ref_sys)
+    for grid in sesh.query(Grid):
+        cache.preload(
+            grid_key(
+                grid.srid,
+                grid.xc_count,
+                grid.yc_count,
+                grid.xc_origin,
+                grid.yc_origin,
+                grid.xc_grid_step,
+                grid.yc_grid_step,
+                grid.evenly_spaced_y,
+            ),
+            grid,
+        )
+    for level_set in sesh.query(LevelSet).filter(LevelSet.fingerprint.isnot(None)):
+        cache.preload(("level_sets", level_set.fingerprint), level_set)
+    for time_set in sesh.query(TimeSet).filter(TimeSet.content_hash.isnot(None)):
+        cache.preload(("time_sets", time_set.content_hash), time_set)
+    logger.info("Prewarmed dimension cache with {} records".format(len(cache)))
+
+
+def indexing_session_factory(
+    dsn, prewarm_cache=False, timings=None, statements=None, **options
+):
+    """Return a session factory for indexing files into a modelmeta database.
+    Sessions created by it share a dimension cache, stage timings and, if
+    given, a statement counter.
+
+    :param dsn: connection info for the modelmeta database
+    :param prewarm_cache: (bool) load all dimension records into the cache
+        before any files are indexed
+    :param timings: (``StageTimings``) timings to record stages of indexing
+        in; None for new timings
+    :param statements: (``mm_cataloguer.statements.StatementCounter``)
+        counter to record the statements executed in; None for none
+    :param options: indexing options (see ``default_indexing_options``)
+    :return: session factory (``sessionmaker``)
+    """
+    for name in options:
+        if name not in default_indexing_options:
+            raise ValueError("Unknown indexing option: {}".format(name))
+    engine = install_statement_counter(create_engine(dsn), statements)
+    Session = sessionmaker(
+        bind=engine,
+        info={"indexing_options": options, statements_info_key: statements},
+    )
+    cache = DimensionCache()
+    cache.install(Session)
+    (timings or StageTimings()).install(Session)
+    if prewarm_cache:
+        session = Session()
+        try:
+            prewarm_dimension_cache(session, cache)
+        finally:
+            session.close()
+    return Session
+
+
+# Parallel indexing. Each worker process has its own engine and session
+# factory, created when the worker starts.
+
+_worker_Session = None
+
+
+def _init_worker(dsn, prewarm_cache, count_statements, options):
+    global _worker_Session
+    _worker_Session = indexing_session_factory(
+        dsn,
+        prewarm_cache=prewarm_cache,
+        statements=StatementCounter() if count_statements else None,
+        **options,
+    )
+
+
+# Workers return the timings and statement counts recorded for each task
+# along with its result, so that those of the whole run can be collected.
 
-def index_netcdf_files(filenames, dsn):
-    """Index a list of NetCDF files into a modelmeta database.
+
+def _worker_records():
+    info = _worker_Session.kw["info"]
+    statements = info[statements_info_key]
+    return (
+        info[timings_info_key].drain(),
+        statements.drain() if statements is not None else None,
+    )
+
+
+def _index_netcdf_file_in_worker(filename):
+    return (index_netcdf_file(filename, _worker_Session),) + _worker_records()
+
+
+def _index_netcdf_batch_in_worker(filenames, batch_seconds=None):
+    return (
+        index_netcdf_files_in_batches(
+            filenames, _worker_Session, len(filenames), batch_seconds=batch_seconds
+        ),
+    ) + _worker_records()
+
+
+def log_failures(filenames, data_file_ids):
+    """Log the files that were not indexed.
 
     :param filenames: list of files to index
+    :param data_file_ids: list of results of indexing, in the same order as
+        ``filenames``; None for a file that could not be indexed
+    :return: list of files that could not be indexed
+    """
+    failures = [
+        filename
+        for filename, data_file_id in zip(filenames, data_file_ids)
+        if data_file_id is None
+    ]
+    if failures:
+        logger.error(
+            "Failed to index {} of {} files:".format(len(failures), len(filenames))
+        )
+        for filename in failures:
+            logger.error("    {}".format(filename))
+    return failures
+
+
+def index_netcdf_files(
+    filenames,
+    dsn,
+    jobs=1,
+    files_per_worker=None,
+    prewarm_cache=False,
+    batch_size=1,
+    batch_seconds=None,
+    journal=None,
+    timings=None,
+    statements=None,
+    **options,
+):
+    """Index a list of NetCDF files into a modelmeta database.
+
+    With ``jobs`` > 1, files are indexed in parallel by a pool of worker
+    processes. Each worker has its own database engine and indexes each file in
+    its own session. Because reading NetCDF files can leave memory allocated in
+    the netCDF4/HDF5 libraries, a worker can be replaced by a fresh process
+    after it has indexed ``files_per_worker`` files.
+
+    Dimension records (models, runs, grids, time sets, etc.) found or inserted
+    while indexing are cached, so that files sharing them do not need to query
+    for them again. Each worker process has its own cache.
+
+    With ``batch_size`` > 1, up to ``batch_size`` files share one transaction
+    (see ``index_netcdf_files_in_batches``). In parallel, each worker is given
+    a batch of files at a time, and ``files_per_worker`` is rounded down to a
+    whole number of batches.
+
+    ``filenames`` is consumed lazily, so it can be a generator (e.g., of files
+    found by ``mm_cataloguer.crawl.crawl``) that is still finding files while
+    earlier ones are indexed.
+
+    With a ``journal`` (``mm_cataloguer.journal.Journal``), the outcome of
+    each file is recorded in it once committed, and files that the journal
+    says need not be indexed again (see ``Journal.skip``) are skipped.
+
+    The time taken by each stage of indexing each file is recorded in
+    ``timings``, including in worker processes, and a summary is logged at
+    the end of the run. So are the statements executed, if a ``statements``
+    counter is given; the statements executed for each file are logged as it
+    is indexed.
+
+    :param filenames: iterable of files to index
     :param dsn: connection info for the modelmeta database to update
-    :return: list of DataFile objects for each file indexed
+    :param jobs: (int) number of worker processes; 1 indexes all files in
+        this process
+    :param files_per_worker: (int) number of files a worker indexes before
+        it is replaced; None means workers are never replaced
+    :param prewarm_cache: (bool) load all existing dimension records into the
+        cache before indexing any files
+    :param batch_size: (int) maximum number of files indexed per transaction
+    :param batch_seconds: (float) with ``batch_size`` > 1, maximum time a
+        transaction is held open before it is committed; None for no limit
+    :param journal: (``Journal``) journal of the run; None for no journal
+    :param timings: (``mm_cataloguer.timings.StageTimings``) timings to record
+        stages of indexing in; None for new timings
+    :param statements: (``mm_cataloguer.statements.StatementCounter``)
+        counter to record the statements executed in; None for none
+    :param options: indexing options (see ``default_indexing_options``)
+    :return: list of DataFile ids, one for each file indexed, in the same order
+        as ``filenames``; None for each file that could not be indexed. A
+        file skipped because of the journal has the id recorded for it.
     """
-    engine = create_engine(dsn)
-    Session = sessionmaker(bind=engine)
+    if timings is None:
+        timings = StageTimings()
+    # All files taken from ``filenames``, and the ids reported for them
+    taken_filenames = []
+    data_file_ids = []
+    # Files to be indexed, in the order they are taken, with their positions
+    # in ``taken_filenames``
+    indexed_filenames = []
+    positions = []
+
+    def taken(filenames):
+        for filename in filenames:
+            taken_filenames.append(filename)
+            data_file_ids.append(None)
+            if journal is not None:
+                skip, data_file_ids[-1] = journal.skip(filename)
+                if skip:
+                    continue
+            indexed_filenames.append(filename)
+            positions.append(len(taken_filenames) - 1)
+            yield filename
+
+    filenames = taken(filenames)
+    if batch_size > 1:
+        tasks = iter(lambda: list(itertools.islice(filenames, batch_size)), [])
+    else:
+        tasks = filenames
+    # Number of files whose results have been received
+    done = 0
+
+    def receive(results):
+        # Results arrive in the same order as the tasks they are for
+        nonlocal done
+        for result in results:
+            if jobs > 1:
+                result, worker_timings, worker_statements = result
+                timings.merge(worker_timings)
+                if statements is not None:
+                    statements.merge(worker_statements)
+            ids = result if batch_size > 1 else [result]
+            for position, data_file_id in zip(positions[done:], ids):
+                data_file_ids[position] = data_file_id
+            if journal is not None:
+                journal.record(indexed_filenames[done : done + len(ids)], ids)
+            done += len(ids)
+
+    if jobs > 1:
+        if batch_size > 1:
+            index_task = functools.partial(
+                _index_netcdf_batch_in_worker, batch_seconds=batch_seconds
+            )
+            if files_per_worker is not None:
+                files_per_worker = max(1, files_per_worker // batch_size)
+        else:
+            index_task = _index_netcdf_file_in_worker
+        with multiprocessing.Pool(
+            processes=jobs,
+            initializer=_init_worker,
+            initargs=(dsn, prewarm_cache, statements is not None, options),
+            maxtasksperchild=files_per_worker,
+        ) as pool:
+            receive(pool.imap(index_task, tasks))
+            pool.close()
+            pool.join()
+    else:
+        Session = indexing_session_factory(
+            dsn,
+            prewarm_cache=prewarm_cache,
+            timings=timings,
+            statements=statements,
+            **options,
+        )
+        if batch_size > 1:
+            index_netcdf_files_in_batches(
+                filenames,
+                Session,
+                batch_size,
+                batch_seconds=batch_seconds,
+                on_commit=lambda batch_ids: receive([batch_ids]),
+            )
+        else:
+            receive(index_netcdf_file(f, Session) for f in tasks)
 
-    return [index_netcdf_file(f, Session) for f in filenames]
+    if len(indexed_filenames) < len(taken_filenames):
+        logger.info(
+            "Skipped {} files recorded in journal".format(
+                len(taken_filenames) - len(indexed_filenames)
+            )
+        )
+    log_failures(indexed_filenames, [data_file_ids[position] for position in positions])
+    timings.log_summary(logger)
+    if statements is not None:
+        statements.log_summary(logger)
+    return data_file_ids
@@ -0,0 +1,167 @@
+"""Checkpoint journal for resumable indexing runs.
+
+A long indexing run that is interrupted (by a reboot, a database failover,
+etc.) would otherwise have to start again from its first file. A ``Journal``
+is a local SQLite file to which the outcome of each file is appended as soon
+as it is committed to the modelmeta database: the file's ``DataFile`` id, or
+a failure. A run resumed from the journal skips the files already indexed, so
+its cost is proportional to the work remaining.
+
+Failed files are retried when a run is resumed, but with exponential backoff:
+a file that has failed ``n`` times in a row is retried only once
+``retry_seconds * 2 ** (n - 1)`` seconds (at most ``max_retry_seconds``) have
+passed since its last attempt. Transient failures are retried promptly, while
+a file that cannot be indexed does not hold up every resumed run.
+
+Each journal records one run, with its resumptions; outcomes are keyed by
+absolute file path.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from mm_cataloguer.index_netcdf import handler
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(handler)
+logger.setLevel(logging.DEBUG)
+
+
+class Journal:
+    """Append-only record of the outcome of indexing each file in a run.
+
+    :param path: path of the journal file, created if it does not exist
+    :param resume: (bool) resume the run recorded in the journal; if False,
+        any outcomes already recorded are discarded
+    :param retry_seconds: (float) delay before a file that has failed once is
+        retried; doubled for each further consecutive failure
+    :param max_retry_seconds: (float) maximum delay before a failed file is
+        retried
+    """
+
+    def __init__(
+        self, path, resume=False, retry_seconds=60, max_retry_seconds=24 * 3600
+    ):
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        # When indexing in parallel, files are taken (and so checked against
+        # the journal) in a thread of the worker pool.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        # The journal need only survive a crash of this process, which WAL
+        # with synchronous=NORMAL guarantees without an fsync per outcome.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outcomes ("
+                "id INTEGER PRIMARY KEY, "
+                "filename TEXT NOT NULL, "
+                "data_file_id INTEGER, "
+                "recorded_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS outcomes_filename_idx "
+                "ON outcomes (filename, id)"
+            )
+            if not resume:
+                discarded = self.connection.execute("DELETE FROM outcomes").rowcount
+                if discarded:
+                    logger.warning(
+                        "Discarded {} outcomes from journal {}; use resume to "
+                        "resume its run".format(discarded, path)
+                    )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, filenames, data_file_ids):
+        """Append the outcomes of indexing files to the journal.
+
+        :param filenames: list of files indexed
+        :param data_file_ids: list of DataFile ids, in the same order as
+            ``filenames``; None for each file that could not be indexed
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO outcomes (filename, data_file_id, recorded_at) "
+                "VALUES (?, ?, ?)",
+                [
+                    (os.path.abspath(filename), data_file_id, now)
+                    for filename, data_file_id in zip(filenames, data_file_ids)
+                ],
+            )
+
+    def previous_outcome(self, filename):
+        """Return the recorded outcome of indexing a file.
+
+        :param filename: file name
+        :return: tuple (data_file_id, failures, last_attempt): the DataFile id
+            if the file was indexed, otherwise None; the number of times it
+            has failed since it was last indexed; and the time (seconds since
+            the epoch) of the last attempt. None if the file has no outcome.
+        """
+        filename = os.path.abspath(filename)
+        with self.lock:
+            return self._previous_outcome(filename)
+
+    def _previous_outcome(self, filename):
+        last = self.connection.execute(
+            "SELECT id, data_file_id, recorded_at FROM outcomes "
+            "WHERE filename = ? ORDER BY id DESC LIMIT 1",
+            (filename,),
+        ).fetchone()
+        if last is None:
+            return None
+        _, data_file_id, last_attempt = last
+        if data_file_id is not None:
+            return data_file_id, 0, last_attempt
+        (failures,) = self.connection.execute(
+            "SELECT count(*) FROM outcomes WHERE filename = ? AND id > coalesce("
+            "(SELECT max(id) FROM outcomes "
+            "WHERE filename = ? AND data_file_id IS NOT NULL), 0)",
+            (filename, filename),
+        ).fetchone()
+        return None, failures, last_attempt
+
+    def retry_delay(self, failures):
+        """Return the delay before retrying a file that has failed
+        ``failures`` times in a row."""
+        return min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+
+    def skip(self, filename):
+        """Return whether a file need not be indexed in a resumed run, and the
+        DataFile id to report for it.
+
+        A file is skipped if it has been indexed, or if it has failed and
+        its retry delay has not passed.
+
+        :param filename: file name
+        :return: tuple (skip, data_file_id)
+        """
+        outcome = self.previous_outcome(filename)
+        if outcome is None:
+            return False, None
+        data_file_id, failures, last_attempt = outcome
+        if data_file_id is not None:
+            return True, data_file_id
+        delay = self.retry_delay(failures)
+        if time.time() - last_attempt < delay:
+            logger.info(
+                "Not retrying file yet (failed {} times; retrying after {:.0f} s): "
+                "{}".format(failures, delay, filename)
+            )
+            return True, None
+        return False, None
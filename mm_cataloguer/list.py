@@ -2,6 +2,8 @@
 Functions to support list script.
 """
 
+import logging
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import func
@@ -9,6 +11,16 @@ from sqlalchemy import func
 import sqlparse
 
 from modelmeta import DataFile, DataFileVariable, Ensemble, TimeSet
+from mm_cataloguer.index_netcdf import handler
+from mm_cataloguer.statements import (
+    StatementCounter,
+    install as install_statement_counter,
+)
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(handler)
+logger.setLevel(logging.DEBUG)
 
 
 # argument parser helpers
@@ -202,9 +214,12 @@ def list_filepaths(args):
         list_ensembles
     """.split()
     )
-    engine = create_engine(args.dsn)
+    statements = StatementCounter() if args.count_statements else None
+    engine = install_statement_counter(create_engine(args.dsn), statements)
     session = sessionmaker(bind=engine)()
     _list_filepaths(session, **{key: getattr(args, key) for key in arg_names})
+    if statements is not None:
+        statements.log_summary(logger)
 
 
 def list_dirpaths(args):
@@ -214,6 +229,9 @@ def list_dirpaths(args):
         depth
     """.split()
     )
-    engine = create_engine(args.dsn)
+    statements = StatementCounter() if args.count_statements else None
+    engine = install_statement_counter(create_engine(args.dsn), statements)
     session = sessionmaker(bind=engine)()
     _list_dirpaths(session, **{key: getattr(args, key) for key in arg_names})
+    if statements is not None:
+        statements.log_summary(logger)
@@ -0,0 +1,377 @@
+"""Index plans: classification of files before indexing.
+
+Indexing a file first classifies it according to its relation to the DataFiles
+already in the database (see ``mm_cataloguer.index_netcdf.classify_data_file``)
+and then acts on that: a new file is indexed, a modified one re-indexed, a
+moved one has its filename updated, and so on. Done file by file, each
+classification costs a database query inside the file's transaction.
+
+``plan_netcdf_files`` instead classifies all the files in a pre-pass that
+queries the database in bulk, a chunk of files per query, and produces a plan:
+a ``PlanEntry`` (file, action, DataFile id, file status) for each file. A plan
+can be written to a file (one JSON object per line), reviewed (``index_netcdf
+--dry-run``), and executed later by ``execute_plan``, which handles each kind
+of action as a whole: DataFiles that need only their index time or filename
+updated are updated together, files that need no changes are not touched, and
+only the files that must be (re-)indexed are passed to the indexer.
+
+Files to be (re-)indexed are classified again, under the usual locks, when
+they are indexed. A file whose DataFile is updated in place is locked and
+checked against its plan first: if its status (size, modification time,
+inode) is not what it was when it was planned, or a file it was moved from
+exists again, it too is passed to the indexer to be classified again. So a
+plan that has become stale does no harm.
+"""
+
+from collections import Counter, namedtuple
+import datetime
+import itertools
+import json
+import logging
+import os
+
+from sqlalchemy import bindparam, create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from nchelpers import CFDataset
+
+from modelmeta import DataFile
+from mm_cataloguer.index_netcdf import (
+    cf_realpath,
+    classify_data_file,
+    data_file_lock_keys,
+    file_status,
+    handler,
+    find_data_files_by_id_hash_filename,
+    find_unchanged_data_files,
+    index_netcdf_files,
+    is_transient_db_error,
+    lock_data_files,
+    query_data_file_identities,
+    reindex_actions,
+    skip_reasons,
+)
+from mm_cataloguer.statements import install as install_statement_counter
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(handler)
+logger.setLevel(logging.DEBUG)
+
+
+class PlanEntry(
+    namedtuple("PlanEntry", "filename action data_file_id status", defaults=(None,))
+):
+    """What to do with a file: ``action`` is an action returned by
+    ``classify_data_file``, or "unreadable" if the file could not be
+    classified; ``data_file_id`` is the id of the DataFile it matches, or
+    None; ``status`` is the status (see ``file_status``) of the file when it
+    was classified, or None if it could not be read."""
+
+    def to_json(self):
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, line):
+        return cls(**json.loads(line))
+
+
+# Actions for which the file is passed to the indexer
+index_actions = ("new",) + reindex_actions
+
+# Actions that are errors
+error_actions = ("conflict", "unanticipated", "unreadable")
+
+
+def file_identity(filename):
+    """Return the identity of a file: (unique id, first MiB MD5 sum, real
+    path)."""
+    with CFDataset(filename) as cf:
+        return cf.unique_id, cf.first_MiB_md5sum, cf_realpath(cf)
+
+
+def plan_files(sesh, filenames, fast_skip=False):
+    """Classify a list of files.
+
+    :param sesh: modelmeta database session
+    :param filenames: list of absolute file names of NetCDF files
+    :param fast_skip: (bool) classify a file whose status (size, modification
+        time, inode) is unchanged since it was indexed as "same" without
+        opening it
+    :return: list of PlanEntry, one for each file, in the same order
+    """
+    # The status of a file is read before its identity, so that a file
+    # modified in between does not match its plan when the plan is executed.
+    statuses = {}
+    for filename in filenames:
+        try:
+            statuses[filename] = file_status(filename)
+        except OSError:
+            pass
+    unchanged = find_unchanged_data_files(sesh, filenames) if fast_skip else {}
+    identities = {}
+    for filename in filenames:
+        if filename in unchanged:
+            continue
+        try:
+            identities[filename] = file_identity(filename)
+        except Exception as e:
+            logger.error("Cannot classify file {}: {}".format(filename, e))
+    matches = dict(
+        zip(
+            identities,
+            find_data_files_by_id_hash_filename(sesh, list(identities.values())),
+        )
+    )
+
+    def entry(filename):
+        status = statuses.get(filename)
+        if filename in unchanged:
+            return PlanEntry(filename, "same", unchanged[filename].id, status)
+        if filename not in matches:
+            return PlanEntry(filename, "unreadable", None, status)
+        action, data_file = classify_data_file(filename, *matches[filename])
+        return PlanEntry(filename, action, data_file and data_file.id, status)
+
+    return [entry(filename) for filename in filenames]
+
+
+def plan_netcdf_files(
+    filenames, dsn, fast_skip=False, chunk_size=1000, statements=None
+):
+    """Classify NetCDF files in bulk, querying the database for a chunk of
+    files at a time.
+
+    :param filenames: iterable of file names; consumed lazily
+    :param dsn: connection info for the modelmeta database
+    :param fast_skip: (bool) see ``plan_files``
+    :param chunk_size: (int) number of files classified per query
+    :param statements: (``mm_cataloguer.statements.StatementCounter``)
+        counter to record the statements executed in; None for none
+    :return: generator of PlanEntry, one for each file, in the same order
+    """
+    Session = sessionmaker(
+        bind=install_statement_counter(create_engine(dsn), statements)
+    )
+    filenames = iter(filenames)
+    session = Session()
+    try:
+        for chunk in iter(lambda: list(itertools.islice(filenames, chunk_size)), []):
+            chunk = [os.path.abspath(filename) for filename in chunk]
+            yield from plan_files(session, chunk, fast_skip=fast_skip)
+            # Do not hold a transaction open while waiting for more files
+            session.rollback()
+    finally:
+        session.close()
+
+
+def write_plan(plan, file):
+    """Write a plan to a file, one JSON object per line.
+
+    :param plan: iterable of PlanEntry
+    :param file: file open for writing
+    :return: list of PlanEntry written
+    """
+    entries = []
+    for entry in plan:
+        file.write(entry.to_json() + "\n")
+        entries.append(entry)
+    return entries
+
+
+def read_plan(file):
+    """Read a plan written by ``write_plan``.
+
+    :param file: file open for reading
+    :return: list of PlanEntry
+    """
+    return [PlanEntry.from_json(line) for line in file if line.strip()]
+
+
+def log_plan(entries):
+    """Log the number of files for each action in a plan."""
+    counts = Counter(entry.action for entry in entries)
+    logger.info(
+        "Plan for {} files: {}".format(
+            len(entries),
+            ", ".join(
+                "{} {}".format(count, action) for action, count in counts.most_common()
+            ),
+        )
+    )
+
+
+def current_status(entry):
+    """Return the status of the file of a plan entry, if it is unchanged since
+    the file was planned; otherwise None."""
+    try:
+        status = file_status(entry.filename)
+    except OSError:
+        return None
+    return status if status == entry.status else None
+
+
+def update_data_files(sesh, entries, values):
+    """Update the DataFiles of plan entries, with one statement, if their
+    files are as they were planned.
+
+    The files are first locked against other indexers (see
+    ``lock_data_file``), and then checked. An entry is stale if its file's
+    status has changed since it was planned, if its DataFile has been deleted
+    or now records another file, or, for a moved file, if the file it was
+    moved from exists again. The DataFiles of stale entries are not updated.
+
+    :param sesh: modelmeta database session
+    :param entries: list of PlanEntry, each with action "same" or "moved"
+    :param values: function returning a dict of column values for an entry,
+        other than its file status
+    :return: list of ids of DataFiles updated, one for each entry; None for
+        each stale entry, whose file must be classified again
+    """
+    data_file_ids = [entry.data_file_id for entry in entries]
+    unique_ids = dict(
+        sesh.query(DataFile.id, DataFile.unique_id).filter(
+            DataFile.id.in_(data_file_ids)
+        )
+    )
+    keys = set()
+    for entry in entries:
+        if entry.data_file_id in unique_ids:
+            keys |= data_file_lock_keys(
+                unique_ids[entry.data_file_id], os.path.realpath(entry.filename)
+            )
+    lock_data_files(sesh, keys)
+
+    # Now that the files are locked, their DataFiles cannot change under us.
+    data_files = {
+        data_file.id: data_file
+        for data_file in query_data_file_identities(sesh)
+        .filter(DataFile.id.in_(data_file_ids))
+        .populate_existing()
+    }
+
+    def is_current(entry, data_file):
+        if data_file is None or data_file.unique_id != unique_ids[data_file.id]:
+            return False
+        if entry.action == "moved":
+            return not os.path.isfile(data_file.filename)
+        return data_file.filename == os.path.realpath(entry.filename)
+
+    rows = []
+    ids = []
+    for entry in entries:
+        data_file = data_files.get(entry.data_file_id)
+        status = current_status(entry)
+        if status is None or not is_current(entry, data_file):
+            logger.info("File changed since it was planned: {}".format(entry.filename))
+            ids.append(None)
+            continue
+        rows.append(dict(values(entry), **status, b_data_file_id=data_file.id))
+        ids.append(data_file.id)
+    if rows:
+        table = DataFile.__table__
+        sesh.execute(
+            update(table).where(table.c.data_file_id == bindparam("b_data_file_id")),
+            rows,
+        )
+    return ids
+
+
+def execute_plan(entries, dsn, touch_skipped=True, **kwargs):
+    """Execute an index plan.
+
+    Files classified "same" have their index time (and file status) updated,
+    unless ``touch_skipped`` is False. Moved files have their filename (and
+    file status) updated. These updates are made together, in one
+    transaction, for the files that are as they were planned (see
+    ``update_data_files``). Files that need no changes are skipped, and files
+    classified as errors are reported as failures. The remaining files,
+    including those that have changed since they were planned, are indexed by
+    ``mm_cataloguer.index_netcdf.index_netcdf_files``.
+
+    :param entries: list of PlanEntry
+    :param dsn: connection info for the modelmeta database to update
+    :param touch_skipped: (bool) update the index time of files that are
+        already indexed
+    :param kwargs: arguments for ``index_netcdf_files``
+    :return: list of DataFile ids, one for each entry, in the same order;
+        None for each file that could not be indexed
+    """
+    log_plan(entries)
+    positions = {}
+    for position, entry in enumerate(entries):
+        positions.setdefault(entry.action, []).append(position)
+    data_file_ids = [None] * len(entries)
+    # Positions of files that have changed since they were planned
+    stale = []
+
+    def execute(actions, execute_entries):
+        selected = [p for action in actions for p in positions.get(action, [])]
+        if not selected:
+            return
+        ids = execute_entries([entries[position] for position in selected])
+        for position, data_file_id in zip(selected, ids):
+            data_file_ids[position] = data_file_id
+
+    def skip(entries):
+        return [entry.data_file_id for entry in entries]
+
+    execute(list(skip_reasons), skip)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    updates = {
+        "moved": lambda entry: {"filename": os.path.realpath(entry.filename)},
+    }
+    if touch_skipped:
+        updates["same"] = lambda entry: {"index_time": now}
+    else:
+        execute(
+            ["same"],
+            lambda entries: [
+                entry.data_file_id if current_status(entry) else None
+                for entry in entries
+            ],
+        )
+        stale.extend(p for p in positions.get("same", []) if data_file_ids[p] is None)
+    update_positions = [p for action in updates for p in positions.get(action, [])]
+    session = sessionmaker(
+        bind=install_statement_counter(create_engine(dsn), kwargs.get("statements"))
+    )()
+    try:
+        for action, values in updates.items():
+            execute(
+                [action],
+                lambda entries: update_data_files(session, entries, values),
+            )
+        session.commit()
+        stale.extend(p for p in update_positions if data_file_ids[p] is None)
+    except Exception as e:
+        # E.g., a deadlock with an indexer locking the same files in another
+        # order. Leave these files to the indexer, which locks them one at a
+        # time.
+        session.rollback()
+        if not is_transient_db_error(e):
+            raise
+        logger.warning("Cannot update files as planned: {}".format(e))
+        stale.extend(update_positions)
+    finally:
+        session.close()
+
+    index_positions = [p for action in index_actions for p in positions.get(action, [])]
+    index_positions += stale
+    if index_positions:
+        ids = index_netcdf_files(
+            [entries[position].filename for position in index_positions],
+            dsn,
+            touch_skipped=touch_skipped,
+            **kwargs,
+        )
+        for position, data_file_id in zip(index_positions, ids):
+            data_file_ids[position] = data_file_id
+
+    for action in error_actions:
+        for position in positions.get(action, []):
+            logger.error(
+                "Not indexing file ({}): {}".format(action, entries[position].filename)
+            )
+    return data_file_ids
@@ -0,0 +1,334 @@
+"""Counts and timings of the SQL statements issued to a database.
+
+A ``StatementCounter`` installed on a SQLAlchemy engine listens for every
+statement executed through it, and records the number of statements and the
+total time spent executing them, by kind (select, insert, update, ...) and by
+shape. The shape of a statement is its SQL with literals and bind parameters
+replaced by ``?``, and with lists of them (``IN`` lists, multi-row
+``VALUES``) collapsed, so that the same query issued for different files has
+the same shape. A query issued once per file, or once per row, is a shape
+with a large count.
+
+Counting is opt-in (``--count-statements`` on the scripts). The statements
+issued in one part of a run, e.g., for one file, are recorded separately by
+``StatementCounter.scope``; ``statement_scope`` does that for a session whose
+factory has a counter (see
+``mm_cataloguer.index_netcdf.indexing_session_factory``), and logs them.
+
+Statements executed directly on a DBAPI cursor, such as the ``COPY`` of
+``mm_cataloguer.bulk_insert``, are not seen by SQLAlchemy's events; they are
+recorded with ``record_statement``, together with the number of rows they
+loaded.
+
+``query_budget`` counts the statements issued in a block of code and fails if
+there are more than expected, so that tests can catch code that issues a query
+per item where one query would do.
+"""
+
+from contextlib import contextmanager
+import json
+import re
+import time
+
+from sqlalchemy import event
+
+
+session_info_key = "statement_counter"
+
+# Key in ``Connection.info`` of the start times of statements being executed
+_start_times_key = "statement_counter_start_times"
+
+# Counters installed, by the engine (or connection) they are installed on
+_installed = {}
+
+# Literals and bind parameters, in the paramstyles of the drivers we use.
+# ``::`` is a PostgreSQL cast, not a named parameter.
+_parameter = re.compile(
+    r"'(?:[^']|'')*'"  # string literal
+    r"|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"  # numeric literal
+    r"|%\(\w+\)s|%s"  # pyformat, format
+    r"|(?<!:):\w+"  # named
+    r"|\$\d+"  # numeric
+    r"|\?"  # qmark
+)
+_parameter_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_repeated_lists = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_whitespace = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Return the shape of a SQL statement: its text with literals and bind
+    parameters replaced by ``?``, lists of them replaced by ``(...)``, repeated
+    lists collapsed, and whitespace normalized."""
+    shape = _parameter.sub("?", statement)
+    shape = _parameter_list.sub("(...)", shape)
+    shape = _repeated_lists.sub("(...)", shape)
+    return _whitespace.sub(" ", shape).strip()
+
+
+def statement_kind(statement):
+    """Return the kind of a SQL statement: its first keyword, in lower case."""
+    words = statement.split(None, 1)
+    return words[0].lower() if words else ""
+
+
+class Tally:
+    """Number and total duration of a set of statements, and the number of
+    rows loaded by those that report it (``COPY``)."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+    def add(self, seconds, rows=0):
+        self.count += 1
+        self.seconds += seconds
+        self.rows += rows
+
+    def merge(self, other):
+        self.count += other.count
+        self.seconds += other.seconds
+        self.rows += other.rows
+
+
+class StatementCounts:
+    """Statements recorded, by kind and by shape."""
+
+    def __init__(self):
+        self.total = Tally()
+        # kind -> Tally
+        self.kinds = {}
+        # shape -> Tally
+        self.shapes = {}
+
+    def add(self, statement, seconds, rows=0):
+        """Record a statement, the time taken to execute it and the number of
+        rows it loaded."""
+        self.total.add(seconds, rows)
+        self.kinds.setdefault(statement_kind(statement), Tally()).add(seconds, rows)
+        self.shapes.setdefault(statement_shape(statement), Tally()).add(seconds, rows)
+
+    def merge(self, other):
+        """Add the statements recorded in another ``StatementCounts`` (e.g.,
+        by a worker process) to these."""
+        self.total.merge(other.total)
+        for kind, tally in other.kinds.items():
+            self.kinds.setdefault(kind, Tally()).merge(tally)
+        for shape, tally in other.shapes.items():
+            self.shapes.setdefault(shape, Tally()).merge(tally)
+
+    def count(self, kind=None):
+        """Return the number of statements recorded, or of those of one
+        kind."""
+        if kind is None:
+            return self.total.count
+        tally = self.kinds.get(kind)
+        return tally.count if tally is not None else 0
+
+    def describe(self):
+        """Return a one-line description of the statements recorded."""
+        return "{} statements ({}) in {:.3f} s".format(
+            self.total.count,
+            ", ".join(
+                "{} {}{}".format(
+                    tally.count,
+                    kind,
+                    " of {} rows".format(tally.rows) if tally.rows else "",
+                )
+                for kind, tally in sorted(
+                    self.kinds.items(), key=lambda item: -item[1].count
+                )
+            ),
+            self.total.seconds,
+        )
+
+    def summary(self):
+        """Return a summary of the statements recorded, as a dict. Shapes are
+        listed in decreasing order of total time."""
+
+        def tally(tally):
+            return {
+                "count": tally.count,
+                "total_seconds": tally.seconds,
+                "rows": tally.rows,
+            }
+
+        return {
+            "statements": tally(self.total),
+            "kinds": {kind: tally(t) for kind, t in sorted(self.kinds.items())},
+            "shapes": [
+                dict(tally(t), shape=shape)
+                for shape, t in sorted(
+                    self.shapes.items(), key=lambda item: -item[1].seconds
+                )
+            ],
+        }
+
+    def log_summary(self, logger, shapes=10):
+        """Log a summary of the statements recorded: the totals, and the
+        ``shapes`` shapes that took the longest in all."""
+        logger.info("Executed {}".format(self.describe()))
+        for shape, tally in sorted(
+            self.shapes.items(), key=lambda item: -item[1].seconds
+        )[:shapes]:
+            logger.info(
+                "{} times, total {:.3f} s: {}".format(tally.count, tally.seconds, shape)
+            )
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+
+class StatementCounter(StatementCounts):
+    """Records the statements executed through the engines it is installed
+    on."""
+
+    def __init__(self):
+        super().__init__()
+        # Counts of the scopes currently open, innermost last
+        self.scopes = []
+
+    def install(self, engine):
+        """Start recording the statements executed through an engine."""
+        event.listen(engine, "before_cursor_execute", self.before_execute)
+        event.listen(engine, "after_cursor_execute", self.after_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+        _installed.setdefault(engine, []).append(self)
+
+    def remove(self, engine):
+        """Stop recording the statements executed through an engine."""
+        event.remove(engine, "before_cursor_execute", self.before_execute)
+        event.remove(engine, "after_cursor_execute", self.after_execute)
+        event.remove(engine, "handle_error", self.handle_error)
+        counters = _installed[engine]
+        counters.remove(self)
+        if not counters:
+            del _installed[engine]
+
+    def before_execute(self, conn, cursor, statement, *args):
+        conn.info.setdefault(_start_times_key, []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, *args):
+        seconds = time.perf_counter() - conn.info[_start_times_key].pop()
+        self.record(statement, seconds)
+
+    def record(self, statement, seconds, rows=0):
+        """Record a statement in these counts and in the scopes open."""
+        self.add(statement, seconds, rows)
+        for counts in self.scopes:
+            counts.add(statement, seconds, rows)
+
+    def handle_error(self, context):
+        # A statement that fails is not recorded.
+        if context.connection is not None:
+            start_times = context.connection.info.get(_start_times_key)
+            if start_times:
+                start_times.pop()
+
+    @contextmanager
+    def scope(self):
+        """Record the statements executed in a block separately, in a new
+        ``StatementCounts``, as well as in these counts.
+
+        :return: context manager yielding the ``StatementCounts``
+        """
+        counts = StatementCounts()
+        self.scopes.append(counts)
+        try:
+            yield counts
+        finally:
+            self.scopes.remove(counts)
+
+    def drain(self):
+        """Return the statements recorded so far, as a ``StatementCounts``,
+        and clear them from this counter."""
+        drained = StatementCounts()
+        drained.merge(self)
+        self.total = Tally()
+        self.kinds = {}
+        self.shapes = {}
+        return drained
+
+
+def install(engine, counter):
+    """Install a statement counter on an engine, unless it is None.
+
+    :return: the engine
+    """
+    if counter is not None:
+        counter.install(engine)
+    return engine
+
+
+def record_statement(conn, statement, seconds, rows=0):
+    """Record a statement that was executed directly on a DBAPI cursor, and so
+    not seen by SQLAlchemy's events, in the counters installed on the
+    connection or its engine.
+
+    :param conn: SQLAlchemy connection the cursor belongs to
+    :param statement: (str) SQL statement
+    :param seconds: (float) time taken to execute it
+    :param rows: (int) number of rows it loaded
+    """
+    for target in (conn, conn.engine):
+        for counter in _installed.get(target, ()):
+            counter.record(statement, seconds, rows)
+
+
+def session_statement_counter(sesh):
+    """Return the ``StatementCounter`` of a session, or None if it has
+    none."""
+    return sesh.info.get(session_info_key)
+
+
+@contextmanager
+def statement_scope(sesh, name, logger):
+    """Record the statements executed in a block separately, if the session
+    has a statement counter, and log them when the block ends.
+
+    :param sesh: modelmeta database session
+    :param name: (str) name of what is done in the block, e.g., the file
+        being indexed
+    :param logger: logger to log the statements to, at level DEBUG
+    """
+    counter = session_statement_counter(sesh)
+    if counter is None:
+        yield
+        return
+    with counter.scope() as counts:
+        yield
+    logger.debug("{}: {}".format(name, counts.describe()))
+
+
+@contextmanager
+def query_budget(engine, max_statements, kind=None):
+    """Fail if more than ``max_statements`` statements (of the given kind, or
+    of any kind) are executed through an engine in a block.
+
+    :param engine: SQLAlchemy engine (or connection)
+    :param max_statements: (int) maximum number of statements
+    :param kind: (str) kind of statement counted (e.g., "select"); None for
+        all statements
+    :return: context manager yielding the ``StatementCounter``
+    :raises AssertionError: if the budget is exceeded
+    """
+    counter = StatementCounter()
+    counter.install(engine)
+    try:
+        yield counter
+    finally:
+        counter.remove(engine)
+    if counter.count(kind) > max_statements:
+        raise AssertionError(
+            "Executed {} {}statements, more than {}:\n{}".format(
+                counter.count(kind),
+                "" if kind is None else kind + " ",
+                max_statements,
+                "\n".join(
+                    "{} x {}".format(tally.count, shape)
+                    for shape, tally in counter.shapes.items()
+                    if kind is None or statement_kind(shape) == kind
+                ),
+            )
+        )
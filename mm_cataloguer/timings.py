@@ -0,0 +1,293 @@
+"""Stage timings and throughput of indexing runs.
+
+Indexing a file passes through several stages whose cost varies widely from
+one collection of files to another: opening the file, hashing its first MiB,
+finding matching DataFiles, converting its time values, computing variable
+ranges, and flushing and committing to the database. A ``StageTimings``
+records how long each stage takes, for every file, together with the number
+and total size of the files indexed, so that a slow run can be diagnosed.
+
+Timings are shared by the sessions created by one session factory (see
+``mm_cataloguer.index_netcdf.indexing_session_factory``), and are reached
+from a session through ``session.info``, like the dimension cache. Code being
+timed wraps each stage in ``timed(session, stage)``.
+
+A summary gives, for each stage, the number of times it ran, the total time,
+and the median, 95th percentile, and maximum duration; and for the run, the
+files and bytes indexed per second. It can be written as JSON, or in the
+Prometheus text exposition format for the node exporter's textfile collector.
+"""
+
+from contextlib import contextmanager
+import json
+import math
+import os
+import tempfile
+import time
+
+
+session_info_key = "stage_timings"
+
+
+class Stage:
+    """Durations of one stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Durations since the samples were last reset
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.samples.extend(other.samples)
+
+
+def percentile(values, fraction):
+    """Return a percentile of a list of values (nearest rank), or None if the
+    list is empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class StageTimings:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.start = clock() if clock is not None else None
+        # stage name -> Stage
+        self.stages = {}
+        self.files = 0
+        self.bytes = 0
+
+    def install(self, Session):
+        """Make these timings available to all sessions created by a session
+        factory.
+
+        :param Session: session factory (``sessionmaker``)
+        """
+        info = dict(Session.kw.get("info") or {})
+        info[session_info_key] = self
+        Session.configure(info=info)
+
+    def add(self, stage, seconds):
+        """Record the duration of a stage."""
+        self.stages.setdefault(stage, Stage()).add(seconds)
+
+    def add_file(self, filename):
+        """Record that a file has been indexed."""
+        self.files += 1
+        try:
+            self.bytes += os.path.getsize(filename)
+        except OSError:
+            pass
+
+    def merge(self, other):
+        """Add the timings recorded in another ``StageTimings`` (e.g., by a
+        worker process) to these."""
+        for name, stage in other.stages.items():
+            self.stages.setdefault(name, Stage()).merge(stage)
+        self.files += other.files
+        self.bytes += other.bytes
+
+    def drain(self):
+        """Return the timings recorded so far, as a new ``StageTimings``, and
+        clear them from these."""
+        drained = StageTimings(clock=None)
+        drained.stages, self.stages = self.stages, {}
+        drained.files, self.files = self.files, 0
+        drained.bytes, self.bytes = self.bytes, 0
+        return drained
+
+    def reset_samples(self):
+        """Discard the durations from which percentiles are computed, so that
+        later summaries describe only later files. Counts, totals and maxima
+        are kept."""
+        for stage in self.stages.values():
+            stage.samples = []
+
+    def __getstate__(self):
+        # Clocks need not be picklable; only the recorded values are sent
+        # between processes.
+        state = dict(self.__dict__)
+        state["clock"] = None
+        return state
+
+    def summary(self):
+        """Return a summary of the timings, as a dict."""
+        elapsed = self.clock() - self.start
+        return {
+            "elapsed_seconds": elapsed,
+            "files": self.files,
+            "bytes": self.bytes,
+            "files_per_second": self.files / elapsed if elapsed > 0 else None,
+            "bytes_per_second": self.bytes / elapsed if elapsed > 0 else None,
+            "stages": {
+                name: {
+                    "count": stage.count,
+                    "total_seconds": stage.total,
+                    "p50_seconds": percentile(stage.samples, 0.5),
+                    "p95_seconds": percentile(stage.samples, 0.95),
+                    "max_seconds": stage.max,
+                }
+                for name, stage in sorted(self.stages.items())
+            },
+        }
+
+    def log_summary(self, logger):
+        """Log a summary of the timings, one line per stage."""
+        summary = self.summary()
+        if summary["files_per_second"] is not None:
+            logger.info(
+                "Indexed {} files ({:.1f} MB) in {:.1f} s: {:.2f} files/s, "
+                "{:.2f} MB/s".format(
+                    summary["files"],
+                    summary["bytes"] / 1e6,
+                    summary["elapsed_seconds"],
+                    summary["files_per_second"],
+                    summary["bytes_per_second"] / 1e6,
+                )
+            )
+        for name, stage in summary["stages"].items():
+            if stage["p50_seconds"] is None:
+                continue
+            logger.info(
+                "Stage {}: {} times, total {:.3f} s; "
+                "p50 {:.4f} s, p95 {:.4f} s, max {:.4f} s".format(
+                    name,
+                    stage["count"],
+                    stage["total_seconds"],
+                    stage["p50_seconds"],
+                    stage["p95_seconds"],
+                    stage["max_seconds"],
+                )
+            )
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix="modelmeta_index", labels=None):
+        """Return the timings in the Prometheus text exposition format.
+
+        :param prefix: (str) prefix of metric names
+        :param labels: (dict) labels added to every sample, e.g., to tell
+            apart the reports of several workers; None for none
+        """
+        summary = self.summary()
+
+        def sample(name, value, **sample_labels):
+            label_text = ",".join(
+                '{}="{}"'.format(label, label_value)
+                for label, label_value in dict(labels or {}, **sample_labels).items()
+            )
+            return "{}_{}{} {}".format(
+                prefix, name, "{{{}}}".format(label_text) if label_text else "", value
+            )
+
+        lines = [
+            "# HELP {}_stage_seconds Duration of each stage of indexing "
+            "a file.".format(prefix),
+            "# TYPE {}_stage_seconds summary".format(prefix),
+        ]
+        for name, stage in summary["stages"].items():
+            for quantile, key in [("0.5", "p50_seconds"), ("0.95", "p95_seconds")]:
+                if stage[key] is not None:
+                    lines.append(
+                        sample(
+                            "stage_seconds", stage[key], stage=name, quantile=quantile
+                        )
+                    )
+            lines.append(
+                sample("stage_seconds_sum", stage["total_seconds"], stage=name)
+            )
+            lines.append(sample("stage_seconds_count", stage["count"], stage=name))
+        lines += [
+            "# HELP {}_stage_max_seconds Longest duration of each stage of "
+            "indexing a file.".format(prefix),
+            "# TYPE {}_stage_max_seconds gauge".format(prefix),
+        ] + [
+            sample("stage_max_seconds", stage["max_seconds"], stage=name)
+            for name, stage in summary["stages"].items()
+        ]
+        for name, kind, help, value in [
+            ("files_total", "counter", "Files indexed.", summary["files"]),
+            ("bytes_total", "counter", "Bytes of files indexed.", summary["bytes"]),
+            (
+                "files_per_second",
+                "gauge",
+                "Files indexed per second.",
+                summary["files_per_second"],
+            ),
+            (
+                "bytes_per_second",
+                "gauge",
+                "Bytes of files indexed per second.",
+                summary["bytes_per_second"],
+            ),
+        ]:
+            if value is None:
+                continue
+            lines += [
+                "# HELP {}_{} {}".format(prefix, name, help),
+                "# TYPE {}_{} {}".format(prefix, name, kind),
+                sample(name, value),
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=None, prometheus_path=None, prometheus_labels=None):
+        """Write the timings to files. Each file is replaced atomically, so
+        that it is never read half-written.
+
+        :param json_path: path of JSON summary file; None for none
+        :param prometheus_path: path of Prometheus textfile; None for none
+        :param prometheus_labels: (dict) labels added to every sample in the
+            Prometheus textfile; None for none
+        """
+        for path, content in [
+            (json_path, self.to_json),
+            (prometheus_path, lambda: self.to_prometheus(labels=prometheus_labels)),
+        ]:
+            if path is None:
+                continue
+            directory = os.path.dirname(os.path.abspath(path))
+            with tempfile.NamedTemporaryFile(
+                "w", dir=directory, prefix=".timings-", delete=False
+            ) as file:
+                file.write(content())
+            # Readable by collectors running as other users
+            os.chmod(file.name, 0o644)
+            os.replace(file.name, path)
+
+
+def session_timings(sesh):
+    """Return the ``StageTimings`` of a session, or None if it has none."""
+    return sesh.info.get(session_info_key)
+
+
+@contextmanager
+def timed(sesh, stage):
+    """Record the duration of a stage of indexing in the timings of a session
+    (if it has any).
+
+    :param sesh: modelmeta database session
+    :param stage: (str) name of stage
+    """
+    timings = session_timings(sesh)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - start)
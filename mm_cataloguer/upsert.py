@@ -0,0 +1,74 @@
+"""Race-free insertion of dimension records.
+
+Dimension records (``Model``, ``Emission``, ``Run``, ``VariableAlias``,
+``Station``) are shared by many files, and concurrent indexers may try to
+insert the same one at the same time. Inserting only after failing to find a
+record either duplicates it or, given a unique constraint, fails the
+transaction of the indexer that loses the race.
+
+Here a record is instead inserted with ``INSERT ... ON CONFLICT DO NOTHING``
+against the unique constraint on its identifying columns, which PostgreSQL
+and SQLite both support. If another transaction has inserted the record, the
+insert waits for it to commit and then does nothing, and the record is found
+instead. Inserting a new record takes one round trip.
+"""
+
+from sqlalchemy import inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# Dialect-specific INSERT constructs supporting ON CONFLICT
+dialect_inserts = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def insert_or_find(sesh, cls, values, key):
+    """Insert a record, or find the existing record with the same key.
+
+    :param sesh: database session
+    :param cls: mapped class of the record
+    :param values: (dict) maps attribute names to values for the record
+    :param key: (list of str) names of the attributes that identify the
+        record; there must be a unique constraint on their columns
+    :return: inserted or existing record, persistent in ``sesh``
+    """
+    insert = dialect_inserts[sesh.get_bind().dialect.name]
+    mapper = inspect(cls)
+    statement = (
+        insert(cls)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=[mapper.columns[name] for name in key])
+        .returning(cls)
+    )
+    record = sesh.scalars(statement).first()
+    if record is not None:
+        return record
+    return sesh.scalars(
+        select(cls).filter_by(**{name: values[name] for name in key})
+    ).one()
+
+
+def insert_ignoring_conflicts(sesh, table, rows, key):
+    """Insert rows into a table, skipping those that conflict with existing
+    rows (e.g., rows inserted by a concurrent transaction).
+
+    :param sesh: database session
+    :param table: (``sqlalchemy.Table``) table to insert rows into
+    :param rows: list of dicts mapping column name to value; all rows must have
+        the same keys
+    :param key: (list of str) names of the columns that identify a row; there
+        must be a unique constraint on them
+    :return: number of rows given
+    """
+    if not rows:
+        return 0
+    insert = dialect_inserts[sesh.get_bind().dialect.name]
+    sesh.execute(
+        insert(table).on_conflict_do_nothing(
+            index_elements=[table.c[name] for name in key]
+        ),
+        rows,
+    )
+    return len(rows)
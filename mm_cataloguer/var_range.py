@@ -0,0 +1,304 @@
+"""Range of values of a NetCDF variable.
+
+Reading the data of a large variable to find its range is by far the most
+expensive part of indexing a file, so the range is taken from metadata where
+possible:
+
+- the variable's ``actual_range`` attribute;
+- its ``valid_range`` (or ``valid_min`` and ``valid_max``) attributes, which
+  bound rather than describe its values, and are used only on request;
+- a sidecar statistics file, a JSON file next to the data file mapping
+  variable names to ``{"min": ..., "max": ...}``.
+
+Failing these, the data is read.
+
+``CFDataset.var_range`` reads a whole variable into memory, which is not
+feasible for the largest (e.g., high resolution, daily) data files. Here the
+variable is instead read in slabs no larger than a given memory budget, and
+the minimum and maximum of each slab are reduced to those of the variable.
+The slabs of a chunked variable are made of whole storage chunks, so that no
+chunk is decompressed more than once.
+
+Values are read through netCDF4 with its default automatic masking and
+scaling, so ``_FillValue``, ``missing_value`` and valid range attributes are
+honoured exactly as when the whole variable is read. NaNs are ignored.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import logging
+import math
+import numbers
+import os
+import threading
+
+import numpy as np
+
+
+# This module is imported by ``mm_cataloguer.index_netcdf``, so it cannot use
+# that module's log handler; its messages go to the root logger.
+logger = logging.getLogger(__name__)
+
+# Default memory budget for values read at any one time, in bytes.
+default_memory_budget = 256 * 2**20
+
+# Default suffix added to a data file name to form its sidecar statistics
+# file name.
+default_sidecar_suffix = ".stats.json"
+
+
+def unpacked(variable, value):
+    """Return a packed value of a variable (e.g., a valid range attribute)
+    in the units of its unpacked values."""
+    return value * getattr(variable, "scale_factor", 1) + getattr(
+        variable, "add_offset", 0
+    )
+
+
+def attribute_range(variable, use_valid_range=False):
+    """Return the range of values of a variable given by its attributes.
+
+    :param variable: (``netCDF4.Variable``) variable
+    :param use_valid_range: (bool) use the ``valid_range`` or ``valid_min``
+        and ``valid_max`` attributes if ``actual_range`` is absent
+    :return: tuple (min, max, name of attribute(s) used); None if the
+        attributes do not give a range
+    """
+    attributes = variable.ncattrs()
+    if "actual_range" in attributes:
+        # actual_range is of the same type as unpacked values.
+        actual_range = np.ravel(variable.getncattr("actual_range"))
+        if len(actual_range) == 2:
+            return actual_range[0], actual_range[1], "actual_range"
+    if not use_valid_range:
+        return None
+    if "valid_range" in attributes:
+        valid_range = np.ravel(variable.getncattr("valid_range"))
+        if len(valid_range) == 2:
+            return (
+                unpacked(variable, valid_range[0]),
+                unpacked(variable, valid_range[1]),
+                "valid_range",
+            )
+    if "valid_min" in attributes and "valid_max" in attributes:
+        return (
+            unpacked(variable, np.ravel(variable.getncattr("valid_min"))[0]),
+            unpacked(variable, np.ravel(variable.getncattr("valid_max"))[0]),
+            "valid_min_max",
+        )
+    return None
+
+
+def sidecar_range(filepath, var_name, suffix=default_sidecar_suffix):
+    """Return the range of values of a variable given by the sidecar
+    statistics file of a data file.
+
+    :param filepath: (str) file path of data file
+    :param var_name: (str) name of variable
+    :param suffix: (str) suffix added to ``filepath`` to form the sidecar
+        file path
+    :return: tuple (min, max); None if there is no sidecar file, or it does
+        not give a valid range (finite numbers, min <= max) for the variable
+    """
+    sidecar_filepath = filepath + suffix
+    if not os.path.isfile(sidecar_filepath):
+        return None
+    try:
+        with open(sidecar_filepath) as sidecar_file:
+            statistics = json.load(sidecar_file)
+    except (OSError, ValueError) as e:
+        logger.warning(
+            "Cannot read sidecar statistics file {}: {}".format(sidecar_filepath, e)
+        )
+        return None
+    if not isinstance(statistics, dict) or var_name not in statistics:
+        return None
+    entry = statistics[var_name]
+    range_ = (entry.get("min"), entry.get("max")) if isinstance(entry, dict) else ()
+
+    def is_finite_number(value):
+        return (
+            isinstance(value, numbers.Real)
+            and not isinstance(value, bool)
+            and math.isfinite(value)
+        )
+
+    if not (
+        len(range_) == 2
+        and all(is_finite_number(value) for value in range_)
+        and range_[0] <= range_[1]
+    ):
+        logger.warning(
+            "Invalid range for variable {} in sidecar statistics file {}: "
+            "{}".format(var_name, sidecar_filepath, entry)
+        )
+        return None
+    return range_
+
+
+def element_size(variable):
+    """Return the number of bytes needed in memory for each value read from a
+    variable, including its mask."""
+    if hasattr(variable, "scale_factor") or hasattr(variable, "add_offset"):
+        # Packed values are unpacked to floating point.
+        itemsize = max(variable.dtype.itemsize, np.dtype(np.float64).itemsize)
+    else:
+        itemsize = variable.dtype.itemsize
+    return itemsize + np.dtype(np.bool_).itemsize
+
+
+def slabs(shape, chunk_shape, element_bytes, memory_budget):
+    """Partition an array into slabs no larger than a memory budget.
+
+    A chunked array is partitioned into tiles of whole storage chunks, so that
+    each chunk is read (and decompressed) exactly once. A tile spans as many
+    chunks as the budget allows along the innermost dimensions first, so that
+    the array is split along its outermost dimensions. A chunk larger than the
+    budget is partitioned on its own, as a contiguous array is; the parts of a
+    chunk are read one after another, while the chunk is in the chunk cache.
+
+    A slab of a contiguous array is a run of indices along one dimension (the
+    outermost one for which a single index fits the budget), a single index
+    along each dimension outside it, and the whole of each dimension inside
+    it.
+
+    :param shape: (tuple) shape of the array
+    :param chunk_shape: (tuple) shape of storage chunks, or None if the array
+        is stored contiguously
+    :param element_bytes: (int) memory needed for each element read
+    :param memory_budget: (int) maximum memory for any one slab, in bytes
+    :return: generator of tuples of slices, one per dimension
+    """
+    if len(shape) == 0:
+        yield ()
+        return
+    if 0 in shape:
+        return
+
+    if chunk_shape is not None:
+        # Chunks may be larger than the array (e.g., along an unlimited
+        # dimension).
+        chunk_shape = tuple(
+            max(1, min(chunk_size, size))
+            for chunk_size, size in zip(chunk_shape, shape)
+        )
+        if element_bytes * int(np.prod(chunk_shape)) > memory_budget:
+            for chunk in tiles(shape, chunk_shape):
+                chunk_extent = tuple(index.stop - index.start for index in chunk)
+                for part in slabs(chunk_extent, None, element_bytes, memory_budget):
+                    yield tuple(
+                        slice(
+                            chunk_index.start + part_index.indices(size)[0],
+                            chunk_index.start + part_index.indices(size)[1],
+                        )
+                        for chunk_index, part_index, size in zip(
+                            chunk, part, chunk_extent
+                        )
+                    )
+            return
+
+        # Extent of a tile along each dimension, widened from the innermost
+        # dimension outwards while the tile fits the budget.
+        tile_shape = list(chunk_shape)
+        for d in reversed(range(len(shape))):
+            other_bytes = element_bytes * int(np.prod(tile_shape)) // tile_shape[d]
+            chunks = min(
+                -(-shape[d] // chunk_shape[d]),
+                memory_budget // (other_bytes * chunk_shape[d]),
+            )
+            tile_shape[d] = min(chunks * chunk_shape[d], shape[d])
+            if tile_shape[d] < shape[d]:
+                break
+        yield from tiles(shape, tile_shape)
+        return
+
+    # Memory needed for one index along each dimension
+    index_bytes = [
+        element_bytes * int(np.prod(shape[d + 1 :])) for d in range(len(shape))
+    ]
+    split = next(
+        (d for d in range(len(shape)) if index_bytes[d] <= memory_budget),
+        len(shape) - 1,
+    )
+
+    step = max(1, memory_budget // index_bytes[split])
+    step = min(step, shape[split])
+
+    outer = itertools.product(*(range(size) for size in shape[:split]))
+    for outer_index in outer:
+        for start in range(0, shape[split], step):
+            yield (
+                tuple(slice(i, i + 1) for i in outer_index)
+                + (slice(start, min(start + step, shape[split])),)
+                + tuple(slice(None) for _ in shape[split + 1 :])
+            )
+
+
+def tiles(shape, tile_shape):
+    """Partition an array into tiles of a given shape (smaller at the upper
+    edges of the array), in storage order.
+
+    :return: generator of tuples of slices, one per dimension
+    """
+    starts = itertools.product(
+        *(range(0, size, tile_size) for size, tile_size in zip(shape, tile_shape))
+    )
+    for start in starts:
+        yield tuple(
+            slice(i, min(i + tile_size, size))
+            for i, tile_size, size in zip(start, tile_shape, shape)
+        )
+
+
+def slab_range(values):
+    """Return the minimum and maximum of the valid values in a slab, or None
+    if it has none."""
+    values = np.ma.masked_invalid(values, copy=False)
+    if values.count() == 0:
+        return None
+    return values.min(), values.max()
+
+
+def chunked_var_range(variable, memory_budget=default_memory_budget, threads=1):
+    """Return the range of values taken by a NetCDF variable, reading no more
+    than about ``memory_budget`` bytes of it at any one time.
+
+    With ``threads`` > 1, slabs are reduced by a pool of threads. Reads from the
+    file are serialized, since the netCDF library is not thread-safe, but they
+    overlap the reduction of other slabs. The memory budget is shared by the
+    threads.
+
+    :param variable: (``netCDF4.Variable``) variable
+    :param memory_budget: (int) memory budget, in bytes
+    :param threads: (int) number of threads
+    :return: tuple (min, max) of values of the variable, of the type it is
+        read as; None if the variable has no valid values
+    """
+    chunking = variable.chunking()
+    chunk_shape = None if chunking == "contiguous" else chunking
+    slab_indices = slabs(
+        variable.shape,
+        chunk_shape,
+        element_size(variable),
+        max(1, memory_budget // threads),
+    )
+
+    read_lock = threading.Lock()
+
+    def read_slab_range(index):
+        with read_lock:
+            values = variable[index]
+        return slab_range(values)
+
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            ranges = list(executor.map(read_slab_range, slab_indices))
+    else:
+        ranges = [read_slab_range(index) for index in slab_indices]
+
+    ranges = [r for r in ranges if r is not None]
+    if not ranges:
+        return None
+    mins, maxes = zip(*ranges)
+    return min(mins), max(maxes)
@@ -0,0 +1,482 @@
+"""Continuous indexing of files as they are written.
+
+``watch`` runs until it is interrupted, indexing each new or modified file
+found under a set of directories shortly after it is written. One session
+factory, and so one database engine and one dimension cache, is used for the
+whole run, so that each file costs no more than it would in a long batch.
+
+Changes are detected by a watcher:
+
+- ``InotifyWatcher`` uses Linux inotify (through ``ctypes``; no extra packages
+  are required) and is notified of changes as they happen.
+- ``PollingScanner`` is used where inotify is not available (or the inotify
+  watch limit is reached). It searches the directories every so often and
+  reports files whose status (size, modification time, inode) differs from the
+  status it recorded on its previous search.
+
+A file that has just changed may still be being written, so changed files
+are held back by a ``Debouncer`` until their status has not changed for a
+settling period.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from mm_cataloguer.crawl import crawl, default_include, matches
+from mm_cataloguer.index_netcdf import (
+    file_status,
+    handler,
+    index_netcdf_file,
+    index_netcdf_files_in_batches,
+    indexing_session_factory,
+    log_failures,
+)
+from mm_cataloguer.timings import StageTimings
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(handler)
+logger.setLevel(logging.DEBUG)
+
+
+def current_status(path):
+    """Return the status of a file, or None if it does not exist."""
+    try:
+        return file_status(path)
+    except OSError:
+        return None
+
+
+class Debouncer:
+    """Hold back changed files until they have settled, i.e., until their
+    status has not changed for ``settle_seconds``."""
+
+    def __init__(self, settle_seconds, clock=time.monotonic):
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        # path -> (status, time status was last seen to change)
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, paths):
+        """Record that files may have changed.
+
+        :param paths: iterable of file paths
+        """
+        now = self.clock()
+        for path in paths:
+            status = current_status(path)
+            if path not in self.pending or self.pending[path][0] != status:
+                self.pending[path] = (status, now)
+
+    def ready(self):
+        """Return the files that have settled, in the order they were first
+        added, and stop holding them. Files that no longer exist are dropped.
+
+        :return: list of file paths
+        """
+        now = self.clock()
+        ready = []
+        for path, (status, since) in list(self.pending.items()):
+            if now - since < self.settle_seconds:
+                continue
+            current = current_status(path)
+            if current is None:
+                del self.pending[path]
+            elif current != status:
+                self.pending[path] = (current, now)
+            else:
+                del self.pending[path]
+                ready.append(path)
+        return ready
+
+    def seconds_to_next(self):
+        """Return the time until the next held file may settle, or None if no
+        files are held."""
+        if not self.pending:
+            return None
+        first = min(since for _, since in self.pending.values())
+        return max(0.0, first + self.settle_seconds - self.clock())
+
+
+class PollingScanner:
+    """Detect changed files by searching directories every ``poll_seconds``.
+
+    :param paths: directories (and files) to watch
+    :param poll_seconds: (float) interval between searches
+    :param crawl_options: options for ``mm_cataloguer.crawl.crawl``
+    """
+
+    def __init__(self, paths, poll_seconds=30, clock=time.monotonic, **crawl_options):
+        self.paths = list(paths)
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.crawl_options = crawl_options
+        # path -> status recorded in last search
+        self.statuses = self.search()
+        self.last_search = self.clock()
+
+    def search(self):
+        statuses = {}
+        for path in crawl(self.paths, **self.crawl_options):
+            status = current_status(path)
+            if status is not None:
+                statuses[path] = status
+        return statuses
+
+    def existing(self):
+        """Return the files found when watching started."""
+        return list(self.statuses)
+
+    def changes(self, timeout=None):
+        """Wait until the next search is due, but no longer than ``timeout``
+        seconds, and return the files that have changed since the previous
+        search. Returns an empty list if no search was due.
+
+        :param timeout: (float) maximum time to wait; None to wait for the
+            next search
+        :return: list of file paths
+        """
+        wait = max(0.0, self.last_search + self.poll_seconds - self.clock())
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return []
+        time.sleep(wait)
+        statuses = self.search()
+        self.last_search = self.clock()
+        changed = [
+            path
+            for path, status in statuses.items()
+            if self.statuses.get(path) != status
+        ]
+        self.statuses = statuses
+        return changed
+
+    def close(self):
+        pass
+
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+inotify_event = struct.Struct("iIII")
+
+
+def load_inotify():
+    """Return the C library if it provides inotify, otherwise None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """Detect changed files with Linux inotify. Every directory under the
+    watched directories is watched, including directories created later.
+
+    :param paths: directories (and files) to watch
+    :param crawl_options: options for ``mm_cataloguer.crawl.crawl``
+    :raises OSError: if inotify is not available or the directories cannot
+        all be watched (e.g., because the inotify watch limit is reached)
+    """
+
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+    def __init__(self, paths, libc=None, **crawl_options):
+        self.paths = list(paths)
+        self.crawl_options = crawl_options
+        self.libc = libc or load_inotify()
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.raise_error("inotify_init1")
+        # watch descriptor -> directory
+        self.directories = {}
+        try:
+            for path in self.paths:
+                if os.path.isdir(path):
+                    self.add_tree(path)
+        except OSError:
+            self.close()
+            raise
+
+    def raise_error(self, function, path=None):
+        code = ctypes.get_errno()
+        raise OSError(code, "{}: {}".format(function, os.strerror(code)), path)
+
+    def add_tree(self, directory):
+        """Watch a directory and the directories under it.
+
+        :return: list of directories newly watched
+        """
+        follow_symlinks = self.crawl_options.get("follow_symlinks", False)
+        exclude = self.crawl_options.get("exclude", ())
+        added = []
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            flags = self.mask if follow_symlinks else self.mask | IN_DONT_FOLLOW
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), ctypes.c_uint32(flags)
+            )
+            if wd < 0:
+                if ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                self.raise_error("inotify_add_watch", directory)
+            if wd in self.directories:
+                # Already watched, by another path or a symlink loop
+                continue
+            self.directories[wd] = directory
+            added.append(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if matches(entry.path, exclude):
+                            continue
+                        if entry.is_symlink() and not follow_symlinks:
+                            continue
+                        if entry.is_dir():
+                            stack.append(entry.path)
+            except OSError as e:
+                logger.warning("Cannot search directory {}: {}".format(directory, e))
+        return added
+
+    def existing(self):
+        """Return the files found when watching started."""
+        return list(crawl(self.paths, **self.crawl_options))
+
+    def changes(self, timeout=None):
+        """Wait for changes, but no longer than ``timeout`` seconds, and return
+        the files that have changed. Files in directories created (or moved
+        in) since watching started are included.
+
+        :param timeout: (float) maximum time to wait; None to wait until
+            something changes
+        :return: list of file paths
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        include = self.crawl_options.get("include", default_include)
+        exclude = self.crawl_options.get("exclude", ())
+        changed = {}
+        new_directories = []
+        for wd, mask, name in self.read_events():
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Missed changes (inotify queue overflow); searching")
+                changed.update(dict.fromkeys(self.existing()))
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if matches(path, exclude):
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    new_directories.extend(self.add_tree(path))
+            elif matches(path, include):
+                changed[path] = None
+        # Files may have been written in new directories before they were
+        # watched.
+        if new_directories:
+            changed.update(
+                dict.fromkeys(
+                    crawl(
+                        new_directories,
+                        include=include,
+                        exclude=exclude,
+                        follow_symlinks=self.crawl_options.get(
+                            "follow_symlinks", False
+                        ),
+                    )
+                )
+            )
+        return list(changed)
+
+    def read_events(self):
+        """Generate (watch descriptor, mask, name) for each queued event."""
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = inotify_event.unpack_from(buffer, offset)
+                offset += inotify_event.size
+                name = os.fsdecode(buffer[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                yield wd, mask, name
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(paths, use_inotify=True, poll_seconds=30, **crawl_options):
+    """Return an ``InotifyWatcher`` if possible, otherwise a
+    ``PollingScanner``.
+
+    :param paths: directories (and files) to watch
+    :param use_inotify: (bool) use inotify if it is available
+    :param poll_seconds: (float) interval between searches, if polling
+    :param crawl_options: options for ``mm_cataloguer.crawl.crawl``
+    """
+    if use_inotify:
+        try:
+            watcher = InotifyWatcher(paths, **crawl_options)
+            logger.info(
+                "Watching {} directories with inotify".format(len(watcher.directories))
+            )
+            return watcher
+        except OSError as e:
+            logger.warning("Cannot use inotify ({}); polling instead".format(e))
+    logger.info("Polling for changes every {} s".format(poll_seconds))
+    return PollingScanner(paths, poll_seconds=poll_seconds, **crawl_options)
+
+
+def watch(
+    paths,
+    dsn,
+    include=default_include,
+    exclude=(),
+    follow_symlinks=False,
+    settle_seconds=10,
+    poll_seconds=30,
+    use_inotify=True,
+    index_existing=False,
+    prewarm_cache=False,
+    batch_size=1,
+    batch_seconds=None,
+    timings_json=None,
+    timings_prometheus=None,
+    report_seconds=60,
+    statements=None,
+    **options,
+):
+    """Index files under a set of directories as they are written, until
+    interrupted.
+
+    Stage timings (see ``mm_cataloguer.timings``) are written to the given
+    files every ``report_seconds``, whether or not files are being indexed,
+    so that they stay current for collectors that read them; they are also
+    logged, if files have been indexed since the previous report. Percentiles
+    in each report describe the files indexed since the previous report;
+    counts and totals describe the whole run. A final report is made when
+    watching stops.
+
+    :param paths: directories (and files) to watch
+    :param dsn: connection info for the modelmeta database to update
+    :param include: glob patterns for files to index (see
+        ``mm_cataloguer.crawl.crawl``)
+    :param exclude: glob patterns for files and directories not to index
+    :param follow_symlinks: (bool) follow symbolic links in directories
+    :param settle_seconds: (float) time a changed file's status must remain
+        unchanged before it is indexed
+    :param poll_seconds: (float) interval between searches, if polling
+    :param use_inotify: (bool) use inotify if it is available
+    :param index_existing: (bool) also index the files present when watching
+        starts (use with indexing option ``fast_skip`` to skip those already
+        indexed)
+    :param prewarm_cache: (bool) load all existing dimension records into the
+        cache before indexing any files
+    :param batch_size: (int) maximum number of files indexed per transaction
+    :param batch_seconds: (float) with ``batch_size`` > 1, maximum time a
+        transaction is held open before it is committed; None for no limit
+    :param timings_json: path of file to write timings to as JSON; None for
+        none
+    :param timings_prometheus: path of file to write timings to in the
+        Prometheus text format; None for none
+    :param report_seconds: (float) interval between timing reports
+    :param statements: (``mm_cataloguer.statements.StatementCounter``)
+        counter to record the statements executed in, reported with the
+        timings; None for none
+    :param options: indexing options (see
+        ``mm_cataloguer.index_netcdf.default_indexing_options``)
+    """
+    timings = StageTimings()
+    Session = indexing_session_factory(
+        dsn,
+        prewarm_cache=prewarm_cache,
+        timings=timings,
+        statements=statements,
+        **options,
+    )
+    watcher = make_watcher(
+        paths,
+        use_inotify=use_inotify,
+        poll_seconds=poll_seconds,
+        include=tuple(include),
+        exclude=tuple(exclude),
+        follow_symlinks=follow_symlinks,
+    )
+    debouncer = Debouncer(settle_seconds)
+    last_report = time.monotonic()
+    indexed_since_report = False
+
+    def report():
+        if indexed_since_report:
+            timings.log_summary(logger)
+            if statements is not None:
+                statements.log_summary(logger)
+        timings.write(json_path=timings_json, prometheus_path=timings_prometheus)
+        timings.reset_samples()
+
+    try:
+        if index_existing:
+            debouncer.add(watcher.existing())
+        while True:
+            # Wait for changes no longer than until the next report is due
+            timeout = max(0.0, last_report + report_seconds - time.monotonic())
+            settle_timeout = debouncer.seconds_to_next()
+            if settle_timeout is not None:
+                timeout = min(timeout, settle_timeout)
+            debouncer.add(watcher.changes(timeout=timeout))
+            filenames = debouncer.ready()
+            if filenames:
+                logger.info("Indexing {} changed files".format(len(filenames)))
+                if batch_size > 1:
+                    data_file_ids = index_netcdf_files_in_batches(
+                        filenames, Session, batch_size, batch_seconds=batch_seconds
+                    )
+                else:
+                    data_file_ids = [index_netcdf_file(f, Session) for f in filenames]
+                log_failures(filenames, data_file_ids)
+                indexed_since_report = True
+            if time.monotonic() - last_report >= report_seconds:
+                report()
+                indexed_since_report = False
+                last_report = time.monotonic()
+    finally:
+        watcher.close()
+        report()
@@ -0,0 +1,503 @@
+"""Queue of files to index, shared by indexers on several nodes.
+
+Rather than splitting a list of files between nodes by hand, files to index
+are added to the ``index_jobs`` table (``modelmeta.IndexJob``) by a producer,
+such as ``index_netcdf --enqueue`` given directories to search or a manifest
+(``--files-from``). Any number of workers (``index_netcdf --work``), on any
+nodes that can read the files, then index them:
+
+- A worker claims a few pending jobs at a time with
+  ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent workers never wait for
+  each other's claims, never claim the same job, and each takes more work as
+  soon as it is ready for it.
+- It indexes the files as ``index_netcdf`` would, and records the outcome of
+  each job: done, with the id of the file's DataFile; or, if indexing failed,
+  pending again after a retry delay that doubles with each attempt, until the
+  job has been attempted ``max_attempts`` times and is marked failed. The
+  error raised in indexing the file is recorded with the job.
+- A job claimed by a worker that does not finish it within
+  ``lease_seconds`` (because its node went down, say) is claimed again by
+  another worker. A worker that dies on a file (e.g., in the HDF5 library)
+  uses up an attempt, so such a file cannot take down workers indefinitely.
+
+A file is in the queue only once. Enqueuing it again does nothing, unless it is
+requeued, which makes a done or failed job pending again.
+"""
+
+from collections import Counter
+import datetime
+import itertools
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+from sqlalchemy import and_, bindparam, create_engine, func, or_, select, update
+from sqlalchemy.orm import sessionmaker
+
+from modelmeta import IndexJob
+from mm_cataloguer.index_netcdf import (
+    handler,
+    index_netcdf_file,
+    index_netcdf_files_in_batches,
+    indexing_session_factory,
+    log_failures,
+)
+from mm_cataloguer.statements import StatementCounter
+from mm_cataloguer.timings import StageTimings
+from mm_cataloguer.upsert import insert_ignoring_conflicts
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(handler)
+logger.setLevel(logging.DEBUG)
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def default_worker_name():
+    """Return a name for this worker that is unique across nodes."""
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def enqueue(sesh, filenames, requeue=False):
+    """Add files to the queue. A file already in the queue is not added again.
+
+    :param sesh: modelmeta database session
+    :param filenames: list of file names
+    :param requeue: (bool) make the jobs of files already done or failed
+        pending again
+    :return: number of files given
+    """
+    filenames = list(dict.fromkeys(os.path.abspath(f) for f in filenames))
+    enqueued_at = now()
+    insert_ignoring_conflicts(
+        sesh,
+        IndexJob.__table__,
+        [
+            dict(
+                filename=filename,
+                status="pending",
+                attempts=0,
+                enqueued_at=enqueued_at,
+                available_at=enqueued_at,
+            )
+            for filename in filenames
+        ],
+        ["filename"],
+    )
+    if requeue and filenames:
+        sesh.execute(
+            update(IndexJob)
+            .where(
+                IndexJob.filename.in_(filenames),
+                IndexJob.status.in_(["done", "failed"]),
+            )
+            .values(status="pending", attempts=0, available_at=enqueued_at, error=None)
+            .execution_options(synchronize_session=False)
+        )
+    return len(filenames)
+
+
+def enqueue_files(filenames, dsn, requeue=False, chunk_size=1000):
+    """Add files to the queue, committing a chunk of files at a time.
+
+    :param filenames: iterable of file names; consumed lazily
+    :param dsn: connection info for the modelmeta database
+    :param requeue: (bool) see ``enqueue``
+    :param chunk_size: (int) number of files added per transaction
+    :return: number of files given
+    """
+    Session = sessionmaker(bind=create_engine(dsn))
+    filenames = iter(filenames)
+    count = 0
+    for chunk in iter(lambda: list(itertools.islice(filenames, chunk_size)), []):
+        session = Session()
+        try:
+            count += enqueue(session, chunk, requeue=requeue)
+            session.commit()
+        finally:
+            session.close()
+    logger.info("Enqueued {} files".format(count))
+    return count
+
+
+def claim_jobs(sesh, worker, claim_size=10, lease_seconds=3600, max_attempts=3):
+    """Claim jobs from the queue: pending jobs whose retry delay has passed,
+    and claimed jobs whose lease has expired, oldest first. Jobs locked by
+    another worker's claim are skipped. Expired jobs that have been attempted
+    ``max_attempts`` times are marked failed instead.
+
+    The claim takes effect when the session is committed.
+
+    :param sesh: modelmeta database session
+    :param worker: (str) name of the worker claiming the jobs
+    :param claim_size: (int) maximum number of jobs claimed
+    :param lease_seconds: (float) time after which a claimed job that has not
+        been finished may be claimed by another worker
+    :param max_attempts: (int) maximum number of times a job is claimed
+    :return: list of rows (id, filename, attempts) of jobs claimed
+    """
+    claimed_at = now()
+    expired = claimed_at - datetime.timedelta(seconds=lease_seconds)
+    lost = sesh.execute(
+        update(IndexJob)
+        .where(
+            IndexJob.status == "claimed",
+            IndexJob.claimed_at < expired,
+            IndexJob.attempts >= max_attempts,
+        )
+        .values(
+            status="failed",
+            finished_at=claimed_at,
+            error="Not finished by worker " + IndexJob.claimed_by,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if lost:
+        logger.warning("Marked {} abandoned jobs failed".format(lost))
+    ids = sesh.scalars(
+        select(IndexJob.id)
+        .where(
+            or_(
+                and_(IndexJob.status == "pending", IndexJob.available_at <= claimed_at),
+                and_(IndexJob.status == "claimed", IndexJob.claimed_at < expired),
+            )
+        )
+        .order_by(IndexJob.id)
+        .limit(claim_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not ids:
+        return []
+    sesh.execute(
+        update(IndexJob)
+        .where(IndexJob.id.in_(ids))
+        .values(
+            status="claimed",
+            claimed_by=worker,
+            claimed_at=claimed_at,
+            attempts=IndexJob.attempts + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return sesh.execute(
+        select(IndexJob.id, IndexJob.filename, IndexJob.attempts)
+        .where(IndexJob.id.in_(ids))
+        .order_by(IndexJob.id)
+    ).all()
+
+
+def retry_delay(attempts, retry_seconds=60, max_retry_seconds=24 * 3600):
+    """Return the delay before a job that has failed ``attempts`` times is
+    retried."""
+    return min(max_retry_seconds, retry_seconds * 2 ** (attempts - 1))
+
+
+def finish_jobs(
+    sesh,
+    jobs,
+    data_file_ids,
+    worker,
+    max_attempts=3,
+    retry_seconds=60,
+    errors=None,
+):
+    """Record the outcome of claimed jobs, with one statement. A job that
+    another worker has claimed since (because this worker's lease expired) is
+    left to that worker.
+
+    :param sesh: modelmeta database session
+    :param jobs: list of rows of jobs, as returned by ``claim_jobs``
+    :param data_file_ids: list of DataFile ids, one for each job; None for
+        each file that could not be indexed
+    :param worker: (str) name of the worker that claimed the jobs
+    :param max_attempts: (int) maximum number of times a job is claimed
+    :param retry_seconds: (float) delay before a job that has failed once is
+        retried; doubled for each further failure
+    :param errors: (dict) maps the file name of a job that failed to a
+        description of the exception raised in indexing it (see
+        ``mm_cataloguer.index_netcdf.index_netcdf_file``); None for none
+    """
+    errors = errors or {}
+    finished_at = now()
+    rows = []
+    for job, data_file_id in zip(jobs, data_file_ids):
+        row = dict(
+            b_id=job.id,
+            b_worker=worker,
+            status="done",
+            data_file_id=data_file_id,
+            available_at=finished_at,
+            finished_at=finished_at,
+            error=None,
+        )
+        if data_file_id is None:
+            row["error"] = "Not indexed by worker {}".format(worker)
+            if job.filename in errors:
+                row["error"] += ": " + errors[job.filename]
+            row["error"] = row["error"][: IndexJob.error.type.length]
+            if job.attempts < max_attempts:
+                row["status"] = "pending"
+                row["available_at"] = finished_at + datetime.timedelta(
+                    seconds=retry_delay(job.attempts, retry_seconds)
+                )
+            else:
+                row["status"] = "failed"
+        rows.append(row)
+    if rows:
+        table = IndexJob.__table__
+        sesh.execute(
+            update(table).where(
+                table.c.index_job_id == bindparam("b_id"),
+                table.c.claimed_by == bindparam("b_worker"),
+                table.c.status == "claimed",
+            ),
+            rows,
+        )
+
+
+def queue_status(sesh):
+    """Return the number of jobs with each status.
+
+    :param sesh: modelmeta database session
+    :return: dict mapping status to number of jobs
+    """
+    return dict(
+        sesh.execute(
+            select(IndexJob.status, func.count()).group_by(IndexJob.status)
+        ).all()
+    )
+
+
+def log_queue_status(dsn):
+    """Log the number of jobs with each status."""
+    session = sessionmaker(bind=create_engine(dsn))()
+    try:
+        counts = Counter(queue_status(session))
+    finally:
+        session.close()
+    logger.info(
+        "Index queue: {}".format(
+            ", ".join(
+                "{} {}".format(counts[status], status)
+                for status in IndexJob.status.type.enums
+            )
+        )
+    )
+
+
+def work(
+    dsn,
+    worker=None,
+    claim_size=10,
+    lease_seconds=3600,
+    max_attempts=3,
+    retry_seconds=60,
+    wait=False,
+    poll_seconds=30,
+    prewarm_cache=False,
+    batch_size=1,
+    batch_seconds=None,
+    timings=None,
+    statements=None,
+    timings_json=None,
+    timings_prometheus=None,
+    prometheus_labels=None,
+    report_seconds=60,
+    **options,
+):
+    """Index files claimed from the queue, until the queue has no jobs
+    available (or, with ``wait``, until interrupted).
+
+    Stage timings (see ``mm_cataloguer.timings``) and statement counts are
+    logged, and the timings written to the given files, every
+    ``report_seconds`` while the worker runs, and once more when it stops,
+    however it stops.
+
+    :param dsn: connection info for the modelmeta database to update
+    :param worker: (str) name of this worker; None for
+        ``default_worker_name()``
+    :param claim_size: (int) number of jobs claimed at a time
+    :param lease_seconds: (float) see ``claim_jobs``; must be comfortably
+        longer than it takes to index ``claim_size`` files
+    :param max_attempts: (int) maximum number of times a job is claimed
+    :param retry_seconds: (float) delay before a job that has failed once is
+        retried; doubled for each further failure
+    :param wait: (bool) when no jobs are available, wait for more rather than
+        returning
+    :param poll_seconds: (float) with ``wait``, interval between claims while
+        no jobs are available
+    :param prewarm_cache: (bool) load all existing dimension records into the
+        cache before indexing any files
+    :param batch_size: (int) maximum number of files indexed per transaction
+    :param batch_seconds: (float) with ``batch_size`` > 1, maximum time a
+        transaction is held open before it is committed; None for no limit
+    :param timings: (``mm_cataloguer.timings.StageTimings``) timings to record
+        stages of indexing in; None for new timings
+    :param statements: (``mm_cataloguer.statements.StatementCounter``)
+        counter to record the statements executed in; None for none
+    :param timings_json: path of file to write timings to as JSON; None for
+        none
+    :param timings_prometheus: path of file to write timings to in the
+        Prometheus text format; None for none
+    :param prometheus_labels: (dict) labels added to every sample in the
+        Prometheus textfile; None for none
+    :param report_seconds: (float) interval between reports
+    :param options: indexing options (see
+        ``mm_cataloguer.index_netcdf.default_indexing_options``)
+    :return: list of DataFile ids, one for each job claimed, in the order
+        claimed; None for each file that could not be indexed
+    """
+    worker = worker or default_worker_name()
+    if timings is None:
+        timings = StageTimings()
+    Session = indexing_session_factory(
+        dsn,
+        prewarm_cache=prewarm_cache,
+        timings=timings,
+        statements=statements,
+        **options,
+    )
+    logger.info("Worker {} started".format(worker))
+    data_file_ids = []
+    last_report = time.monotonic()
+
+    def report():
+        timings.log_summary(logger)
+        if statements is not None:
+            statements.log_summary(logger)
+        timings.write(
+            json_path=timings_json,
+            prometheus_path=timings_prometheus,
+            prometheus_labels=prometheus_labels,
+        )
+        timings.reset_samples()
+
+    try:
+        while True:
+            if time.monotonic() - last_report >= report_seconds:
+                report()
+                last_report = time.monotonic()
+            session = Session()
+            try:
+                jobs = claim_jobs(
+                    session,
+                    worker,
+                    claim_size=claim_size,
+                    lease_seconds=lease_seconds,
+                    max_attempts=max_attempts,
+                )
+                session.commit()
+            finally:
+                session.close()
+            if not jobs:
+                if not wait:
+                    break
+                time.sleep(min(poll_seconds, report_seconds))
+                continue
+
+            filenames = [job.filename for job in jobs]
+            errors = {}
+            if batch_size > 1:
+                ids = index_netcdf_files_in_batches(
+                    filenames,
+                    Session,
+                    batch_size,
+                    batch_seconds=batch_seconds,
+                    errors=errors,
+                )
+            else:
+                ids = [
+                    index_netcdf_file(filename, Session, errors=errors)
+                    for filename in filenames
+                ]
+            session = Session()
+            try:
+                finish_jobs(
+                    session,
+                    jobs,
+                    ids,
+                    worker,
+                    max_attempts=max_attempts,
+                    retry_seconds=retry_seconds,
+                    errors=errors,
+                )
+                session.commit()
+            finally:
+                session.close()
+            log_failures(filenames, ids)
+            data_file_ids.extend(ids)
+        logger.info(
+            "Worker {} finished: no jobs available after {} files".format(
+                worker, len(data_file_ids)
+            )
+        )
+    finally:
+        report()
+    return data_file_ids
+
+
+def worker_report_path(path, number):
+    """Return the path of the report file of worker process ``number``:
+    ``path`` with the number inserted before its extension; None if ``path``
+    is None."""
+    if path is None:
+        return None
+    root, extension = os.path.splitext(path)
+    return "{}-{}{}".format(root, number, extension)
+
+
+def _work_process(dsn, count_statements, kwargs):
+    work(dsn, statements=StatementCounter() if count_statements else None, **kwargs)
+
+
+def work_in_processes(jobs, dsn, count_statements=False, stop_seconds=30, **kwargs):
+    """Run ``jobs`` workers (see ``work``) in separate processes, and wait for
+    them all to finish. Each reports its own timings and statement counts;
+    timings files are written per worker (see ``worker_report_path``), with
+    the Prometheus samples of each labelled with its number.
+
+    :param jobs: (int) number of worker processes
+    :param dsn: connection info for the modelmeta database to update
+    :param count_statements: (bool) count the statements executed by each
+        worker
+    :param stop_seconds: (float) on interrupt, time allowed for the workers
+        (interrupted along with this process) to make their final reports
+        before they are terminated
+    :param kwargs: arguments for ``work``; a worker name given is suffixed
+        with the number of each process
+    :return: list of exit codes of the worker processes
+    """
+    processes = []
+    for number in range(1, jobs + 1):
+        process_kwargs = dict(kwargs)
+        if process_kwargs.get("worker"):
+            process_kwargs["worker"] = "{}-{}".format(kwargs["worker"], number)
+        for name in ("timings_json", "timings_prometheus"):
+            process_kwargs[name] = worker_report_path(kwargs.get(name), number)
+        process_kwargs["prometheus_labels"] = dict(
+            kwargs.get("prometheus_labels") or {}, worker=str(number)
+        )
+        processes.append(
+            multiprocessing.Process(
+                target=_work_process, args=(dsn, count_statements, process_kwargs)
+            )
+        )
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        deadline = time.monotonic() + stop_seconds
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        raise
+    return [process.exitcode for process in processes]
@@ -15,6 +15,7 @@ __all__ = """
     Ensemble
     EnsembleDataFileVariables
     Grid
+    IndexJob
     Level
     LevelSet
     Model
@@ -27,10 +28,12 @@ __all__ = """
     VariableAlias
     YCellBound
     SpatialRefSys
+    pcic_srid_seq
 """.split()
 
 from sqlalchemy import (
     Column,
+    BigInteger,
     Integer,
     Float,
     String,
@@ -39,6 +42,7 @@ from sqlalchemy import (
     Enum,
     ForeignKey,
     Index,
+    Sequence,
     UniqueConstraint,
 )
 from sqlalchemy.orm import declarative_base
@@ -100,6 +104,11 @@ class DataFile(Base):
     z_dim_name = Column(String(length=32))
     t_dim_name = Column(String(length=32))
     index_time = Column(DateTime, nullable=False)
+    # File status (``os.stat``) when indexed; lets the indexer recognize an
+    # unchanged file without opening it
+    file_size = Column(BigInteger)
+    file_mtime_ns = Column(BigInteger)
+    file_inode = Column(BigInteger)
 
     # relation definitions
     run_id = Column(Integer, ForeignKey("runs.run_id"))
@@ -119,6 +128,7 @@ class DataFile(Base):
 
 UniqueConstraint(DataFile.unique_id, name="data_files_unique_id_key")
 Index("data_files_run_id_key", DataFile.run_id, unique=False)
+Index("data_files_filename_key", DataFile.filename, unique=False)
 
 
 class DataFileVariable(Base):
@@ -137,6 +147,9 @@ class DataFileVariable(Base):
     disabled = Column(Boolean)
     range_min = Column(Float, nullable=False)
     range_max = Column(Float, nullable=False)
+    # Where range_min and range_max were found: name of variable attribute(s),
+    # "sidecar" (statistics file), or "data"
+    range_source = Column(String(length=32))
 
     # relation definitions
     data_file_id = Column(
@@ -159,7 +172,7 @@ class DataFileVariable(Base):
     def __repr__(self):
         return obj_repr(
             "id geometry_type derivation_method variable_cell_methods "
-            "netcdf_variable_name disabled range_min range_max",
+            "netcdf_variable_name disabled range_min range_max range_source",
             self,
         )
 
@@ -224,6 +237,17 @@ class Station(Base):
         return obj_repr("id name long_name x x_units y y_units", self)
 
 
+Index(
+    "stations_name_x_y_key",
+    Station.name,
+    Station.x,
+    Station.x_units,
+    Station.y,
+    Station.y_units,
+    unique=True,
+)
+
+
 class DataFileVariableDSGTimeSeriesXStation(Base):
     """Cross table for many:many relation between DataFileVariableDSGTimeSeries
     and Station."""
@@ -328,6 +352,9 @@ class Emission(Base):
         return obj_repr("id short_name long_name", self)
 
 
+UniqueConstraint(Emission.short_name, name="unique_emission_short_name_constraint")
+
+
 class Ensemble(Base):
     __tablename__ = "ensembles"
 
@@ -400,6 +427,9 @@ class Grid(Base):
     yc_grid_step = Column(Float, nullable=False)
     yc_origin = Column(Float, nullable=False)
     yc_units = Column(String(length=64), nullable=False)
+    # Hash of srid, counts, evenly_spaced_y, and quantized origins and steps;
+    # see mm_cataloguer grid_match_key
+    match_key = Column(String(length=64))
 
     # Brace yourself.
     # We'd like to do this:
@@ -462,6 +492,59 @@ class Grid(Base):
         )
 
 
+Index("grids_match_key_key", Grid.match_key, unique=False)
+
+
+class IndexJob(Base):
+    """A file in the queue of files to index (see ``mm_cataloguer.work_queue``).
+    Not part of the metadata proper; shared by indexers on several nodes."""
+
+    __tablename__ = "index_jobs"
+
+    # column definitions
+    id = Column("index_job_id", Integer, primary_key=True, nullable=False)
+    filename = Column(String(length=2048), nullable=False)
+    status = Column(
+        Enum("pending", "claimed", "done", "failed", name="index_job_status"),
+        nullable=False,
+    )
+    # Number of times the job has been claimed
+    attempts = Column(Integer, nullable=False)
+    enqueued_at = Column(DateTime, nullable=False)
+    # A pending job is not claimed before this time (retry delay)
+    available_at = Column(DateTime, nullable=False)
+    claimed_by = Column(String(length=255))
+    claimed_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    error = Column(String(length=2048))
+
+    # relation definitions
+    data_file_id = Column(
+        Integer,
+        ForeignKey(
+            "data_files.data_file_id",
+            name="index_jobs_data_file_id_fkey",
+            ondelete="SET NULL",
+        ),
+    )
+
+    def __repr__(self):
+        return obj_repr(
+            "id filename status attempts enqueued_at available_at claimed_by "
+            "claimed_at finished_at data_file_id",
+            self,
+        )
+
+
+UniqueConstraint(IndexJob.filename, name="index_jobs_filename_key")
+Index(
+    "index_jobs_status_available_at_key",
+    IndexJob.status,
+    IndexJob.available_at,
+    unique=False,
+)
+
+
 class Level(Base):
     __tablename__ = "levels"
 
@@ -489,6 +572,8 @@ class LevelSet(Base):
     # column definitions
     id = Column("level_set_id", Integer, primary_key=True, nullable=False)
     level_units = Column(String(length=32), nullable=False)
+    # Hash of level_units and levels; see mm_cataloguer level_set_fingerprint
+    fingerprint = Column(String(length=64))
 
     # relation definitions
     levels = relationship(
@@ -505,6 +590,9 @@ class LevelSet(Base):
         return obj_repr("id level_units", self)
 
 
+Index("level_sets_fingerprint_key", LevelSet.fingerprint, unique=True)
+
+
 class Model(Base):
     __tablename__ = "models"
 
@@ -522,6 +610,9 @@ class Model(Base):
         return obj_repr("id long_name short_name organization type", self)
 
 
+UniqueConstraint(Model.short_name, name="unique_model_short_name_constraint")
+
+
 class QcFlag(Base):
     __tablename__ = "qc_flags"
 
@@ -543,6 +634,9 @@ class QcFlag(Base):
         return obj_repr("id name description", self)
 
 
+UniqueConstraint(QcFlag.name, name="unique_qc_flag_name_constraint")
+
+
 class Run(Base):
     __tablename__ = "runs"
 
@@ -639,6 +733,9 @@ class TimeSet(Base):
         ),
         nullable=False,
     )
+    # Hash of the above, timesteps, and climatology bounds; see mm_cataloguer
+    # timeset_content_hash
+    content_hash = Column(String(length=64))
 
     # relation definitions
     files = relationship("DataFile", backref=backref("timeset"))
@@ -655,6 +752,9 @@ class TimeSet(Base):
         )
 
 
+Index("time_sets_content_hash_key", TimeSet.content_hash, unique=True)
+
+
 class Variable(Base):
     __tablename__ = "variables"
 
@@ -711,6 +811,14 @@ class VariableAlias(Base):
         return obj_repr("id long_name standard_name units", self)
 
 
+UniqueConstraint(
+    VariableAlias.long_name,
+    VariableAlias.standard_name,
+    VariableAlias.units,
+    name="unique_variable_alias_constraint",
+)
+
+
 class YCellBound(Base):
     __tablename__ = "y_cell_bounds"
 
@@ -752,3 +860,9 @@ class SpatialRefSys(Base):
 
 # We don't declare constraints on SpatialRefSys because the Postgis plugin is
 # responsible for creating it.
+# Migration d9f9e5079071 adds an index on md5(srtext) in PostgreSQL databases.
+
+# In PostgreSQL databases, srids of CRSs added by PCIC (990000 and up) are
+# allocated from this sequence, so that concurrent inserts of new CRSs do not
+# conflict.
+pcic_srid_seq = Sequence("pcic_srid_seq", start=990000, metadata=Base.metadata)
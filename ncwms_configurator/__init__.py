@@ -6,6 +6,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from modelmeta import DataFile, DataFileVariable, Ensemble
 from modelmeta import EnsembleDataFileVariables
+from mm_cataloguer.statements import (
+    StatementCounter,
+    install as install_statement_counter,
+)
 
 from lxml import etree
 
@@ -187,8 +191,8 @@ class Config:
         self.datasets.append(dataset)
 
 
-def get_session(dsn):
-    engine = create_engine(args.dsn)
+def get_session(dsn, statements=None):
+    engine = install_statement_counter(create_engine(args.dsn), statements)
     Session = sessionmaker(bind=engine)
     return Session()
 
@@ -198,7 +202,8 @@ def create(args):
     log.info("Writing to file: {}".format(args.outfile))
     log.info("Formatting for ncWMS version {}".format(args.version))
 
-    sesh = get_session(args.dsn)
+    statements = StatementCounter() if args.count_statements else None
+    sesh = get_session(args.dsn, statements)
     q = (
         sesh.query(DataFileVariable)
         .join(EnsembleDataFileVariables, Ensemble)
@@ -216,6 +221,8 @@ def create(args):
         )
         for dfv in q.all()
     ]
+    if statements is not None:
+        statements.log_summary(log)
 
     rv = {}
 
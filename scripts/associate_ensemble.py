@@ -2,6 +2,7 @@
 from argparse import ArgumentParser
 
 from mm_cataloguer.associate_ensemble import main
+from mm_cataloguer.statements import StatementCounter
 
 
 def associate():
@@ -39,6 +40,13 @@ def associate():
         "variables of files matching any of those regular "
         "expressions.",
     )
+    parser.add_argument(
+        "--count-statements",
+        dest="count_statements",
+        action="store_true",
+        help="Count the SQL statements executed, and the time taken by them, "
+        "for each filepath and in all",
+    )
     parser.add_argument("filepaths", nargs="+", help="Files to process")
     args = parser.parse_args()
 
@@ -54,4 +62,5 @@ def associate():
         args.regex_filepaths,
         args.filepaths,
         var_names,
+        statements=StatementCounter() if args.count_statements else None,
     )
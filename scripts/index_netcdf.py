@@ -1,7 +1,27 @@
 #! python
-from argparse import ArgumentParser
+from argparse import ArgumentParser, FileType
+import itertools
+import sys
 
-from mm_cataloguer.index_netcdf import index_netcdf_files
+from mm_cataloguer.crawl import crawl, default_include
+from mm_cataloguer.index_netcdf import index_netcdf_files, logger
+from mm_cataloguer.journal import Journal
+from mm_cataloguer.plan import (
+    execute_plan,
+    log_plan,
+    plan_netcdf_files,
+    read_plan,
+    write_plan,
+)
+from mm_cataloguer.statements import StatementCounter
+from mm_cataloguer.timings import StageTimings
+from mm_cataloguer.watch import watch
+from mm_cataloguer.work_queue import (
+    enqueue_files,
+    log_queue_status,
+    work,
+    work_in_processes,
+)
 
 
 def index():
@@ -10,6 +30,453 @@ def index():
         "into modelmeta database"
     )
     parser.add_argument("-d", "--dsn", help="DSN for metadata database")
-    parser.add_argument("filenames", nargs="+", help="Files to process")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to index files in parallel",
+    )
+    parser.add_argument(
+        "--files-per-worker",
+        dest="files_per_worker",
+        type=int,
+        default=None,
+        help="Replace each worker process with a fresh one after it has "
+        "indexed this many files (default: never)",
+    )
+    parser.add_argument(
+        "--prewarm-cache",
+        dest="prewarm_cache",
+        action="store_true",
+        help="Load all existing dimension records (models, runs, grids, "
+        "time sets, etc.) into the cache before indexing any files",
+    )
+    parser.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=1,
+        help="Maximum number of files indexed in one database transaction "
+        "(default: 1)",
+    )
+    parser.add_argument(
+        "--batch-seconds",
+        dest="batch_seconds",
+        type=float,
+        default=None,
+        help="With --batch-size, commit a transaction once it has been open "
+        "this many seconds, even if it holds fewer files",
+    )
+    parser.add_argument(
+        "--fast-skip",
+        dest="fast_skip",
+        action="store_true",
+        help="Skip, without opening it, a file whose size, modification time "
+        "and inode are unchanged since it was indexed",
+    )
+    parser.add_argument(
+        "--no-touch-skipped",
+        dest="touch_skipped",
+        action="store_false",
+        help="Do not update the index time of files skipped because they are "
+        "already indexed",
+    )
+    parser.add_argument(
+        "--range-memory-mib",
+        dest="range_memory_mib",
+        type=int,
+        default=256,
+        help="Memory, in MiB, for values read at any one time when computing "
+        "the range of a variable (default: 256)",
+    )
+    parser.add_argument(
+        "--range-threads",
+        dest="range_threads",
+        type=int,
+        default=1,
+        help="Number of threads used to compute the range of a variable "
+        "(default: 1)",
+    )
+    parser.add_argument(
+        "--range-from-valid-range",
+        dest="range_from_valid_range",
+        action="store_true",
+        help="Take the range of a variable without an actual_range attribute "
+        "from its valid_range (or valid_min and valid_max) attributes rather "
+        "than from its data",
+    )
+    parser.add_argument(
+        "--range-sidecar-suffix",
+        dest="range_sidecar_suffix",
+        default=".stats.json",
+        help="Suffix added to a data file name to form the name of its sidecar "
+        "statistics file, a JSON file giving variable ranges as "
+        '{"var": {"min": ..., "max": ...}} (default: .stats.json)',
+    )
+    parser.add_argument(
+        "--no-range-sidecar",
+        dest="range_sidecar_suffix",
+        action="store_const",
+        const=None,
+        help="Ignore sidecar statistics files",
+    )
+    parser.add_argument(
+        "--files-from",
+        dest="files_from",
+        type=FileType("r"),
+        default=None,
+        help="Also process the files and directories listed, one per line, in "
+        "this file ('-' for standard input)",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=None,
+        help="Glob pattern for names (or paths) of files to process in "
+        "directories; may be repeated (default: {})".format(" ".join(default_include)),
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        help="Glob pattern for names (or paths) of files and directories not "
+        "to process in directories; may be repeated",
+    )
+    parser.add_argument(
+        "--follow-symlinks",
+        dest="follow_symlinks",
+        action="store_true",
+        help="Follow symbolic links found in directories (by default they are "
+        "ignored)",
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="Record the outcome of each file in this journal file (SQLite), "
+        "so that the run can be resumed with --resume if it is interrupted",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="With --journal, resume the run recorded in the journal: skip "
+        "files already indexed, and retry failed files whose retry delay has "
+        "passed (without --resume, the journal is started afresh)",
+    )
+    parser.add_argument(
+        "--retry-seconds",
+        dest="retry_seconds",
+        type=float,
+        default=60,
+        help="With --resume or --work, delay before retrying a file that has "
+        "failed once; doubled for each further consecutive failure "
+        "(default: 60)",
+    )
+    parser.add_argument(
+        "--timings-json",
+        dest="timings_json",
+        default=None,
+        help="Write the time taken by each stage of indexing (open, md5, "
+        "lock, lookup, time_conversion, var_range, flush, commit, ...) and the "
+        "throughput of the run to this file, as JSON",
+    )
+    parser.add_argument(
+        "--timings-prometheus",
+        dest="timings_prometheus",
+        default=None,
+        help="Write stage timings and throughput to this file in the "
+        "Prometheus text format (e.g., for the node exporter's textfile "
+        "collector)",
+    )
+    parser.add_argument(
+        "--report-seconds",
+        dest="report_seconds",
+        type=float,
+        default=60,
+        help="With --watch or --work, interval between timing reports (default: 60)",
+    )
+    parser.add_argument(
+        "--count-statements",
+        dest="count_statements",
+        action="store_true",
+        help="Count the SQL statements executed, and the time taken by them, "
+        "for each file and in all; log them by kind and by statement shape",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Classify all files (new, unchanged, moved, modified, etc.) in a "
+        "pre-pass that queries the database in bulk, then act on each class "
+        "of files as a whole",
+    )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Classify all files as for --plan, and write the plan (to "
+        "standard output, or to --plan-file) without changing the database",
+    )
+    parser.add_argument(
+        "--plan-file",
+        dest="plan_file",
+        type=FileType("w"),
+        default=None,
+        help="With --plan or --dry-run, write the plan to this file",
+    )
+    parser.add_argument(
+        "--execute-plan",
+        dest="execute_plan",
+        type=FileType("r"),
+        default=None,
+        help="Execute a plan written by --dry-run, instead of processing "
+        "files and directories",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run until interrupted, indexing files in the given directories "
+        "as they are written or modified",
+    )
+    parser.add_argument(
+        "--watch-existing",
+        dest="watch_existing",
+        action="store_true",
+        help="With --watch, also index the files present when watching starts "
+        "(combine with --fast-skip to skip those already indexed)",
+    )
+    parser.add_argument(
+        "--settle-seconds",
+        dest="settle_seconds",
+        type=float,
+        default=10,
+        help="With --watch, index a changed file only once its size and "
+        "modification time have not changed for this long (default: 10)",
+    )
+    parser.add_argument(
+        "--poll-seconds",
+        dest="poll_seconds",
+        type=float,
+        default=30,
+        help="With --watch, interval between searches for changed files when "
+        "inotify is not available; with --work --wait, interval between "
+        "checks for more files (default: 30)",
+    )
+    parser.add_argument(
+        "--poll",
+        dest="use_inotify",
+        action="store_false",
+        help="With --watch, search for changed files every --poll-seconds "
+        "rather than using inotify",
+    )
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="Add the files found to the database's queue of files to index "
+        "(index_jobs), for workers started with --work, instead of indexing "
+        "them",
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="With --enqueue, also queue again files already indexed or " "failed",
+    )
+    parser.add_argument(
+        "--work",
+        action="store_true",
+        help="Index files claimed from the database's queue of files to index, "
+        "until none are available; run on as many nodes as desired. With "
+        "--jobs, run that many workers",
+    )
+    parser.add_argument(
+        "--worker-name",
+        dest="worker_name",
+        default=None,
+        help="With --work, name recorded for the jobs this worker claims "
+        "(default: host:pid)",
+    )
+    parser.add_argument(
+        "--claim-size",
+        dest="claim_size",
+        type=int,
+        default=10,
+        help="With --work, number of files claimed from the queue at a time "
+        "(default: 10)",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        dest="lease_seconds",
+        type=float,
+        default=3600,
+        help="With --work, time after which files claimed by a worker that "
+        "has not finished them may be claimed by another (default: 3600)",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        dest="max_attempts",
+        type=int,
+        default=3,
+        help="With --work, number of times a file is attempted before it is "
+        "marked failed (default: 3)",
+    )
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="With --work, wait for more files (checking every "
+        "--poll-seconds) when none are available, until interrupted",
+    )
+    parser.add_argument(
+        "--queue-status",
+        dest="queue_status",
+        action="store_true",
+        help="Log the number of files in the queue with each status",
+    )
+    parser.add_argument(
+        "filenames",
+        nargs="*",
+        help="Files to process, or directories to search recursively for "
+        "files to process",
+    )
     args = parser.parse_args()
-    index_netcdf_files(args.filenames, args.dsn)
+    if (
+        not args.filenames
+        and args.files_from is None
+        and args.execute_plan is None
+        and not (args.work or args.queue_status)
+    ):
+        parser.error("no files or directories to process")
+    if args.resume and args.journal is None:
+        parser.error("--resume requires --journal")
+    paths = args.filenames
+    if args.files_from is not None:
+        listed = (line.rstrip("\n") for line in args.files_from)
+        paths = itertools.chain(paths, (path for path in listed if path))
+    options = dict(
+        fast_skip=args.fast_skip,
+        touch_skipped=args.touch_skipped,
+        range_memory_budget=args.range_memory_mib * 2**20,
+        range_threads=args.range_threads,
+        range_from_valid_range=args.range_from_valid_range,
+        range_sidecar_suffix=args.range_sidecar_suffix,
+    )
+    statements = StatementCounter() if args.count_statements else None
+    if args.enqueue or args.work or args.queue_status:
+        if args.watch:
+            parser.error("--watch cannot be combined with the queue options")
+        if args.enqueue:
+            enqueue_files(
+                crawl(
+                    paths,
+                    include=args.include or default_include,
+                    exclude=args.exclude,
+                    follow_symlinks=args.follow_symlinks,
+                ),
+                args.dsn,
+                requeue=args.requeue,
+            )
+        if args.work:
+            work_args = dict(
+                worker=args.worker_name,
+                claim_size=args.claim_size,
+                lease_seconds=args.lease_seconds,
+                max_attempts=args.max_attempts,
+                retry_seconds=args.retry_seconds,
+                wait=args.wait,
+                poll_seconds=args.poll_seconds,
+                prewarm_cache=args.prewarm_cache,
+                batch_size=args.batch_size,
+                batch_seconds=args.batch_seconds,
+                timings_json=args.timings_json,
+                timings_prometheus=args.timings_prometheus,
+                report_seconds=args.report_seconds,
+                **options,
+            )
+            try:
+                if args.jobs > 1:
+                    work_in_processes(
+                        args.jobs,
+                        args.dsn,
+                        count_statements=args.count_statements,
+                        **work_args,
+                    )
+                else:
+                    work(args.dsn, statements=statements, **work_args)
+            except KeyboardInterrupt:
+                pass
+        log_queue_status(args.dsn)
+        return
+    if args.watch:
+        if args.jobs > 1:
+            parser.error("--watch indexes files in one process; omit --jobs")
+        try:
+            watch(
+                paths,
+                args.dsn,
+                include=args.include or default_include,
+                exclude=args.exclude,
+                follow_symlinks=args.follow_symlinks,
+                settle_seconds=args.settle_seconds,
+                poll_seconds=args.poll_seconds,
+                use_inotify=args.use_inotify,
+                index_existing=args.watch_existing,
+                prewarm_cache=args.prewarm_cache,
+                batch_size=args.batch_size,
+                batch_seconds=args.batch_seconds,
+                timings_json=args.timings_json,
+                timings_prometheus=args.timings_prometheus,
+                report_seconds=args.report_seconds,
+                statements=statements,
+                **options,
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+    journal = None
+    if args.journal is not None and not args.dry_run:
+        journal = Journal(
+            args.journal, resume=args.resume, retry_seconds=args.retry_seconds
+        )
+    timings = StageTimings()
+    index_args = dict(
+        jobs=args.jobs,
+        files_per_worker=args.files_per_worker,
+        prewarm_cache=args.prewarm_cache,
+        batch_size=args.batch_size,
+        batch_seconds=args.batch_seconds,
+        journal=journal,
+        timings=timings,
+        statements=statements,
+        **options,
+    )
+    files = crawl(
+        paths,
+        include=args.include or default_include,
+        exclude=args.exclude,
+        follow_symlinks=args.follow_symlinks,
+    )
+    try:
+        if args.execute_plan is not None:
+            execute_plan(read_plan(args.execute_plan), args.dsn, **index_args)
+        elif args.plan or args.dry_run:
+            plan = plan_netcdf_files(
+                files, args.dsn, fast_skip=args.fast_skip, statements=statements
+            )
+            if args.dry_run:
+                log_plan(write_plan(plan, args.plan_file or sys.stdout))
+                if statements is not None:
+                    statements.log_summary(logger)
+            else:
+                if args.plan_file is not None:
+                    entries = write_plan(plan, args.plan_file)
+                    args.plan_file.close()
+                else:
+                    entries = list(plan)
+                execute_plan(entries, args.dsn, **index_args)
+        else:
+            index_netcdf_files(files, args.dsn, **index_args)
+        if not args.dry_run:
+            timings.write(
+                json_path=args.timings_json, prometheus_path=args.timings_prometheus
+            )
+    finally:
+        if journal is not None:
+            journal.close()
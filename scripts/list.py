@@ -45,6 +45,12 @@ def list():
         action="store_true",
         help="Print SQL of queries generated",
     )
+    main_parser.add_argument(
+        "--count-statements",
+        dest="count_statements",
+        action="store_true",
+        help="Count the SQL statements executed, and the time taken by them",
+    )
     # Selection criteria
     main_parser.add_argument(
         "-e", "--ensemble", help="Filter on association to ensemble"
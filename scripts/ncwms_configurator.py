@@ -41,6 +41,12 @@ Examples:\n
         choices=[1, 2],
         help="Version of ncWMS to target configuration to",
     )
+    parser.add_argument(
+        "--count-statements",
+        dest="count_statements",
+        action="store_true",
+        help="Count the SQL statements executed, and the time taken by them",
+    )
     subparsers = parser.add_subparsers(title="Operation type")
 
     # Parser for creating a new config file
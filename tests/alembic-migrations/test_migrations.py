@@ -70,7 +70,13 @@ def test_model_and_migration_schemas_are_the_same(
         uri_right,
         # Ignore grids.srid fkey because of the flaky way it has to be set up;
         # for details see comments in definiton of `Grid` in `v2.py`.
-        ignores={"alembic_version", "grids.fk.grids_srid_fkey"},
+        # Ignore the index on spatial_ref_sys, which is created only by
+        # migration because PostGIS creates the table.
+        ignores={
+            "alembic_version",
+            "grids.fk.grids_srid_fkey",
+            "spatial_ref_sys.idx.spatial_ref_sys_srtext_md5_key",
+        },
     )
 
     assert result.is_match
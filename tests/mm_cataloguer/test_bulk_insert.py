@@ -0,0 +1,96 @@
+"""Test bulk insertion of child records."""
+
+import datetime
+
+import numpy as np
+import pytest
+
+from modelmeta import Level, LevelSet, Time, TimeSet
+
+from mm_cataloguer.bulk_insert import bulk_insert, copy_threshold
+from mm_cataloguer.statements import query_budget
+
+
+@pytest.mark.parametrize("num_times", [0, 10, copy_threshold + 10])
+def test_bulk_insert_times(test_session_with_empty_db, num_times):
+    sesh = test_session_with_empty_db
+    start_date = datetime.datetime(2000, 1, 1)
+    time_set = TimeSet(
+        calendar="standard",
+        start_date=start_date,
+        end_date=start_date + datetime.timedelta(days=num_times),
+        multi_year_mean=False,
+        num_times=num_times,
+        time_resolution="daily",
+    )
+    sesh.add(time_set)
+    sesh.flush()
+
+    timesteps = [start_date + datetime.timedelta(days=i) for i in range(num_times)]
+    rows = [
+        {"time_set_id": time_set.id, "time_idx": time_idx, "timestep": timestep}
+        for time_idx, timestep in enumerate(timesteps)
+    ]
+    assert bulk_insert(sesh, Time.__table__, rows) == num_times
+
+    times = sesh.query(Time).filter(Time.timeset == time_set).order_by(Time.time_idx)
+    assert [time.timestep for time in times] == timesteps
+    assert len(time_set.times) == num_times
+
+
+@pytest.mark.parametrize("num_levels", [3, copy_threshold + 10])
+def test_bulk_insert_numpy_values(test_session_with_empty_db, num_levels):
+    # NumPy values must be stored as they are when inserted through the ORM.
+    sesh = test_session_with_empty_db
+    level_set = LevelSet(level_units="m")
+    sesh.add(level_set)
+    sesh.flush()
+
+    vertical_levels = np.linspace(0.1, 100.1, num_levels, dtype=np.float32)
+    rows = [
+        {
+            "level_set_id": level_set.id,
+            "level_idx": level_idx,
+            "vertical_level": vertical_level,
+            "level_start": None,
+            "level_end": None,
+        }
+        for level_idx, vertical_level in enumerate(vertical_levels)
+    ]
+    bulk_insert(sesh, Level.__table__, rows)
+
+    levels = (
+        sesh.query(Level)
+        .filter(Level.level_set == level_set)
+        .order_by(Level.level_idx)
+        .all()
+    )
+    assert [level.vertical_level for level in levels] == [
+        float(str(vertical_level)) for vertical_level in vertical_levels
+    ]
+    assert all(level.level_start is None for level in levels)
+
+
+def test_bulk_insert_copy_is_counted(test_session_with_empty_db):
+    # COPY bypasses SQLAlchemy's cursor events, but must still be counted.
+    sesh = test_session_with_empty_db
+    level_set = LevelSet(level_units="m")
+    sesh.add(level_set)
+    sesh.flush()
+
+    rows = [
+        {
+            "level_set_id": level_set.id,
+            "level_idx": level_idx,
+            "vertical_level": float(level_idx),
+            "level_start": None,
+            "level_end": None,
+        }
+        for level_idx in range(copy_threshold)
+    ]
+    with query_budget(sesh.get_bind(), 1) as counter:
+        bulk_insert(sesh, Level.__table__, rows)
+
+    assert counter.count("copy") == 1
+    assert counter.kinds["copy"].rows == copy_threshold
+    assert counter.summary()["kinds"]["copy"]["rows"] == copy_threshold
@@ -0,0 +1,84 @@
+"""Test discovery of files to index."""
+
+import os
+
+import pytest
+
+from mm_cataloguer.crawl import crawl
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A directory tree of files to index and other files."""
+    for path in [
+        "b/one.nc",
+        "b/two.nc",
+        "b/notes.txt",
+        "a/sub/three.nc",
+        "a/four.nc",
+        "a/tmp/five.nc",
+        "top.nc",
+    ]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    return tmp_path
+
+
+def relative(root, paths):
+    return [os.path.relpath(path, root) for path in paths]
+
+
+def inode_order(root, *paths):
+    return sorted(paths, key=lambda path: os.stat(root / path).st_ino)
+
+
+def test_crawl(tree):
+    # Files in a directory (in inode order) precede its subdirectories (in
+    # name order)
+    assert relative(tree, crawl([str(tree)])) == (
+        ["top.nc", "a/four.nc", "a/sub/three.nc", "a/tmp/five.nc"]
+        + inode_order(tree, "b/one.nc", "b/two.nc")
+    )
+
+
+def test_crawl_include_exclude(tree):
+    found = crawl([str(tree)], include=["*.nc", "*.txt"], exclude=["tmp", "*/sub/*"])
+    assert sorted(relative(tree, found)) == [
+        "a/four.nc",
+        "b/notes.txt",
+        "b/one.nc",
+        "b/two.nc",
+        "top.nc",
+    ]
+
+
+def test_crawl_paths(tree):
+    # Files are generated as given, and only once
+    paths = [str(tree / "b" / "notes.txt"), str(tree / "missing.nc"), str(tree / "a")]
+    paths += [str(tree / "a" / "four.nc"), str(tree / "a" / ".." / "a")]
+    assert relative(tree, crawl(paths)) == [
+        "b/notes.txt",
+        "missing.nc",
+        "a/four.nc",
+        "a/sub/three.nc",
+        "a/tmp/five.nc",
+    ]
+
+
+@pytest.mark.parametrize("follow_symlinks", [False, True])
+def test_crawl_symlinks(tree, follow_symlinks):
+    os.symlink(tree / "b", tree / "a" / "link_to_b")
+    os.symlink(tree / "b" / "one.nc", tree / "a" / "link_to_one.nc")
+    os.symlink(tree, tree / "b" / "loop")
+
+    found = relative(tree, crawl([str(tree / "a")], follow_symlinks=follow_symlinks))
+    expected = ["a/four.nc", "a/sub/three.nc", "a/tmp/five.nc"]
+    if follow_symlinks:
+        # The loop leads back to the (already searched) directory a, and is
+        # not followed again
+        expected += [
+            "a/link_to_one.nc",
+            "a/link_to_b/two.nc",
+            "a/link_to_b/loop/top.nc",
+        ]
+    assert sorted(found) == sorted(expected)
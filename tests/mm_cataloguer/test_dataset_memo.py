@@ -0,0 +1,33 @@
+"""Test memoization of values derived from NetCDF datasets."""
+
+from netCDF4 import Dataset
+
+from mm_cataloguer import dataset_memo
+from mm_cataloguer.dataset_memo import memoize_per_dataset
+
+
+def test_memoize_per_dataset(tmp_path):
+    calls = []
+
+    @memoize_per_dataset
+    def derived(dataset, name):
+        calls.append(name)
+        return dataset.variables[name][:].sum()
+
+    filepath = str(tmp_path / "memo.nc")
+    with Dataset(filepath, "w") as dataset:
+        dataset.createDimension("x", 3)
+        for name in ("a", "b"):
+            dataset.createVariable(name, "i4", ("x",))[:] = [1, 2, 3]
+
+    with Dataset(filepath) as dataset:
+        assert derived(dataset, "a") == 6
+        assert derived(dataset, "a") == 6
+        assert derived(dataset, "b") == 6
+        assert calls == ["a", "b"]
+
+    # Memo is discarded once the dataset is closed
+    with Dataset(filepath) as other:
+        assert derived(other, "a") == 6
+        assert dataset not in dataset_memo._memos
+        assert calls == ["a", "b", "a"]
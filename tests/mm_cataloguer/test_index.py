@@ -26,27 +26,42 @@ more details.
 import os
 import datetime
 
+import numpy as np
 import pytest
 from netCDF4 import date2num, num2date, chartostring
 
 from dateutil.relativedelta import relativedelta
 
-from sqlalchemy import func, text
+from sqlalchemy import event, func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
 
 import pycrs
 
 from modelmeta import create_test_database
-from modelmeta import Level, DataFile, SpatialRefSys, Station
+from modelmeta import Level, DataFile, SpatialRefSys, Station, Model, TimeSet
+from modelmeta import EnsembleDataFileVariables
+from nchelpers import CFDataset
 from nchelpers.date_utils import to_datetime
 
+from mm_cataloguer.dimension_cache import DimensionCache
+from mm_cataloguer.journal import Journal
+from mm_cataloguer.statements import StatementCounter, query_budget
+from mm_cataloguer.timings import StageTimings
+
 from mm_cataloguer.index_netcdf import (
     index_netcdf_file,
     index_netcdf_files,
+    index_netcdf_files_in_batches,
+    find_update_or_insert_netcdf_file,
     find_update_or_insert_cf_file,
     index_cf_file,
     find_data_file_by_id_hash_filename,
+    file_status,
+    lock_data_file,
     insert_data_file,
     delete_data_file,
+    reindex_cf_file,
     insert_run,
     find_run,
     find_or_insert_run,
@@ -66,12 +81,16 @@ from mm_cataloguer.index_netcdf import (
     insert_level_set,
     find_level_set,
     find_or_insert_level_set,
+    level_set_fingerprint,
     insert_spatial_ref_sys,
     find_spatial_ref_sys,
     find_or_insert_spatial_ref_sys,
+    next_pcic_srid,
     insert_grid,
     find_grid,
     find_or_insert_grid,
+    grid_info_match_keys,
+    quantize_within_tolerance,
     insert_station,
     find_station,
     find_or_insert_station,
@@ -80,6 +99,7 @@ from mm_cataloguer.index_netcdf import (
     insert_timeset,
     find_timeset,
     find_or_insert_timeset,
+    timeset_content_hash,
     get_grid_info,
     get_level_set_info,
     seconds_since_epoch,
@@ -475,12 +495,30 @@ def test_insert_level_set(
         assert list(level.vertical_level for level in levels) == list(
             vertical_level for vertical_level in level_axis_var[:]
         )
+        assert level_set.fingerprint == level_set_fingerprint(
+            level_axis_var.units, [level.vertical_level for level in levels]
+        )
     else:
         check_insert(
             insert_level_set, test_session_with_empty_db, tiny_gridded_dataset, var_name
         )
 
 
+@pytest.mark.parametrize(
+    "level_units, vertical_levels",
+    [
+        ("hPa", [1000.0, 850.0]),  # subset
+        ("hPa", [1000.0, 850.0, 500.0, 250.0]),  # superset
+        ("hPa", [500.0, 850.0, 1000.0]),  # reordered
+        ("m", [1000.0, 850.0, 500.0]),  # other units
+    ],
+)
+def test_level_set_fingerprint(level_units, vertical_levels):
+    fingerprint = level_set_fingerprint("hPa", np.array([1000, 850, 500], "f4"))
+    assert fingerprint == level_set_fingerprint("hPa", [1000.0, 850.0, 500.0])
+    assert fingerprint != level_set_fingerprint(level_units, vertical_levels)
+
+
 @pytest.mark.parametrize(*level_set_parametrization, indirect=["tiny_gridded_dataset"])
 def test_find_level_set(
     test_session_with_empty_db,
@@ -549,6 +587,21 @@ def test_insert_spatial_ref_sys(test_session_with_empty_db, tiny_gridded_dataset
     sesh.close()
 
 
+def test_next_pcic_srid(test_session_with_empty_db):
+    sesh = test_session_with_empty_db
+    srid = next_pcic_srid(sesh)
+    assert srid >= 990000
+    assert sesh.get(SpatialRefSys, srid) is None
+
+
+def test_wkt_cached():
+    proj4_string = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    srtext = wkt(proj4_string)
+    hits = wkt.cache_info().hits
+    assert wkt(proj4_string) is srtext
+    assert wkt.cache_info().hits == hits + 1
+
+
 def test_find_spatial_ref_sys(test_session_with_empty_db, tiny_gridded_dataset, insert):
     check_find(
         find_spatial_ref_sys,
@@ -622,12 +675,70 @@ def test_insert_grid(test_session_with_empty_db, tiny_gridded_dataset):
         yc_units=info["yc_var"].units,
     )
     assert grid.srid == srs.id
+    assert grid.match_key == grid_info_match_keys(info, srs.id)[0]
     if grid.evenly_spaced_y:
         assert len(grid.y_cell_bounds) == 0
     else:
         assert len(grid.y_cell_bounds) == len(info["yc_var"][:])
 
 
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (0.0, ["0.0000e+00"]),
+        (0.5, ["5.0000e-01"]),
+        (-140.25, ["-1.4025e+02"]),
+        # Close to bucket boundaries
+        (1.23455, ["1.2345e+00", "1.2346e+00"]),
+        (-1.23455, ["-1.2345e+00", "-1.2346e+00"]),
+        (9.999995, ["1.0000e+01"]),
+    ],
+)
+def test_quantize_within_tolerance(value, expected):
+    assert quantize_within_tolerance(value) == expected
+
+
+@pytest.mark.parametrize("relative_error", [0, 5e-7, -5e-7])
+@pytest.mark.parametrize("xc_origin", [-140.0, -140.005])
+def test_grid_info_match_keys(xc_origin, relative_error):
+    # A grid's own match key is among the match keys of any grid matching it
+    def info(xc_origin):
+        return {
+            "xc_values": np.array([xc_origin, xc_origin + 0.5], "f4"),
+            "yc_values": np.array([40.0, 40.5]),
+            "xc_grid_step": 0.5,
+            "yc_grid_step": 0.5,
+            "evenly_spaced_y": True,
+        }
+
+    own_key = grid_info_match_keys(info(xc_origin), 4326)[0]
+    assert own_key in grid_info_match_keys(info(xc_origin * (1 + relative_error)), 4326)
+
+
+def test_find_or_insert_grid_locks(
+    monkeypatch, test_session_with_empty_db, tiny_gridded_dataset
+):
+    # Insertion is locked on every match key of a matching grid, since
+    # matching grids on either side of a bucket boundary have different keys
+    locked = []
+
+    def lock_all_for_insert(sesh, keys):
+        locked.extend(keys)
+        return False
+
+    monkeypatch.setattr(
+        "mm_cataloguer.index_netcdf.lock_all_for_insert", lock_all_for_insert
+    )
+    var_name = tiny_gridded_dataset.dependent_varnames()[0]
+    grid = find_or_insert_grid(
+        test_session_with_empty_db, tiny_gridded_dataset, var_name
+    )
+    match_keys = grid_info_match_keys(
+        get_grid_info(tiny_gridded_dataset, var_name), grid.srid
+    )
+    assert sorted(locked) == sorted(("grids", key) for key in match_keys)
+
+
 def test_find_grid(test_session_with_empty_db, tiny_gridded_dataset, insert):
     check_find(
         find_grid,
@@ -744,6 +855,16 @@ def test_find_or_insert_stations(test_session_with_empty_db, tiny_dsg_dataset):
         )
 
 
+def test_find_or_insert_stations_existing(test_session_with_empty_db, tiny_dsg_dataset):
+    # Stations already in the database are found, not inserted again
+    sesh = test_session_with_empty_db
+    var_name = tiny_dsg_dataset.dependent_varnames()[0]
+    inserted = find_or_insert_stations(sesh, tiny_dsg_dataset, var_name)
+    found = find_or_insert_stations(sesh, tiny_dsg_dataset, var_name)
+    assert found == inserted
+    assert sesh.query(Station).count() == len(set(inserted))
+
+
 # DataFileVariableDSGTimeSeriesXStation
 
 
@@ -811,6 +932,7 @@ def test_insert_data_file_variable_dsg_time_series(
         variable_cell_methods=getattr(variable, "cell_methods", None),
         range_min=range_min,
         range_max=range_max,
+        range_source="data",
         disabled=False,
     )
     assert dfv.variable_alias == find_variable_alias(
@@ -911,6 +1033,7 @@ def test_insert_data_file_variable_gridded(
         variable_cell_methods=variable.cell_methods,
         range_min=range_min,
         range_max=range_max,
+        range_source="data",
         disabled=False,
     )
     assert dfv.variable_alias == find_variable_alias(
@@ -974,6 +1097,20 @@ def test_insert_timeset(test_session_with_empty_db, tiny_gridded_dataset):
         time_resolution=tiny_gridded_dataset.time_resolution,
     )
     assert len(timeset.times) == len(tiny_gridded_dataset.time_var[:])
+    # Content hash is that of the stored time set
+    assert timeset.content_hash == timeset_content_hash(
+        timeset.calendar,
+        timeset.start_date,
+        timeset.end_date,
+        timeset.multi_year_mean,
+        timeset.time_resolution,
+        timeset.num_times,
+        [time.timestep for time in sorted(timeset.times, key=lambda t: t.time_idx)],
+        [
+            (ct.time_start, ct.time_end)
+            for ct in sorted(timeset.climatological_times, key=lambda t: t.time_idx)
+        ],
+    )
     if tiny_gridded_dataset.is_multi_year_mean:
         climatology_bounds = tiny_gridded_dataset.variables[
             tiny_gridded_dataset.climatology_bounds_var_name
@@ -1025,6 +1162,37 @@ def test_insert_timeset(test_session_with_empty_db, tiny_gridded_dataset):
         )
 
 
+def test_timeset_content_hash():
+    def content_hash(timesteps, climatology_bounds=()):
+        return timeset_content_hash(
+            "standard",
+            timesteps[0],
+            timesteps[-1],
+            bool(climatology_bounds),
+            "monthly",
+            len(timesteps),
+            timesteps,
+            climatology_bounds,
+        )
+
+    timesteps = [datetime.datetime(2000, month, 15) for month in range(1, 13)]
+    assert content_hash(timesteps) == content_hash(list(timesteps))
+    # Same attributes, different interior timesteps
+    assert content_hash(timesteps) != content_hash(
+        timesteps[:5] + [datetime.datetime(2000, 6, 16)] + timesteps[6:]
+    )
+    # Same timesteps, different climatology bounds
+    climatology_bounds = [
+        (datetime.datetime(1971, month, 1), datetime.datetime(2000, month, 28))
+        for month in range(1, 13)
+    ]
+    assert content_hash(timesteps, climatology_bounds) != content_hash(
+        timesteps,
+        climatology_bounds[:-1]
+        + [(datetime.datetime(1961, 12, 1), datetime.datetime(1990, 12, 28))],
+    )
+
+
 @pytest.mark.slow
 def test_find_timeset(test_session_with_empty_db, tiny_gridded_dataset, insert):
     check_find(
@@ -1100,6 +1268,16 @@ def test_find_data_file(test_session_with_empty_db, tiny_any_dataset, insert):
         assert not filename_match
 
 
+def test_find_data_file_single_query(test_session_with_empty_db, tiny_any_dataset):
+    sesh = test_session_with_empty_db
+    data_file = insert_data_file(sesh, tiny_any_dataset)
+    sesh.flush()
+
+    with query_budget(sesh.get_bind(), 1):
+        matches = find_data_file_by_id_hash_filename(sesh, tiny_any_dataset)
+    assert matches == (data_file, data_file, data_file)
+
+
 @pytest.mark.slow
 def test_delete_data_file(test_session_with_empty_db, tiny_any_dataset):
     data_file = insert_data_file(test_session_with_empty_db, tiny_any_dataset)
@@ -1109,6 +1287,79 @@ def test_delete_data_file(test_session_with_empty_db, tiny_any_dataset):
     ) == (None, None, None)
 
 
+@pytest.mark.slow
+def test_reindex_cf_file(
+    monkeypatch, test_session_with_empty_db, tiny_any_dataset, ensemble1
+):
+    sesh = test_session_with_empty_db
+    data_file = index_cf_file(sesh, tiny_any_dataset)
+    ensemble1.data_file_variables = list(data_file.data_file_variables)
+    sesh.add(ensemble1)
+    sesh.flush()
+    data_file_id = data_file.id
+    dfv_ids = sorted(dfv.id for dfv in data_file.data_file_variables)
+
+    def ensemble_dfv_ids():
+        return sorted(
+            edfv.data_file_variable_id
+            for edfv in sesh.query(EnsembleDataFileVariables).filter_by(
+                ensemble_id=ensemble1.id
+            )
+        )
+
+    # Modified file: records are updated in place, keeping their ids and
+    # ensemble memberships
+    monkeypatch.setattr(
+        "mm_cataloguer.index_netcdf.get_var_range",
+        lambda sesh, cf, var_name: (-1.0, 1.0, "data"),
+    )
+    modified = Mock(tiny_any_dataset, first_MiB_md5sum="foo")
+    assert reindex_cf_file(sesh, data_file, modified) is data_file
+    sesh.flush()
+    assert data_file.id == data_file_id
+    assert data_file.first_1mib_md5sum == "foo"
+    assert sorted(dfv.id for dfv in data_file.data_file_variables) == dfv_ids
+    for dfv in data_file.data_file_variables:
+        check_properties(dfv, range_min=-1.0, range_max=1.0, range_source="data")
+    assert ensemble_dfv_ids() == dfv_ids
+
+    # Variables no longer in the file are removed, with their ensemble
+    # memberships
+    emptied = Mock(tiny_any_dataset, dependent_varnames=lambda: [])
+    reindex_cf_file(sesh, data_file, emptied)
+    sesh.flush()
+    assert data_file.data_file_variables == []
+    assert ensemble_dfv_ids() == []
+
+    # Variables new to the file are added
+    reindex_cf_file(sesh, data_file, tiny_any_dataset)
+    sesh.flush()
+    assert len(data_file.data_file_variables) == len(dfv_ids)
+    assert data_file.id == data_file_id
+
+
+@pytest.mark.slow
+def test_lock_data_file(test_session_factory_fs, tiny_gridded_dataset):
+    first = test_session_factory_fs()
+    second = test_session_factory_fs()
+    assert lock_data_file(first, tiny_gridded_dataset)
+
+    # Until the first session's transaction ends, no other session can lock
+    # the file, under its own path or another with the same unique id.
+    moved = Mock(tiny_gridded_dataset, filepath=lambda **kwargs: "/moved.nc")
+    for cf in [tiny_gridded_dataset, moved]:
+        second.execute(text("SET LOCAL lock_timeout = '100ms'"))
+        with pytest.raises(OperationalError):
+            lock_data_file(second, cf)
+        second.rollback()
+
+    first.commit()
+    assert lock_data_file(second, moved)
+    second.rollback()
+    first.close()
+    second.close()
+
+
 # Root functions
 
 # TODO: Test for multiple entries for same file
@@ -1118,7 +1369,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
 
 @pytest.mark.slow
 @pytest.mark.parametrize(
-    "dataset_mocks, os_path_mocks, same_data_file",
+    "dataset_mocks, os_path_mocks, expected",
     [
         # new file: no match on id, hash, or filename
         (
@@ -1128,10 +1379,10 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "filepath": lambda **kwargs: "foo",
             },
             {},
-            False,
+            "new",
         ),
         # same file
-        ({}, {}, True),
+        ({}, {}, "same"),
         # symlinked and unmodified file
         (
             {
@@ -1142,7 +1393,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "realpath": lambda fp: "bar",  # links to another file
                 "getmtime": lambda fp: 0,  # don't care (prevent exception)
             },
-            True,
+            "same",
         ),
         # symlinked and modified file (hash changed)
         (
@@ -1155,7 +1406,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "realpath": lambda fp: "bar",  # links to another file
                 "getmtime": lambda fp: 0,  # don't care (prevent exception)
             },
-            True,
+            "same",
         ),
         # symlinked and modified file (mod time changed)
         (
@@ -1167,7 +1418,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "realpath": lambda fp: "bar",  # links to another file
                 "getmtime": lambda fp: far_future,  # much later
             },
-            True,
+            "same",
         ),
         # copy of file
         (
@@ -1179,7 +1430,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "realpath": lambda fp: fp,  # is the same file
                 "getmtime": lambda fp: 0,  # don't care (prevent exception)
             },
-            True,
+            "same",
         ),
         # moved file
         (
@@ -1191,14 +1442,14 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "realpath": lambda fp: "foo",  # resolve to same file name
                 "getmtime": lambda fp: 0,  # don't care (prevent exception)
             },
-            True,
+            "same",
         ),
         # indexed under different id
-        ({"unique_id": "foo"}, {}, True),  # different unique id
+        ({"unique_id": "foo"}, {}, "same"),  # different unique id
         # modified file (hash changed)
-        ({"first_MiB_md5sum": "foo"}, {}, False),  # different hash
+        ({"first_MiB_md5sum": "foo"}, {}, "updated"),  # different hash
         # modified file (modification time changed)
-        ({}, {"getmtime": lambda fp: far_future}, False),  # much later
+        ({}, {"getmtime": lambda fp: far_future}, "updated"),  # much later
         # moved and modified file (hash changed)
         (
             {
@@ -1209,7 +1460,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "isfile": lambda fp: False,  # old file gone
                 "getmtime": lambda fp: 0,  # don't care (prevent exception)
             },
-            False,
+            "updated",
         ),
         # moved and modified file (modification time changed)
         (
@@ -1220,7 +1471,7 @@ far_future = seconds_since_epoch(datetime.datetime(2100, 1, 1))
                 "isfile": lambda fp: False,  # old file gone
                 "getmtime": lambda fp: far_future,  # much later
             },
-            False,
+            "updated",
         ),
     ],
 )
@@ -1230,7 +1481,7 @@ def test_find_update_or_insert_cf_file__dup(
     tiny_any_dataset,
     dataset_mocks,
     os_path_mocks,
-    same_data_file,
+    expected,
 ):
     """Test cases where the data file to be inserted is a variant of an
     existing data file.
@@ -1241,6 +1492,9 @@ def test_find_update_or_insert_cf_file__dup(
     should be mocked for the test.
     ``os_path_mocks`` specifies how attributes of ``os.path`` (which is called
     on the dataset filename) should be changed for the test.
+    ``expected`` is "new" if a new data file should be inserted, "same" if the
+    existing data file should be found unchanged, and "updated" if the
+    existing data file should be updated in place.
     """
     # Index original file
     data_file1 = index_cf_file(test_session_with_empty_db, tiny_any_dataset)
@@ -1249,6 +1503,12 @@ def test_find_update_or_insert_cf_file__dup(
     # Mock specified differences into tiny_gridded_dataset
     other_tiny_gridded_dataset = Mock(tiny_any_dataset, **dataset_mocks)
 
+    # Mocked file paths do not exist; give them the status of the original file
+    status = file_status(tiny_any_dataset.filepath())
+    monkeypatch.setattr(
+        "mm_cataloguer.index_netcdf.file_status", lambda filepath: status
+    )
+
     # Mock specified differences into os.path
     for attr, value in os_path_mocks.items():
         monkeypatch.setattr(os.path, attr, value)
@@ -1276,8 +1536,8 @@ def test_find_update_or_insert_cf_file__dup(
     }
 
     # Check second indexing
-    assert (data_file1 == data_file2) == same_data_file
-    if not same_data_file and properties:
+    assert (data_file1 == data_file2) == (expected != "new")
+    if expected != "same" and properties:
         check_properties(data_file2, **properties)
 
 
@@ -1354,3 +1614,299 @@ def test_index_netcdf_files(test_dsn_fs, test_engine_fs):
 
     # Check results
     assert all(data_file_ids)
+
+
+@pytest.mark.slow
+def test_index_netcdf_files_parallel(test_dsn_fs, test_engine_fs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+
+    # Index files. Several of these files share a Model, Emission, and Run,
+    # which the workers race to insert.
+    test_files = [
+        "data/tiny_gcm.nc",
+        "data/tiny_gcm_climo_monthly.nc",
+        "data/tiny_gcm_climo_seasonal.nc",
+        "data/tiny_gcm_climo_yearly.nc",
+        "data/bad_tiny_gcm.nc",
+        "data/tiny_downscaled.nc",
+    ]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    data_file_ids = index_netcdf_files(
+        filenames, test_dsn_fs, jobs=3, files_per_worker=2
+    )
+
+    # Check results: in input order, with the bad file failing alone
+    assert len(data_file_ids) == len(filenames)
+    assert [id is None for id in data_file_ids] == ["bad_" in f for f in test_files]
+    Session = sessionmaker(bind=test_engine_fs)
+    session = Session()
+    for filename, data_file_id in zip(filenames, data_file_ids):
+        if data_file_id is not None:
+            data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+            assert data_file.filename == filename
+    model_counts = (
+        session.query(Model.short_name, func.count(Model.id))
+        .group_by(Model.short_name)
+        .all()
+    )
+    assert all(count == 1 for _, count in model_counts)
+    assert session.query(TimeSet).count() == len(
+        set(session.query(DataFile.time_set_id).all())
+    )
+    session.close()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_index_netcdf_files_in_batches(test_dsn_fs, test_engine_fs, jobs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+
+    # Index files, several per transaction. The bad file must be rolled back
+    # alone.
+    test_files = [
+        "data/tiny_gcm.nc",
+        "data/bad_tiny_gcm.nc",
+        "data/tiny_gcm_climo_monthly.nc",
+        "data/tiny_downscaled.nc",
+        "data/tiny_streamflow.nc",
+    ]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    data_file_ids = index_netcdf_files(filenames, test_dsn_fs, jobs=jobs, batch_size=3)
+
+    # Check results
+    assert [id is None for id in data_file_ids] == ["bad_" in f for f in test_files]
+    Session = sessionmaker(bind=test_engine_fs)
+    session = Session()
+    assert session.query(DataFile).count() == len(filenames) - 1
+    for filename, data_file_id in zip(filenames, data_file_ids):
+        if data_file_id is not None:
+            data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+            assert data_file.filename == filename
+    session.close()
+
+
+@pytest.mark.slow
+def test_index_netcdf_files_in_batches_deadlock(monkeypatch, test_engine_fs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+    Session = sessionmaker(bind=test_engine_fs)
+
+    # Indexing the second file deadlocks, once, with a batch in another worker
+    # that is waiting for the locks taken for the first file
+    test_files = [
+        "data/tiny_gcm.nc",
+        "data/tiny_downscaled.nc",
+        "data/tiny_streamflow.nc",
+    ]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    attempted = []
+
+    class DeadlockDetected(Exception):
+        pgcode = "40P01"
+
+    def find_update_or_insert(sesh, filename):
+        attempted.append(filename)
+        if attempted == filenames[:2]:
+            raise OperationalError(
+                "SELECT pg_advisory_xact_lock", {}, DeadlockDetected()
+            )
+        return find_update_or_insert_netcdf_file(sesh, filename)
+
+    monkeypatch.setattr(
+        "mm_cataloguer.index_netcdf.find_update_or_insert_netcdf_file",
+        find_update_or_insert,
+    )
+    committed = []
+    errors = {}
+    data_file_ids = index_netcdf_files_in_batches(
+        filenames, Session, batch_size=3, on_commit=committed.append, errors=errors
+    )
+
+    # The file is not retried in its batch, which still holds the locks of the
+    # first file, but on its own once the batch has committed
+    assert attempted == filenames + filenames[1:2]
+    assert all(data_file_ids)
+    assert committed == [data_file_ids]
+    assert errors == {}
+    session = Session()
+    for filename, data_file_id in zip(filenames, data_file_ids):
+        data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+        assert data_file.filename == filename
+    session.close()
+
+
+@pytest.mark.slow
+def test_index_netcdf_files_fast_skip(monkeypatch, test_dsn_fs, test_engine_fs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+
+    # Index file
+    filenames = [resource_filename("modelmeta", "data/tiny_gcm.nc")]
+    (data_file_id,) = index_netcdf_files(filenames, test_dsn_fs)
+
+    # File status is recorded
+    Session = sessionmaker(bind=test_engine_fs)
+    session = Session()
+    data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+    status = os.stat(filenames[0])
+    assert data_file.file_size == status.st_size
+    assert data_file.file_mtime_ns == status.st_mtime_ns
+    assert data_file.file_inode == status.st_ino
+    index_time = data_file.index_time
+    session.close()
+
+    # Index unchanged file again: it is not opened, and nothing is updated
+    def open_file(*args, **kwargs):
+        raise AssertionError("Unchanged file opened")
+
+    monkeypatch.setattr("mm_cataloguer.index_netcdf.CFDataset", open_file)
+    data_file_ids = index_netcdf_files(
+        filenames, test_dsn_fs, fast_skip=True, touch_skipped=False
+    )
+    assert data_file_ids == [data_file_id]
+    session = Session()
+    data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+    assert data_file.index_time == index_time
+    session.close()
+
+
+@pytest.mark.slow
+def test_index_netcdf_files_resume(monkeypatch, tmp_path, test_dsn_fs, test_engine_fs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+
+    # Index files, recording their outcomes in a journal
+    test_files = ["data/tiny_gcm.nc", "data/bad_tiny_gcm.nc", "data/tiny_downscaled.nc"]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    journal_path = str(tmp_path / "journal.sqlite")
+    with Journal(journal_path) as journal:
+        data_file_ids = index_netcdf_files(filenames, test_dsn_fs, journal=journal)
+    assert [id is None for id in data_file_ids] == ["bad_" in f for f in test_files]
+
+    # Resume the run: only the failed file is opened again
+    opened = []
+
+    def open_file(filename, *args, **kwargs):
+        opened.append(filename)
+        raise IOError("Cannot open file")
+
+    monkeypatch.setattr("mm_cataloguer.index_netcdf.CFDataset", open_file)
+    with Journal(journal_path, resume=True, retry_seconds=0) as journal:
+        assert (
+            index_netcdf_files(filenames, test_dsn_fs, journal=journal, batch_size=2)
+            == data_file_ids
+        )
+    assert opened == [filenames[1]]
+
+    # Failed again, it is not retried until its retry delay has passed
+    opened.clear()
+    with Journal(journal_path, resume=True) as journal:
+        assert index_netcdf_files(filenames, test_dsn_fs, journal=journal) == (
+            data_file_ids
+        )
+    assert opened == []
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_index_netcdf_files_timings(test_dsn_fs, test_engine_fs, jobs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+
+    # Index files, timing each stage, in this process or in workers
+    test_files = ["data/tiny_gcm.nc", "data/tiny_downscaled.nc"]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    timings = StageTimings()
+    assert all(index_netcdf_files(filenames, test_dsn_fs, jobs=jobs, timings=timings))
+
+    summary = timings.summary()
+    assert summary["files"] == len(filenames)
+    assert summary["bytes"] == sum(os.path.getsize(f) for f in filenames)
+    for stage in [
+        "file",
+        "open",
+        "md5",
+        "lock",
+        "lookup",
+        "time_conversion",
+        "var_range",
+        "flush",
+        "commit",
+    ]:
+        assert summary["stages"][stage]["count"] >= len(filenames)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_index_netcdf_files_statements(test_dsn_fs, test_engine_fs, jobs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+
+    # Index files, counting statements, in this process or in workers
+    test_files = ["data/tiny_gcm.nc", "data/tiny_downscaled.nc"]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    statements = StatementCounter()
+    assert all(
+        index_netcdf_files(filenames, test_dsn_fs, jobs=jobs, statements=statements)
+    )
+
+    assert statements.count("select") > 0
+    assert statements.count("insert") > 0
+    assert sum(tally.count for tally in statements.shapes.values()) == (
+        statements.count()
+    )
+
+
+@pytest.fixture(scope="function")
+def cached_session_factory(test_engine_fs):
+    Session = sessionmaker(bind=test_engine_fs)
+    DimensionCache().install(Session)
+    yield Session
+
+
+@pytest.fixture(scope="function")
+def statements(test_engine_fs):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(test_engine_fs, "before_cursor_execute", count)
+    yield statements
+    event.remove(test_engine_fs, "before_cursor_execute", count)
+
+
+@pytest.mark.slow
+def test_dimension_cache_after_commit(cached_session_factory, statements):
+    filepath = resource_filename("modelmeta", "data/tiny_gcm.nc")
+    assert index_netcdf_file(filepath, cached_session_factory) is not None
+
+    # Dimension records committed by indexing are found without querying.
+    session = cached_session_factory()
+    with CFDataset(filepath) as cf:
+        var_name = cf.dependent_varnames()[0]
+        del statements[:]
+        run = find_run(session, cf)
+        assert run is not None
+        assert find_model(session, cf).id == run.model_id
+        assert find_emission(session, cf).id == run.emission_id
+        assert find_variable_alias(session, cf, var_name) is not None
+        assert find_grid(session, cf, var_name) is not None
+        assert find_timeset(session, cf) is not None
+        assert statements == []
+    session.close()
+
+
+@pytest.mark.slow
+def test_dimension_cache_after_rollback(cached_session_factory):
+    filepath = resource_filename("modelmeta", "data/tiny_gcm.nc")
+    session = cached_session_factory()
+    with CFDataset(filepath) as cf:
+        model = insert_model(session, cf)
+        session.flush()
+        assert find_model(session, cf) is model
+        session.rollback()
+        assert find_model(session, cf) is None
+    session.close()
@@ -0,0 +1,56 @@
+"""Test the checkpoint journal for resumable indexing runs."""
+
+import time
+
+import pytest
+
+from mm_cataloguer.journal import Journal
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.sqlite")
+
+
+def test_journal_resume(journal_path):
+    with Journal(journal_path) as journal:
+        journal.record(["/data/a.nc", "/data/bad.nc"], [1, None])
+        assert journal.previous_outcome("/data/a.nc")[:2] == (1, 0)
+        assert journal.previous_outcome("/data/bad.nc")[:2] == (None, 1)
+        assert journal.previous_outcome("/data/new.nc") is None
+
+    with Journal(journal_path, resume=True, retry_seconds=3600) as journal:
+        assert journal.skip("/data/a.nc") == (True, 1)
+        assert journal.skip("/data/new.nc") == (False, None)
+        # Failed too recently to retry
+        assert journal.skip("/data/bad.nc") == (True, None)
+
+    with Journal(journal_path) as journal:
+        # Not resumed: previous outcomes are discarded
+        assert journal.previous_outcome("/data/a.nc") is None
+
+
+def test_journal_backoff(journal_path, monkeypatch):
+    with Journal(journal_path, retry_seconds=10, max_retry_seconds=25) as journal:
+        assert [journal.retry_delay(n) for n in range(1, 5)] == [10, 20, 25, 25]
+
+        journal.record(["/data/bad.nc"], [None])
+        journal.record(["/data/bad.nc"], [None])
+        assert journal.previous_outcome("/data/bad.nc")[:2] == (None, 2)
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 19)
+        assert journal.skip("/data/bad.nc") == (True, None)
+        monkeypatch.setattr(time, "time", lambda: now + 21)
+        assert journal.skip("/data/bad.nc") == (False, None)
+
+        # Indexing a file resets its failures
+        journal.record(["/data/bad.nc"], [5])
+        journal.record(["/data/bad.nc"], [None])
+        assert journal.previous_outcome("/data/bad.nc")[:2] == (None, 1)
+
+
+def test_journal_relative_paths(journal_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with Journal(journal_path) as journal:
+        journal.record(["a.nc"], [1])
+        assert journal.skip(str(tmp_path / "a.nc")) == (True, 1)
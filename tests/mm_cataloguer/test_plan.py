@@ -0,0 +1,202 @@
+"""Test classification of files before indexing, and execution of plans."""
+
+import datetime
+import io
+import os
+import shutil
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from modelmeta import create_test_database, DataFile
+from mm_cataloguer.index_netcdf import (
+    classify_data_file,
+    file_status,
+    index_cf_file,
+    index_netcdf_files,
+)
+from mm_cataloguer.plan import (
+    PlanEntry,
+    execute_plan,
+    plan_files,
+    plan_netcdf_files,
+    read_plan,
+    write_plan,
+)
+from tests.test_helpers import resource_filename
+
+
+class StubDataFile:
+    def __init__(self, id, filename, index_time):
+        self.id = id
+        self.filename = filename
+        self.index_time = index_time
+
+
+past = datetime.datetime(2000, 1, 1)
+future = datetime.datetime(2100, 1, 1)
+
+
+@pytest.fixture
+def file(tmp_path):
+    path = tmp_path / "file.nc"
+    path.write_text("x")
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "matches, index_time, action",
+    [
+        ("", future, "new"),
+        ("ihf", future, "same"),
+        ("ihf", past, "modified"),
+        ("if", future, "modified"),
+        ("hf", future, "different_unique_id"),
+        ("ih", future, "moved"),
+        ("i", future, "moved_modified"),
+    ],
+)
+def test_classify_data_file(file, tmp_path, matches, index_time, action):
+    # A DataFile for this file, or, if it is not matched by filename, for
+    # another file that no longer exists
+    data_file = StubDataFile(
+        id=1,
+        filename=file if "f" in matches else str(tmp_path / "gone.nc"),
+        index_time=index_time,
+    )
+    match = {key: data_file if key in matches else None for key in "ihf"}
+    assert classify_data_file(file, match["i"], match["h"], match["f"]) == (
+        action,
+        data_file if matches else None,
+    )
+
+
+def test_classify_data_file_conflict(file):
+    data_file = StubDataFile(id=1, filename=file, index_time=future)
+    other = StubDataFile(id=2, filename=file, index_time=future)
+    assert classify_data_file(file, data_file, other, None) == ("conflict", None)
+
+
+def test_plan_file_round_trip():
+    plan = [
+        PlanEntry(
+            "/data/a.nc",
+            "same",
+            1,
+            {"file_size": 10, "file_mtime_ns": 20, "file_inode": 30},
+        ),
+        PlanEntry("/data/b.nc", "new", None),
+    ]
+    file = io.StringIO()
+    assert write_plan(iter(plan), file) == plan
+    file.seek(0)
+    assert read_plan(file) == plan
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("fast_skip", [False, True])
+def test_plan_files(test_session_with_empty_db, tiny_gridded_dataset, fast_skip):
+    sesh = test_session_with_empty_db
+    data_file = index_cf_file(sesh, tiny_gridded_dataset)
+    indexed = os.path.realpath(tiny_gridded_dataset.filepath())
+    other = resource_filename("modelmeta", "data/tiny_streamflow.nc")
+    missing = os.path.abspath("missing.nc")
+
+    assert plan_files(sesh, [indexed, other, missing], fast_skip=fast_skip) == [
+        PlanEntry(indexed, "same", data_file.id, file_status(indexed)),
+        PlanEntry(other, "new", None, file_status(other)),
+        PlanEntry(missing, "unreadable", None, None),
+    ]
+
+
+@pytest.mark.slow
+def test_execute_plan(test_dsn_fs, test_engine_fs):
+    # Set up test database
+    create_test_database(test_engine_fs)
+    test_files = ["data/tiny_gcm.nc", "data/tiny_downscaled.nc"]
+    filenames = [resource_filename("modelmeta", f) for f in test_files]
+    (indexed_id,) = index_netcdf_files(filenames[:1], test_dsn_fs)
+    Session = sessionmaker(bind=test_engine_fs)
+    session = Session()
+    index_time = session.query(DataFile).filter_by(id=indexed_id).one().index_time
+    session.close()
+
+    # Plan: only the second file needs to be indexed
+    plan = list(plan_netcdf_files(filenames, test_dsn_fs, chunk_size=1))
+    assert [entry.action for entry in plan] == ["same", "new"]
+
+    data_file_ids = execute_plan(plan, test_dsn_fs)
+    assert data_file_ids[0] == indexed_id
+    assert data_file_ids[1] is not None
+    session = Session()
+    assert session.query(DataFile).count() == 2
+    touched = session.query(DataFile).filter_by(id=indexed_id).one()
+    assert touched.index_time > index_time
+    session.close()
+
+
+@pytest.fixture
+def spy_indexer(monkeypatch):
+    """Record the files that execute_plan passes to the indexer."""
+    indexed = []
+
+    def spy(filenames, *args, **kwargs):
+        indexed.extend(filenames)
+        return index_netcdf_files(filenames, *args, **kwargs)
+
+    monkeypatch.setattr("mm_cataloguer.plan.index_netcdf_files", spy)
+    return indexed
+
+
+@pytest.mark.slow
+def test_execute_plan_modified_after_planning(
+    tmp_path, test_dsn_fs, test_engine_fs, spy_indexer
+):
+    # Set up test database
+    create_test_database(test_engine_fs)
+    filename = str(tmp_path / "tiny_gcm.nc")
+    shutil.copy(resource_filename("modelmeta", "data/tiny_gcm.nc"), filename)
+    (data_file_id,) = index_netcdf_files([filename], test_dsn_fs)
+    (entry,) = plan_netcdf_files([filename], test_dsn_fs, fast_skip=True)
+    assert entry.action == "same"
+
+    # Modify the file without changing its unique id or first MiB (as
+    # appending past its first MiB would): only its modification time changes.
+    status = os.stat(filename)
+    os.utime(filename, ns=(status.st_atime_ns, status.st_mtime_ns + 60 * 10**9))
+
+    # The file is classified again, and re-indexed, rather than its new
+    # status recorded as if it were unchanged
+    assert execute_plan([entry], test_dsn_fs) == [data_file_id]
+    assert spy_indexer == [filename]
+    Session = sessionmaker(bind=test_engine_fs)
+    session = Session()
+    data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+    assert data_file.file_mtime_ns == os.stat(filename).st_mtime_ns
+    session.close()
+
+
+@pytest.mark.slow
+def test_execute_plan_moved_back_after_planning(
+    tmp_path, test_dsn_fs, test_engine_fs, spy_indexer
+):
+    # Set up test database
+    create_test_database(test_engine_fs)
+    old_filename = str(tmp_path / "old.nc")
+    new_filename = str(tmp_path / "new.nc")
+    shutil.copy(resource_filename("modelmeta", "data/tiny_gcm.nc"), old_filename)
+    (data_file_id,) = index_netcdf_files([old_filename], test_dsn_fs)
+    os.rename(old_filename, new_filename)
+    (entry,) = plan_netcdf_files([new_filename], test_dsn_fs)
+    assert entry.action == "moved"
+
+    # The file it was moved from exists again: the file is now a copy, and
+    # its DataFile keeps the old filename
+    shutil.copy(new_filename, old_filename)
+    assert execute_plan([entry], test_dsn_fs) == [data_file_id]
+    assert spy_indexer == [new_filename]
+    Session = sessionmaker(bind=test_engine_fs)
+    session = Session()
+    data_file = session.query(DataFile).filter_by(id=data_file_id).one()
+    assert data_file.filename == os.path.realpath(old_filename)
+    session.close()
@@ -0,0 +1,175 @@
+"""Test counting and timing of SQL statements."""
+
+import logging
+import pickle
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from mm_cataloguer.statements import (
+    StatementCounter,
+    query_budget,
+    record_statement,
+    session_info_key,
+    statement_kind,
+    statement_scope,
+    statement_shape,
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE files (id INTEGER, filename TEXT)"))
+        conn.execute(
+            text("INSERT INTO files VALUES (:id, :filename)"),
+            [{"id": i, "filename": "f{}.nc".format(i)} for i in range(3)],
+        )
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize(
+    "statement, shape",
+    [
+        (
+            "SELECT * FROM files\n  WHERE id = 12 AND filename = 'a.nc'",
+            "SELECT * FROM files WHERE id = ? AND filename = ?",
+        ),
+        (
+            "SELECT * FROM files WHERE id IN (%(id_1_1)s, %(id_1_2)s)",
+            "SELECT * FROM files WHERE id IN (...)",
+        ),
+        (
+            "SELECT * FROM files WHERE id IN (?, ?, ?)",
+            "SELECT * FROM files WHERE id IN (...)",
+        ),
+        (
+            "INSERT INTO files (id, filename) VALUES (?, ?), (?, ?), (?, ?)",
+            "INSERT INTO files (id, filename) VALUES (...)",
+        ),
+        (
+            "SELECT x::INTEGER FROM data_file_1 WHERE y = :y",
+            "SELECT x::INTEGER FROM data_file_1 WHERE y = ?",
+        ),
+    ],
+)
+def test_statement_shape(statement, shape):
+    assert statement_shape(statement) == shape
+
+
+def test_statement_kind():
+    assert statement_kind("  select 1") == "select"
+    assert statement_kind("INSERT INTO files VALUES (1)") == "insert"
+
+
+def test_counter(engine):
+    counter = StatementCounter()
+    counter.install(engine)
+    with engine.connect() as conn:
+        for i in range(3):
+            conn.execute(text("SELECT * FROM files WHERE id = :id"), {"id": i})
+        with counter.scope() as counts:
+            conn.execute(text("UPDATE files SET filename = 'x' WHERE id = 1"))
+    counter.remove(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert counter.count() == 4
+    assert counter.count("select") == 3
+    assert counter.count("update") == 1
+    assert counter.count("delete") == 0
+    assert counter.shapes["SELECT * FROM files WHERE id = ?"].count == 3
+    assert counts.count() == 1
+    assert counts.count("update") == 1
+
+    summary = counter.summary()
+    assert summary["statements"]["count"] == 4
+    assert summary["kinds"]["select"]["count"] == 3
+    assert len(summary["shapes"]) == 2
+
+
+def test_counter_failed_statement(engine):
+    counter = StatementCounter()
+    counter.install(engine)
+    with engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        assert conn.info["statement_counter_start_times"] == []
+    counter.remove(engine)
+    assert counter.count() == 1
+
+
+def test_record_statement(engine):
+    counter = StatementCounter()
+    counter.install(engine)
+    with engine.connect() as conn:
+        with counter.scope() as counts:
+            record_statement(conn, "COPY files (id) FROM STDIN", 0.5, rows=100)
+    counter.remove(engine)
+    with engine.connect() as conn:
+        record_statement(conn, "COPY files (id) FROM STDIN", 0.5, rows=100)
+
+    assert counter.count() == 1
+    assert counter.count("copy") == 1
+    assert counter.kinds["copy"].rows == 100
+    assert counts.count("copy") == 1
+    assert "1 copy of 100 rows" in counter.describe()
+
+
+def test_drain_and_merge(engine):
+    counter = StatementCounter()
+    counter.install(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    counter.remove(engine)
+
+    drained = pickle.loads(pickle.dumps(counter.drain()))
+    assert counter.count() == 0
+    assert drained.count("select") == 1
+    counter.merge(drained)
+    counter.merge(drained)
+    assert counter.count("select") == 2
+
+
+def test_statement_scope(engine, caplog):
+    logger = logging.getLogger(__name__)
+    caplog.set_level(logging.DEBUG, logger=__name__)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    with statement_scope(session, "no counter", logger):
+        session.execute(text("SELECT 1"))
+
+    counter = StatementCounter()
+    counter.install(engine)
+    session = Session(info={session_info_key: counter})
+    with statement_scope(session, "with counter", logger):
+        session.execute(text("SELECT 1"))
+    assert counter.count() == 1
+    assert counter.scopes == []
+    assert "no counter" not in caplog.text
+    assert "with counter: 1 statements" in caplog.text
+    session.close()
+    counter.remove(engine)
+
+
+def test_query_budget(engine):
+    with query_budget(engine, 1) as counter:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT * FROM files WHERE id IN (0, 1, 2)"))
+    assert counter.count() == 1
+
+    # One query per row exceeds the budget
+    with pytest.raises(AssertionError, match=r"3 x SELECT \* FROM files"):
+        with query_budget(engine, 1, kind="select"):
+            with engine.connect() as conn:
+                for i in range(3):
+                    conn.execute(text("SELECT * FROM files WHERE id = :id"), {"id": i})
+
+    # Statements of other kinds are not counted against a budget for one kind
+    with query_budget(engine, 0, kind="insert"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
@@ -0,0 +1,137 @@
+"""Test recording and reporting of stage timings."""
+
+import json
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+from mm_cataloguer.timings import StageTimings, percentile, session_info_key, timed
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.mark.parametrize(
+    "fraction, expected", [(0.5, 5), (0.95, 10), (1, 10), (0.01, 1)]
+)
+def test_percentile(fraction, expected):
+    assert percentile([10, 9, 8, 7, 6, 5, 4, 3, 2, 1], fraction) == expected
+
+
+def test_percentile_empty():
+    assert percentile([], 0.5) is None
+
+
+def test_summary(clock, tmp_path):
+    timings = StageTimings(clock=clock)
+    for seconds in (1, 2, 3, 10):
+        timings.add("open", seconds)
+    file = tmp_path / "file.nc"
+    file.write_bytes(b"x" * 100)
+    timings.add_file(str(file))
+    timings.add_file(str(tmp_path / "missing.nc"))
+    clock.now = 4
+
+    summary = timings.summary()
+    assert summary["files"] == 2
+    assert summary["bytes"] == 100
+    assert summary["files_per_second"] == 0.5
+    assert summary["bytes_per_second"] == 25
+    assert summary["stages"] == {
+        "open": {
+            "count": 4,
+            "total_seconds": 16,
+            "p50_seconds": 2,
+            "p95_seconds": 10,
+            "max_seconds": 10,
+        }
+    }
+
+    # Percentiles describe only later durations once samples are reset
+    timings.reset_samples()
+    timings.add("open", 4)
+    stage = timings.summary()["stages"]["open"]
+    assert (stage["count"], stage["p95_seconds"], stage["max_seconds"]) == (5, 4, 10)
+
+
+def test_drain_and_merge(clock):
+    # Timings drained in a worker and merged in the parent process
+    worker = StageTimings()
+    worker.add("open", 1)
+    worker.add_file("missing.nc")
+    drained = pickle.loads(pickle.dumps(worker.drain()))
+    assert worker.summary()["stages"] == {}
+    assert worker.files == 0
+
+    timings = StageTimings(clock=clock)
+    timings.add("open", 3)
+    timings.merge(drained)
+    clock.now = 1
+    summary = timings.summary()
+    assert summary["files"] == 1
+    assert summary["stages"]["open"]["count"] == 2
+    assert summary["stages"]["open"]["max_seconds"] == 3
+
+
+def test_timed():
+    timings = StageTimings()
+    sesh = SimpleNamespace(info={session_info_key: timings})
+    with pytest.raises(ValueError):
+        with timed(sesh, "lookup"):
+            raise ValueError()
+    assert timings.summary()["stages"]["lookup"]["count"] == 1
+
+    # Sessions without timings are not timed
+    with timed(SimpleNamespace(info={}), "lookup"):
+        pass
+
+
+def test_write(clock, tmp_path):
+    timings = StageTimings(clock=clock)
+    timings.add("commit", 0.5)
+    timings.add_file("missing.nc")
+    clock.now = 2
+    json_path = tmp_path / "timings.json"
+    prometheus_path = tmp_path / "timings.prom"
+    timings.write(json_path=str(json_path), prometheus_path=str(prometheus_path))
+
+    assert json.loads(json_path.read_text()) == timings.summary()
+    lines = prometheus_path.read_text().splitlines()
+    for line in [
+        "# TYPE modelmeta_index_stage_seconds summary",
+        'modelmeta_index_stage_seconds{stage="commit",quantile="0.5"} 0.5',
+        'modelmeta_index_stage_seconds_sum{stage="commit"} 0.5',
+        'modelmeta_index_stage_seconds_count{stage="commit"} 1',
+        'modelmeta_index_stage_max_seconds{stage="commit"} 0.5',
+        "modelmeta_index_files_total 1",
+        "modelmeta_index_files_per_second 0.5",
+    ]:
+        assert line in lines
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "timings.json",
+        "timings.prom",
+    ]
+
+
+def test_to_prometheus_labels(clock):
+    timings = StageTimings(clock=clock)
+    timings.add("commit", 0.5)
+    timings.add_file("missing.nc")
+    lines = timings.to_prometheus(labels={"worker": "1"}).splitlines()
+    for line in [
+        'modelmeta_index_stage_seconds{worker="1",stage="commit",quantile="0.5"} 0.5',
+        'modelmeta_index_stage_max_seconds{worker="1",stage="commit"} 0.5',
+        'modelmeta_index_files_total{worker="1"} 1',
+    ]:
+        assert line in lines
@@ -0,0 +1,37 @@
+"""Test race-free insertion of dimension records."""
+
+from modelmeta import Emission, Model, Station
+
+from mm_cataloguer.upsert import insert_ignoring_conflicts, insert_or_find
+
+
+def test_insert_or_find(test_session_with_empty_db):
+    sesh = test_session_with_empty_db
+    values = {"short_name": "CanESM2", "type": "GCM", "organization": "CCCma"}
+    model = insert_or_find(sesh, Model, values, ["short_name"])
+    assert model.id is not None
+    assert model.organization == "CCCma"
+
+    # Same key: the existing record is found, not inserted or updated
+    other_values = dict(values, organization="Other")
+    assert insert_or_find(sesh, Model, other_values, ["short_name"]) is model
+    assert sesh.query(Model).count() == 1
+    assert model.organization == "CCCma"
+
+    other = insert_or_find(sesh, Emission, {"short_name": "rcp85"}, ["short_name"])
+    assert sesh.get(Emission, other.id) is other
+
+
+def test_insert_ignoring_conflicts(test_session_with_empty_db):
+    sesh = test_session_with_empty_db
+    key = ["name", "x", "x_units", "y", "y_units"]
+
+    def row(name):
+        return {"name": name, "x": 1.5, "x_units": "m", "y": 2.5, "y_units": "m"}
+
+    assert insert_ignoring_conflicts(sesh, Station.__table__, [row("a")], key) == 1
+    insert_ignoring_conflicts(
+        sesh, Station.__table__, [row("a"), row("b"), row("c")], key
+    )
+    names = [name for name, in sesh.query(Station.name).order_by(Station.name)]
+    assert names == ["a", "b", "c"]
@@ -0,0 +1,203 @@
+"""Test bounded-memory computation of variable ranges."""
+
+import itertools
+import json
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from mm_cataloguer.var_range import (
+    attribute_range,
+    chunked_var_range,
+    sidecar_range,
+    slabs,
+)
+
+
+@pytest.mark.parametrize(
+    "shape, chunk_shape, element_bytes, memory_budget",
+    [
+        ((), None, 4, 1),
+        ((10,), None, 4, 12),
+        ((10, 3, 4), None, 4, 100),
+        ((10, 3, 4), (4, 3, 4), 4, 200),
+        ((10, 3, 4), (4, 3, 4), 4, 1000),
+        ((5, 7, 9), (1, 7, 9), 8, 30),
+    ],
+)
+def test_slabs(shape, chunk_shape, element_bytes, memory_budget):
+    # Slabs cover every element exactly once, within the memory budget
+    count = np.zeros(shape, dtype=int)
+    for index in slabs(shape, chunk_shape, element_bytes, memory_budget):
+        count[index] += 1
+        assert count[index].size * element_bytes <= max(memory_budget, element_bytes)
+    assert np.all(count == 1)
+
+
+@pytest.mark.parametrize(
+    "shape, chunk_shape, element_bytes, memory_budget",
+    [
+        # Time-chunked: one slab of whole time steps, many time steps per slab
+        ((10, 30, 40), (1, 30, 40), 4, 3 * 30 * 40 * 4),
+        # Chunked on every axis, a time step larger than the budget
+        ((10, 30, 40), (5, 10, 10), 4, 2 * 5 * 10 * 10 * 4),
+        ((10, 30, 40), (5, 10, 10), 4, 7 * 5 * 10 * 10 * 4),
+        ((10, 30, 40), (5, 10, 10), 4, 10**9),
+        # Chunks that do not divide the array, or are larger than it
+        ((11, 31, 41), (4, 8, 16), 8, 5 * 4 * 8 * 16 * 8),
+        ((3, 30, 40), (16, 8, 8), 4, 4 * 3 * 8 * 8 * 4),
+    ],
+)
+def test_slabs_read_each_chunk_once(shape, chunk_shape, element_bytes, memory_budget):
+    # Slabs are made of whole chunks: each chunk is read by exactly one slab
+    clamped = tuple(min(c, s) for c, s in zip(chunk_shape, shape))
+    chunk_grid = tuple(-(-s // c) for s, c in zip(shape, clamped))
+    reads = np.zeros(chunk_grid, dtype=int)
+    for index in slabs(shape, chunk_shape, element_bytes, memory_budget):
+        assert np.zeros(shape)[index].size * element_bytes <= memory_budget
+        for i, size, chunk_size in zip(index, shape, clamped):
+            assert i.start % chunk_size == 0
+            assert i.stop % chunk_size == 0 or i.stop == size
+        reads[
+            tuple(
+                slice(i.start // chunk_size, -(-i.stop // chunk_size))
+                for i, chunk_size in zip(index, clamped)
+            )
+        ] += 1
+    assert np.all(reads == 1)
+
+
+def test_slabs_chunk_larger_than_budget():
+    # A chunk larger than the budget is read in parts, one chunk at a time
+    shape, chunk_shape = (4, 6, 8), (2, 3, 4)
+    chunk_of = []
+    for index in slabs(shape, chunk_shape, 4, 4 * 3 * 4):
+        # Each part lies within one chunk
+        assert all(
+            i.start // c == (i.stop - 1) // c for i, c in zip(index, chunk_shape)
+        )
+        chunk_of.append(tuple(i.start // c for i, c in zip(index, chunk_shape)))
+    # Parts of the same chunk are consecutive
+    assert len(set(chunk_of)) == len(list(itertools.groupby(chunk_of)))
+
+
+def test_chunked_var_range_tiny(tiny_any_dataset):
+    # Same result as reading the whole variable, with slabs of one element up
+    for var_name in tiny_any_dataset.dependent_varnames():
+        variable = tiny_any_dataset.variables[var_name]
+        expected = tiny_any_dataset.var_range(var_name)
+        for memory_budget in (1, 1000, 10**9):
+            assert chunked_var_range(variable, memory_budget=memory_budget) == expected
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+@pytest.mark.parametrize("memory_budget", [1, 100, 10**9])
+def test_chunked_var_range_masked(tmp_path, threads, memory_budget):
+    values = np.arange(6 * 5 * 4, dtype=np.float32).reshape((6, 5, 4)) - 50
+    values[0, 0, 0] = -999  # _FillValue
+    values[5, 4, 3] = 1e20  # missing_value
+    values[2, 2, 2] = np.nan
+
+    filepath = str(tmp_path / "masked.nc")
+    with Dataset(filepath, "w") as dataset:
+        for name, size in zip("tyx", values.shape):
+            dataset.createDimension(name, size)
+        variable = dataset.createVariable(
+            "var", "f4", ("t", "y", "x"), fill_value=-999, chunksizes=(2, 5, 4)
+        )
+        variable.missing_value = np.float32(1e20)
+        variable.set_auto_mask(False)
+        variable[:] = values
+
+    with Dataset(filepath) as dataset:
+        variable = dataset.variables["var"]
+        whole = np.ma.masked_invalid(variable[:])
+        expected = (whole.min(), whole.max())
+        assert expected == (-49, 6 * 5 * 4 - 52)
+        assert (
+            chunked_var_range(variable, memory_budget=memory_budget, threads=threads)
+            == expected
+        )
+
+
+def test_chunked_var_range_no_valid_values(tmp_path):
+    filepath = str(tmp_path / "empty.nc")
+    with Dataset(filepath, "w") as dataset:
+        dataset.createDimension("t", 3)
+        dataset.createVariable("var", "f4", ("t",), fill_value=-999)
+
+    with Dataset(filepath) as dataset:
+        assert chunked_var_range(dataset.variables["var"]) is None
+
+
+@pytest.mark.parametrize(
+    "attributes, use_valid_range, expected",
+    [
+        ({}, True, None),
+        ({"actual_range": [1.5, 9.5]}, False, (1.5, 9.5, "actual_range")),
+        (
+            {"actual_range": [1.5, 9.5], "valid_range": [0, 100]},
+            True,
+            (1.5, 9.5, "actual_range"),
+        ),
+        ({"valid_range": [0, 100]}, False, None),
+        ({"valid_range": [0, 100]}, True, (0, 100, "valid_range")),
+        (
+            {"valid_min": 0, "valid_max": 100},
+            True,
+            (0, 100, "valid_min_max"),
+        ),
+        ({"valid_min": 0}, True, None),
+        # Valid range attributes apply to packed values
+        (
+            {"valid_range": [0, 100], "scale_factor": 0.5, "add_offset": 10},
+            True,
+            (10, 60, "valid_range"),
+        ),
+    ],
+)
+def test_attribute_range(tmp_path, attributes, use_valid_range, expected):
+    filepath = str(tmp_path / "attributes.nc")
+    with Dataset(filepath, "w") as dataset:
+        dataset.createDimension("t", 3)
+        variable = dataset.createVariable("var", "f4", ("t",))
+        for name, value in attributes.items():
+            variable.setncattr(name, value)
+
+    with Dataset(filepath) as dataset:
+        variable = dataset.variables["var"]
+        assert attribute_range(variable, use_valid_range=use_valid_range) == expected
+
+
+def test_sidecar_range(tmp_path):
+    filepath = str(tmp_path / "data.nc")
+    assert sidecar_range(filepath, "tasmax") is None
+
+    with open(filepath + ".stats.json", "w") as sidecar_file:
+        json.dump({"tasmax": {"min": -40.5, "max": 45.25}}, sidecar_file)
+    assert sidecar_range(filepath, "tasmax") == (-40.5, 45.25)
+    assert sidecar_range(filepath, "tasmin") is None
+    assert sidecar_range(filepath, "tasmax", suffix=".other.json") is None
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        '{"tasmax": {"min": null, "max": 3}}',
+        '{"tasmax": {"min": "-40.5", "max": 45.25}}',
+        '{"tasmax": {"min": true, "max": 45.25}}',
+        '{"tasmax": {"min": NaN, "max": 45.25}}',
+        '{"tasmax": {"min": 45.25, "max": -40.5}}',
+        '{"tasmax": [-40.5, 45.25]}',
+        '{"tasmax": {"min": -40.5, "max": 45.25}',
+        "",
+    ],
+)
+def test_sidecar_range_invalid(tmp_path, caplog, contents):
+    # An invalid sidecar file is ignored, so that the data is read instead
+    filepath = str(tmp_path / "data.nc")
+    with open(filepath + ".stats.json", "w") as sidecar_file:
+        sidecar_file.write(contents)
+    assert sidecar_range(filepath, "tasmax") is None
+    assert "sidecar statistics file" in caplog.text
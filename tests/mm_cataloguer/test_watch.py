@@ -0,0 +1,161 @@
+"""Test detection of new and modified files for continuous indexing."""
+
+import json
+import os
+import time
+
+import pytest
+
+from mm_cataloguer.watch import (
+    Debouncer,
+    InotifyWatcher,
+    PollingScanner,
+    load_inotify,
+    make_watcher,
+    watch,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_debouncer(tmp_path):
+    clock = Clock()
+    debouncer = Debouncer(10, clock=clock)
+    written, growing, deleted = [str(tmp_path / name) for name in "abc"]
+    for path in (written, growing, deleted):
+        with open(path, "w") as f:
+            f.write("x")
+
+    debouncer.add([written, growing, deleted])
+    assert debouncer.seconds_to_next() == 10
+    clock.now = 5
+    assert debouncer.ready() == []
+
+    # Changes while a file is held restart its settling period
+    with open(growing, "a") as f:
+        f.write("more")
+    os.remove(deleted)
+    clock.now = 10
+    assert debouncer.ready() == [written]
+    assert len(debouncer) == 1
+    assert debouncer.seconds_to_next() == 10
+
+    clock.now = 20
+    assert debouncer.ready() == [growing]
+    assert debouncer.seconds_to_next() is None
+
+
+def write(path, content="x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(content)
+
+
+def test_polling_scanner(tmp_path):
+    write(str(tmp_path / "old.nc"))
+    write(str(tmp_path / "same.nc"))
+    scanner = PollingScanner([str(tmp_path)], poll_seconds=0, exclude=["*.tmp.nc"])
+    assert sorted(scanner.existing()) == [
+        str(tmp_path / "old.nc"),
+        str(tmp_path / "same.nc"),
+    ]
+
+    write(str(tmp_path / "old.nc"), "changed")
+    write(str(tmp_path / "sub" / "new.nc"))
+    write(str(tmp_path / "sub" / "new.tmp.nc"))
+    assert sorted(scanner.changes()) == [
+        str(tmp_path / "old.nc"),
+        str(tmp_path / "sub" / "new.nc"),
+    ]
+    assert scanner.changes() == []
+
+
+def test_polling_scanner_timeout(tmp_path):
+    scanner = PollingScanner([str(tmp_path)], poll_seconds=3600)
+    write(str(tmp_path / "new.nc"))
+    assert scanner.changes(timeout=0) == []
+
+
+@pytest.mark.skipif(load_inotify() is None, reason="inotify not available")
+def test_inotify_watcher(tmp_path):
+    write(str(tmp_path / "old" / "old.nc"))
+    watcher = InotifyWatcher(
+        [str(tmp_path)], include=["*.nc"], exclude=["tmp"], follow_symlinks=False
+    )
+    try:
+        assert sorted(watcher.directories.values()) == [
+            str(tmp_path),
+            str(tmp_path / "old"),
+        ]
+        assert watcher.changes(timeout=0) == []
+
+        write(str(tmp_path / "old" / "old.nc"), "changed")
+        write(str(tmp_path / "notes.txt"))
+        write(str(tmp_path / "tmp" / "ignored.nc"))
+        # Files in a new directory are found even if written before it is
+        # watched
+        write(str(tmp_path / "new" / "deeper" / "new.nc"))
+        assert sorted(watcher.changes(timeout=1)) == [
+            str(tmp_path / "new" / "deeper" / "new.nc"),
+            str(tmp_path / "old" / "old.nc"),
+        ]
+
+        write(str(tmp_path / "new" / "deeper" / "later.nc"))
+        assert watcher.changes(timeout=1) == [
+            str(tmp_path / "new" / "deeper" / "later.nc")
+        ]
+    finally:
+        watcher.close()
+
+
+def test_make_watcher(tmp_path):
+    watcher = make_watcher([str(tmp_path)], use_inotify=False, include=["*.nc"])
+    assert isinstance(watcher, PollingScanner)
+
+
+def test_watch_reports_when_idle(monkeypatch, tmp_path):
+    # An idle watcher still writes its report every report_seconds, and once
+    # more when it is interrupted
+    report_seconds = 0.05
+    json_path = str(tmp_path / "timings.json")
+    timeouts = []
+    reported = []
+
+    class IdleWatcher:
+        def existing(self):
+            return []
+
+        def changes(self, timeout=None):
+            timeouts.append(timeout)
+            reported.append(os.path.exists(json_path))
+            if len(timeouts) == 4:
+                os.remove(json_path)
+                raise KeyboardInterrupt
+            time.sleep(timeout)
+            return []
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(
+        "mm_cataloguer.watch.make_watcher", lambda *args, **kwargs: IdleWatcher()
+    )
+    with pytest.raises(KeyboardInterrupt):
+        watch(
+            [str(tmp_path)],
+            "sqlite://",
+            timings_json=json_path,
+            report_seconds=report_seconds,
+        )
+    assert all(
+        timeout is not None and timeout <= report_seconds for timeout in timeouts
+    )
+    assert reported[-1]
+    with open(json_path) as file:
+        assert json.load(file)["files"] == 0
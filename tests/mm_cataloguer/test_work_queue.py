@@ -0,0 +1,162 @@
+"""Test the queue of files to index shared by several workers."""
+
+import os
+
+import pytest
+
+from modelmeta import DataFile, IndexJob
+from mm_cataloguer.work_queue import (
+    claim_jobs,
+    enqueue,
+    finish_jobs,
+    queue_status,
+    retry_delay,
+    work,
+    worker_report_path,
+)
+from tests.test_helpers import resource_filename
+
+
+def test_retry_delay():
+    assert [retry_delay(attempts, 10, 50) for attempts in [1, 2, 3, 4]] == [
+        10,
+        20,
+        40,
+        50,
+    ]
+
+
+def test_worker_report_path():
+    assert worker_report_path("/reports/timings.prom", 2) == "/reports/timings-2.prom"
+    assert worker_report_path(None, 2) is None
+
+
+def test_work_reports_when_interrupted(monkeypatch, tmp_path):
+    # A waiting worker reports periodically, and once more when interrupted
+    json_path = str(tmp_path / "timings.json")
+    reported = []
+
+    def claim_jobs(sesh, worker, **kwargs):
+        reported.append(os.path.exists(json_path))
+        if len(reported) == 3:
+            os.remove(json_path)
+            raise KeyboardInterrupt
+        return []
+
+    monkeypatch.setattr("mm_cataloguer.work_queue.claim_jobs", claim_jobs)
+    with pytest.raises(KeyboardInterrupt):
+        work(
+            "sqlite://",
+            wait=True,
+            poll_seconds=0.01,
+            report_seconds=0.01,
+            timings_json=json_path,
+        )
+    assert reported[-1]
+    assert os.path.exists(json_path)
+
+
+def test_enqueue(test_session_with_empty_db):
+    sesh = test_session_with_empty_db
+    assert enqueue(sesh, ["/data/a.nc", "/data/b.nc", "/data/a.nc"]) == 2
+    enqueue(sesh, ["/data/a.nc"])
+    assert queue_status(sesh) == {"pending": 2}
+
+    # A finished job is queued again only when requeued
+    jobs = claim_jobs(sesh, "worker", claim_size=1)
+    finish_jobs(sesh, jobs, [None], "worker", max_attempts=1)
+    assert queue_status(sesh) == {"pending": 1, "failed": 1}
+    enqueue(sesh, ["/data/a.nc"])
+    assert queue_status(sesh) == {"pending": 1, "failed": 1}
+    enqueue(sesh, ["/data/a.nc"], requeue=True)
+    assert queue_status(sesh) == {"pending": 2}
+
+
+def test_claim_and_finish(test_session_with_empty_db):
+    sesh = test_session_with_empty_db
+    enqueue(sesh, ["/data/a.nc", "/data/b.nc", "/data/c.nc"])
+
+    jobs = claim_jobs(sesh, "worker", claim_size=2)
+    assert [(job.filename, job.attempts) for job in jobs] == [
+        ("/data/a.nc", 1),
+        ("/data/b.nc", 1),
+    ]
+    assert queue_status(sesh) == {"claimed": 2, "pending": 1}
+
+    # A failed job is retried only after its retry delay
+    finish_jobs(
+        sesh,
+        jobs,
+        [None, None],
+        "worker",
+        max_attempts=2,
+        errors={"/data/a.nc": "OSError: cannot read file"},
+    )
+    errors = dict(sesh.query(IndexJob.filename, IndexJob.error).filter_by(attempts=1))
+    assert (
+        errors["/data/a.nc"]
+        == "Not indexed by worker worker: OSError: cannot read file"
+    )
+    assert errors["/data/b.nc"] == "Not indexed by worker worker"
+    assert [job.filename for job in claim_jobs(sesh, "worker")] == ["/data/c.nc"]
+    assert claim_jobs(sesh, "worker") == []
+
+    # An outcome recorded by a worker that no longer holds the job is ignored
+    jobs = claim_jobs(sesh, "worker", lease_seconds=0)
+    assert [job.filename for job in jobs] == ["/data/c.nc"]
+    finish_jobs(sesh, jobs, [None], "another worker")
+    assert sesh.query(IndexJob).filter_by(filename="/data/c.nc").one().status == (
+        "claimed"
+    )
+
+    # An abandoned job that has used all its attempts is failed
+    assert claim_jobs(sesh, "worker", lease_seconds=0, max_attempts=2) == []
+    job = sesh.query(IndexJob).filter_by(filename="/data/c.nc").one()
+    assert job.status == "failed"
+    assert job.error == "Not finished by worker worker"
+
+
+@pytest.mark.slow
+def test_claims_skip_locked_jobs(test_engine_fs, test_session_factory_fs):
+    session = test_session_factory_fs()
+    enqueue(session, ["/data/{}.nc".format(i) for i in range(4)])
+    session.commit()
+
+    # Concurrent claims take different jobs, without waiting for each other
+    first = test_session_factory_fs()
+    second = test_session_factory_fs()
+    first_jobs = claim_jobs(first, "first", claim_size=2)
+    second_jobs = claim_jobs(second, "second", claim_size=3)
+    assert [job.filename for job in first_jobs] == ["/data/0.nc", "/data/1.nc"]
+    assert [job.filename for job in second_jobs] == ["/data/2.nc", "/data/3.nc"]
+    first.commit()
+    second.commit()
+    assert queue_status(session) == {"claimed": 4}
+    for s in [session, first, second]:
+        s.close()
+
+
+@pytest.mark.slow
+def test_work(test_dsn_fs, test_session_factory_fs):
+    test_files = ["data/tiny_gcm.nc", "data/tiny_downscaled.nc"]
+    filenames = [resource_filename("modelmeta", f) for f in test_files] + [
+        "/missing.nc"
+    ]
+    session = test_session_factory_fs()
+    enqueue(session, filenames)
+    session.commit()
+
+    data_file_ids = work(test_dsn_fs, worker="worker", claim_size=2, max_attempts=1)
+    assert len(data_file_ids) == 3
+    assert all(data_file_ids[:2])
+    assert data_file_ids[2] is None
+
+    assert queue_status(session) == {"done": 2, "failed": 1}
+    for job in session.query(IndexJob).filter_by(status="done"):
+        assert job.claimed_by == "worker"
+        assert session.get(DataFile, job.data_file_id) is not None
+    # The error that stopped the file being indexed is recorded
+    failed = session.query(IndexJob).filter_by(status="failed").one()
+    assert failed.error.startswith("Not indexed by worker worker: ")
+    assert "/missing.nc" in failed.error
+    session.close()